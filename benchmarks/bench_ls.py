@@ -0,0 +1,43 @@
+"""Measure the round-trips and wall time of `ls` on a node with many children.
+
+Usage: python -m benchmarks.bench_ls [nb_children] [latency_ms]
+
+"""
+import sys
+import time
+
+from izk.runner import ZkCommandRunner
+from izk.utils import join_path
+from tests.fakezk import FakeZkClient
+
+
+def ls_one_request_per_child(zkcli, path):
+    """The former implementation of `ls`, performing one round-trip per child"""
+    return [
+        node for node in sorted(zkcli.get_children(path))
+        if zkcli.get_children(join_path(path, node))
+    ]
+
+
+def measure(label, zkcli, func, *args):
+    zkcli.reset_counters()
+    start = time.perf_counter()
+    func(*args)
+    elapsed = time.perf_counter() - start
+    print('%-12s requests=%-7d round-trips=%-7d wall=%.3fs' % (
+        label, zkcli.requests, zkcli.round_trips, elapsed))
+
+
+def main():
+    nb_children = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    latency = float(sys.argv[2]) / 1000 if len(sys.argv) > 2 else 0.5 / 1000
+    zkcli = FakeZkClient(latency=latency)
+    zkcli.seed_wide('/brokers/topics', nb_children)
+    runner = ZkCommandRunner(zkcli)
+    print('ls /brokers/topics: %d children, %.1fms latency' % (nb_children, latency * 1000))
+    measure('N+1', zkcli, ls_one_request_per_child, zkcli, '/brokers/topics')
+    measure('pipelined', zkcli, runner.ls, '/brokers/topics')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""Measure the number of commands validated and parsed per second.
+
+Usage: python -m benchmarks.bench_parse [nb_commands]
+
+"""
+import sys
+import time
+
+from izk.validation import parse_command
+
+COMMANDS = [
+    'get /config/services/api',
+    'ls /brokers/topics',
+    'stat /controller',
+    "set /config/flag '{\"enabled\": true}'",
+    'tree /config --depth 2 --max-nodes 1000',
+    'raw mntr --all',
+    'help ls',
+]
+
+
+def main():
+    nb_commands = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    commands = (COMMANDS * (nb_commands // len(COMMANDS) + 1))[:nb_commands]
+    start = time.perf_counter()
+    for command in commands:
+        parse_command(command)
+    elapsed = time.perf_counter() - start
+    print('parsed %d commands in %.3fs: %d commands/s' % (
+        nb_commands, elapsed, nb_commands / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+"""Measure the round-trips and wall time of `tree` on wide and deep hierarchies.
+
+Usage: python -m benchmarks.bench_tree [latency_ms]
+
+"""
+import io
+import sys
+import time
+import contextlib
+
+from izk.runner import ZkCommandRunner
+from tests.fakezk import FakeZkClient
+
+
+def main():
+    latency = float(sys.argv[1]) / 1000 if len(sys.argv) > 1 else 0.5 / 1000
+    zkcli = FakeZkClient(latency=latency)
+    zkcli.seed_wide('/wide', 20000)
+    zkcli.seed_deep('/deep', depth=4, width=12)
+    runner = ZkCommandRunner(zkcli)
+    for path in ('/wide', '/deep'):
+        zkcli.reset_counters()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            runner.tree(path)
+        elapsed = time.perf_counter() - start
+        print('tree %-6s requests=%-7d round-trips=%-7d wall=%.3fs' % (
+            path, zkcli.requests, zkcli.round_trips, elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,234 @@
+"""Run all the benchmarks against the in-memory zookeeper stand-in, and store their results.
+
+Usage: python -m benchmarks.suite [case ...] [--latency MS] [--repeat N]
+                                  [--save [FILE]] [--compare FILE] [--threshold RATIO]
+
+Each case seeds a fresh stand-in with a synthetic tree, and measures the
+number of requests, round-trips and the wall time of a command, keeping the
+fastest of `repeat` runs. The request and round-trip counts don't depend on
+the machine, so any increase is reported as a regression, whereas the wall
+time is only reported when it exceeds the baseline by more than the
+threshold. The exit code is 1 if any regression was found.
+
+"""
+import argparse
+import collections
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from unittest import mock
+
+from prompt_toolkit.document import Document
+from pygments.styles import get_style_by_name
+
+from izk import __version__
+from izk.completion import ZkCompleter, PathCache
+from izk.dump import export_tree
+from izk.formatting import HIGHLIGHT_MAX_SIZE
+from izk.prompt import g, DEFAULT_COLOR_STYLE
+from izk.runner import ZkCommandRunner
+from tests.fakezk import FakeZkClient
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+
+# Size of the synthetic trees
+WIDE_CHILDREN = 20000
+DEEP_DEPTH, DEEP_WIDTH = 4, 12
+# JSON payloads below and above the size limit of the highlighting
+SMALL_JSON_PAYLOAD = 32 * 1024
+LARGE_JSON_PAYLOAD = 1024 * 1024
+
+Measure = collections.namedtuple('Measure', 'requests round_trips wall')
+
+
+def ls_wide(zkcli):
+    zkcli.seed_wide('/wide', WIDE_CHILDREN)
+    runner = ZkCommandRunner(zkcli)
+    return lambda: runner.ls('/wide')
+
+
+def tree_wide(zkcli):
+    zkcli.seed_wide('/wide', WIDE_CHILDREN)
+    runner = ZkCommandRunner(zkcli)
+    return lambda: runner.tree('/wide')
+
+
+def tree_deep(zkcli):
+    zkcli.seed_deep('/deep', depth=DEEP_DEPTH, width=DEEP_WIDTH)
+    runner = ZkCommandRunner(zkcli)
+    return lambda: runner.tree('/deep')
+
+
+def rmr_deep(zkcli):
+    zkcli.seed_deep('/deep', depth=DEEP_DEPTH, width=DEEP_WIDTH)
+    runner = ZkCommandRunner(zkcli)
+
+    def rmr():
+        with mock.patch('izk.runner.ask_for_confirmation', return_value=True):
+            runner.rmr('/deep')
+    return rmr
+
+
+def json_payload(size):
+    """Return a JSON list of objects, of about `size` bytes"""
+    item = '{"id": %d, "host": "db-%04d.example.com", "port": 5432, "tags": ["a", "b"]}'
+    nb_items = size // len(item % (0, 0))
+    return ('[%s]' % (', '.join(item % (i, i) for i in range(nb_items)))).encode('utf-8')
+
+
+def get_large(zkcli):
+    """Get a JSON payload highlighted with the default style, and one too large to be"""
+    assert SMALL_JSON_PAYLOAD < HIGHLIGHT_MAX_SIZE < LARGE_JSON_PAYLOAD
+    zkcli.seed('/small', json_payload(SMALL_JSON_PAYLOAD))
+    zkcli.seed('/large', json_payload(LARGE_JSON_PAYLOAD))
+    runner = ZkCommandRunner(zkcli)
+
+    def get():
+        g.style = get_style_by_name(DEFAULT_COLOR_STYLE)
+        try:
+            for _ in range(3):
+                runner.get('/small')
+                runner.get('/large')
+        finally:
+            g.style = None
+    return get
+
+
+def completion(zkcli):
+    """Type the path of a deep node character by character, completing at each key"""
+    zkcli.seed_deep('/deep', depth=DEEP_DEPTH, width=DEEP_WIDTH)
+    text = 'get /deep/node-3/node-7/node-11/node-5'
+
+    def complete():
+        cache = PathCache(zkcli)
+        for end in range(len('get ') + 1, len(text) + 1):
+            completer = ZkCompleter(zkcli, cache=cache)
+            for prefix in ('get', 'get '):
+                list(completer.get_completions(Document(prefix), None))
+            list(completer.get_completions(Document(text[:end]), None))
+    return complete
+
+
+def startup(zkcli):
+    """Import the shell in a new interpreter, as done when izk starts"""
+    command = [sys.executable, '-c', 'import izk.prompt']
+    return lambda: subprocess.run(command, check=True)
+
+
+def startup_eval(zkcli):
+    """Run `izk --eval` in a new interpreter, on a dump file not to depend on a server"""
+    zkcli.seed('/config', b'{"enabled": true}')
+    dump = tempfile.NamedTemporaryFile(suffix='.izk')
+    export_tree(zkcli, '/', dump)
+    dump.flush()
+
+    def run_eval():
+        subprocess.run([
+            sys.executable, '-c', 'from izk.prompt import main; main()',
+            '--dump', dump.name, '--eval', 'get /config',
+        ], check=True, stdout=subprocess.DEVNULL)
+    return run_eval
+
+
+CASES = collections.OrderedDict((case.__name__, case) for case in (
+    ls_wide, tree_wide, tree_deep, rmr_deep, get_large, completion, startup, startup_eval))
+
+
+def run_case(case, latency, repeat):
+    """Return the Measure of the fastest of `repeat` runs of a case"""
+    measures = []
+    for _ in range(repeat):
+        zkcli = FakeZkClient(latency=latency)
+        func = case(zkcli)
+        zkcli.reset_counters()
+        start = time.perf_counter()
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output), contextlib.redirect_stderr(output):
+            func()
+        elapsed = time.perf_counter() - start
+        measures.append(Measure(zkcli.requests, zkcli.round_trips, elapsed))
+    return min(measures, key=lambda measure: measure.wall)
+
+
+def compare(measure, baseline, threshold):
+    """Return the regressions of a measure compared to its baseline"""
+    regressions = []
+    for field in ('requests', 'round_trips'):
+        value = getattr(measure, field)
+        if value > baseline[field]:
+            regressions.append('%s %d -> %d' % (field, baseline[field], value))
+    if measure.wall > baseline['wall'] * (1 + threshold):
+        regressions.append('wall %.3fs -> %.3fs' % (baseline['wall'], measure.wall))
+    return regressions
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Run the izk benchmarks against an in-memory zookeeper stand-in')
+    parser.add_argument(
+        'cases', nargs='*',
+        help='Cases to run, among %s. Default: all' % (', '.join(CASES)))
+    parser.add_argument(
+        '--latency', type=float, default=0.5, help='Injected latency, in ms. Default: 0.5')
+    parser.add_argument(
+        '--repeat', type=int, default=3, help='Number of runs of each case. Default: 3')
+    parser.add_argument(
+        '--save', nargs='?', const=os.path.join(RESULTS_DIR, '%s.json' % (__version__)),
+        help='Store the results in a JSON file. Default: results/<version>.json')
+    parser.add_argument('--compare', help='Compare the results to those of a JSON file')
+    parser.add_argument(
+        '--threshold', type=float, default=0.2,
+        help='Wall time increase reported as a regression. Default: 0.2')
+    args = parser.parse_args()
+    for case in args.cases:
+        if case not in CASES:
+            parser.error('Unknown case %s' % (case))
+    return args
+
+
+def main():
+    args = parse_args()
+    g.style = None  # the output is discarded, and only colorized by get_large
+    latency = args.latency / 1000
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            stored = json.load(f)
+        baseline = stored['results']
+        print('Comparing to izk %s, %.1fms latency' % (stored['izk'], stored['latency_ms']))
+    print('izk %s, python %s, %.1fms latency' % (
+        __version__, platform.python_version(), args.latency))
+
+    results = collections.OrderedDict()
+    nb_regressions = 0
+    for name in args.cases or CASES:
+        measure = run_case(CASES[name], latency, args.repeat)
+        results[name] = measure._asdict()
+        line = '%-12s requests=%-7d round-trips=%-7d wall=%.3fs' % (name, *measure)
+        if name in baseline:
+            regressions = compare(measure, baseline[name], args.threshold)
+            nb_regressions += bool(regressions)
+            line += '  REGRESSION: %s' % (', '.join(regressions)) if regressions else '  ok'
+        print(line)
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump({
+                'izk': __version__,
+                'python': platform.python_version(),
+                'latency_ms': args.latency,
+                'results': results,
+            }, f, indent=2)
+        print('Results stored in %s' % (args.save))
+    sys.exit(1 if nb_regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
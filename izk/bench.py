@@ -0,0 +1,154 @@
+import collections
+import os
+import random
+import time
+
+from kazoo.exceptions import KazooException, NodeExistsError, NoNodeError
+
+from .latency import LatencyHistogram, format_histogram
+from .pipeline import apply_batched, delete_recursive
+from .utils import join_path
+
+OPERATIONS = ('read', 'write', 'create', 'delete')
+
+DEFAULT_BENCH_PATH = '/izk-bench'
+DEFAULT_MIX = 'read=80,write=20'
+
+BenchmarkResult = collections.namedtuple('BenchmarkResult', 'elapsed histograms errors')
+
+
+def parse_mix(mix):
+    """Return the {operation: weight} dict of a mix such as 'read=80,write=20'"""
+    weights = collections.OrderedDict()
+    for item in mix.split(','):
+        operation, _, weight = item.partition('=')
+        if operation not in OPERATIONS:
+            raise ValueError('Unknown operation %s' % (operation))
+        weights[operation] = int(weight)
+    if not any(weights.values()):
+        raise ValueError('The operation mix %s has no weight' % (mix))
+    return weights
+
+
+class Benchmark:
+    """Load generator sending a mix of operations on the nodes of a scratch path.
+
+    The scratch path must not exist: it is created, seeded with `nodes` nodes
+    holding `size` bytes each, and deleted with all its nodes once the
+    benchmark is over, whatever happens. Reads and writes target the seeded
+    nodes, deletes remove the nodes created by the benchmark, and fall back
+    to creating one when there is none left. Operations are drawn at random
+    from the weighted mix, with a fixed seed for reproducible runs, and sent
+    with at most `concurrency` requests in flight.
+
+    """
+
+    def __init__(
+        self, zkcli, path=DEFAULT_BENCH_PATH, mix=DEFAULT_MIX, size=128, nodes=100,
+        concurrency=32, seed=0
+    ):
+        self.zkcli = zkcli
+        self.path = path
+        self.weights = parse_mix(mix)
+        if nodes < 1 and (self.weights.get('read') or self.weights.get('write')):
+            raise ValueError('Reads and writes need at least 1 node to target')
+        self.payload = os.urandom(size)
+        self.nodes = nodes
+        self.concurrency = concurrency
+        self.random = random.Random(seed)
+        self._created = collections.deque()
+        self._nb_created = 0
+
+    def _key(self, index):
+        return join_path(self.path, 'node-%06d' % (index))
+
+    def check(self):
+        """Make sure that the scratch path doesn't exist, not to delete existing nodes"""
+        if self.zkcli.exists(self.path) is not None:
+            raise NodeExistsError(
+                '%s already exists: benchmarks need a scratch path' % (self.path))
+
+    def setup(self):
+        self.zkcli.create(self.path, makepath=True)
+        apply_batched(
+            self.zkcli,
+            (('create', self._key(index), self.payload) for index in range(self.nodes)))
+
+    def cleanup(self):
+        try:
+            delete_recursive(self.zkcli, self.path)
+        except NoNodeError:
+            pass
+
+    def _send(self, operation):
+        """Send the request of an operation, and return the operation actually sent"""
+        if operation == 'delete' and not self._created:
+            operation = 'create'
+        if operation == 'read':
+            key = self._key(self.random.randrange(self.nodes))
+            return operation, self.zkcli.get_async(key)
+        if operation == 'write':
+            return operation, self.zkcli.set_async(
+                self._key(self.random.randrange(self.nodes)), self.payload)
+        if operation == 'create':
+            self._nb_created += 1
+            path = join_path(self.path, 'created-%08d' % (self._nb_created))
+            self._created.append(path)
+            return operation, self.zkcli.create_async(path, self.payload)
+        return operation, self.zkcli.delete_async(self._created.popleft())
+
+    def run(self, requests):
+        """Send `requests` operations, and return a BenchmarkResult"""
+        histograms = collections.OrderedDict(
+            (operation, LatencyHistogram()) for operation in OPERATIONS)
+        errors = collections.Counter()
+        in_flight = collections.deque()
+        operations = self.random.choices(
+            list(self.weights), weights=list(self.weights.values()), k=requests)
+
+        def resolve():
+            sent_at, operation, async_result = in_flight.popleft()
+            try:
+                async_result.get()
+            except KazooException as exc:
+                errors[exc.__class__.__name__] += 1
+            histograms[operation].record(time.perf_counter() - sent_at)
+
+        started_at = time.perf_counter()
+        for operation in operations:
+            sent_at = time.perf_counter()
+            in_flight.append((sent_at, *self._send(operation)))
+            if len(in_flight) >= self.concurrency:
+                resolve()
+        while in_flight:
+            resolve()
+        elapsed = time.perf_counter() - started_at
+        for operation in [name for name, histogram in histograms.items() if not histogram]:
+            del histograms[operation]
+        return BenchmarkResult(elapsed, histograms, errors)
+
+
+def run_benchmark(zkcli, requests=1000, **options):
+    """Run a Benchmark, always deleting its scratch path afterwards"""
+    benchmark = Benchmark(zkcli, **options)
+    benchmark.check()
+    try:
+        benchmark.setup()
+        return benchmark.run(requests)
+    finally:
+        benchmark.cleanup()
+
+
+def format_result(result):
+    """Return the lines of a benchmark report: throughput and latency of each operation"""
+    total = sum(histogram.count for histogram in result.histograms.values())
+    lines = ['%d requests in %.2fs: %.0f req/s' % (
+        total, result.elapsed, total / result.elapsed if result.elapsed else 0)]
+    for operation, histogram in result.histograms.items():
+        lines.append('%-7s %.0f req/s %s' % (
+            operation, histogram.count / result.elapsed if result.elapsed else 0,
+            format_histogram(histogram)))
+    if result.errors:
+        lines.append('errors: %s' % (', '.join(
+            '%s=%d' % (name, count) for name, count in sorted(result.errors.items()))))
+    return lines
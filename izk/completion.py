@@ -1,18 +1,184 @@
+import collections
+import functools
+import threading
+
 import kazoo
+from kazoo.handlers.threading import KazooTimeoutError
+from kazoo.protocol.states import EventType, KazooState
 
 from prompt_toolkit.completion import Completer, Completion
 
-from .lexer import KEYWORDS, ZK_FOUR_LETTER_WORDS
+from .grammar import KEYWORDS, ZK_FOUR_LETTER_WORDS
+from .utils import join_path
+
+# Bounds of the completion cache, shared by all the commands of a session
+DEFAULT_CACHE_MAX_ENTRIES = 10000
+DEFAULT_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+# Approximate memory overhead of a cached child name, on top of its length
+CHILD_NAME_OVERHEAD = 56
+
+# Number of seconds to wait for children on a cache miss, not to freeze the prompt
+FETCH_TIMEOUT = 0.5
+
+
+class PathCache:
+    """LRU cache of znode children, shared by all the completers of a session.
+
+    Each cached entry is kept up to date by a child watch, and discarded as
+    soon as the children of the node change. The cache is bounded both in
+    number of entries and in (approximate) memory.
+
+    As kazoo drops all the watches when the connection is lost, the whole
+    cache is then cleared.
+
+    kazoo runs the watch callbacks and the callbacks of the responses in
+    different threads, so a response may be stored after the watch set by
+    its request has fired. Each invalidation of a path thus increments its
+    generation, and a response is only stored if no invalidation happened
+    since its request was sent.
+
+    """
+
+    def __init__(
+        self, zkcli, max_entries=DEFAULT_CACHE_MAX_ENTRIES,
+        max_bytes=DEFAULT_CACHE_MAX_BYTES
+    ):
+        self.zkcli = zkcli
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = collections.OrderedDict()  # path -> (children, size)
+        self._generations = collections.Counter()  # path -> number of invalidations
+        self._epoch = 0  # number of times the whole cache was cleared
+        self._prefetching = set()
+        self._lock = threading.Lock()
+        zkcli.add_listener(self._on_state_change)
+
+    def __contains__(self, path):
+        with self._lock:
+            return self._lookup(path) is not None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _lookup(self, path):
+        entry = self._entries.get(path)
+        if entry is None:
+            return None
+        self._entries.move_to_end(path)
+        return entry[0]
+
+    def _discard(self, path):
+        entry = self._entries.pop(path, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+    def _generation(self, path):
+        return self._epoch, self._generations[path]
+
+    def _store(self, path, children, generation):
+        """Store the children of a path, unless invalidated since the `generation`"""
+        size = sum(len(child) + CHILD_NAME_OVERHEAD for child in children)
+        with self._lock:
+            if generation != self._generation(path):
+                return
+            self._discard(path)
+            self._entries[path] = (children, size)
+            self.size += size
+            while len(self._entries) > 1 and (
+                    len(self._entries) > self.max_entries or self.size > self.max_bytes):
+                self._discard(next(iter(self._entries)))
+
+    def _on_change(self, event):
+        """Watch callback, invalidating the entry of the node that changed"""
+        if event.type == EventType.NONE:
+            self.clear()  # the connection was lost, and all the watches with it
+        else:
+            self.invalidate(event.path)
+
+    def _on_state_change(self, state):
+        if state in (KazooState.SUSPENDED, KazooState.LOST):
+            self.clear()
+
+    def _on_exists(self, path, async_result):
+        try:
+            if async_result.get() is not None:
+                self.invalidate(path)  # created before the watch was set
+        except kazoo.exceptions.KazooException:
+            self.invalidate(path)
+
+    def _on_children(self, path, generation, async_result):
+        """Store the fetched children of a node, unless invalidated in the meantime"""
+        try:
+            children = sorted(async_result.get())
+        except kazoo.exceptions.NoNodeError:
+            # We may be typing a nonexistent path (for example with the 'create'
+            # command): get notified when it is created.
+            self.zkcli.exists_async(path, watch=self._on_change).rawlink(
+                functools.partial(self._on_exists, path))
+            children = []
+        except kazoo.exceptions.KazooException:
+            return
+        self._store(path, children, generation)
+
+    def _fetch_async(self, path):
+        with self._lock:
+            generation = self._generation(path)
+        async_result = self.zkcli.get_children_async(path, watch=self._on_change)
+        async_result.rawlink(functools.partial(self._on_children, path, generation))
+        return async_result
+
+    def invalidate(self, path):
+        with self._lock:
+            self._generations[path] += 1
+            self._discard(path)
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._generations.clear()
+            self._entries.clear()
+            self.size = 0
+
+    def get(self, path):
+        """Return the children of the argument path, fetching them on a cache miss.
+
+        If the children aren't received within FETCH_TIMEOUT, an empty list is
+        returned, and they are cached once received.
+
+        """
+        with self._lock:
+            children = self._lookup(path)
+        if children is not None:
+            return children
+        try:
+            return sorted(self._fetch_async(path).get(timeout=FETCH_TIMEOUT))
+        except (kazoo.exceptions.KazooException, KazooTimeoutError):
+            return []
+
+    def prefetch(self, path):
+        """Fetch the children of the argument path in the background, if not cached"""
+        with self._lock:
+            if self._lookup(path) is not None or path in self._prefetching:
+                return
+            self._prefetching.add(path)
+
+        def on_result(async_result):
+            with self._lock:
+                self._prefetching.discard(path)
+
+        self._fetch_async(path).rawlink(on_result)
 
 
 class ZkCompleter(Completer):
 
-    def __init__(self, zkcli, *args, **kwargs):
+    def __init__(self, zkcli, *args, cache=None, **kwargs):
         super().__init__(*args, **kwargs)
         self.zkcli = zkcli
         self.command = None
         self.prev_typed_word = None
-        self.cache = {}
+        self.cache = cache if cache is not None else PathCache(zkcli)
 
     def _completions(self, complete_from, word_before_cursor):
         completions = [cmd for cmd in complete_from if cmd.startswith(word_before_cursor)]
@@ -39,23 +205,21 @@ class ZkCompleter(Completer):
         else:
             # Autocomplete on the path of available znodes
             path = word_before_cursor
-            if path.startswith('/'):
+            # Requests sent while connecting would be queued, and block the prompt
+            if path.startswith('/') and self.zkcli.connected:
                 current_chroot = '/'.join(path.split('/')[:-1]).rstrip('/') or '/'
                 current_node = path.replace(current_chroot, '').lstrip('/')
 
-                if current_chroot not in self.cache:
-                    try:
-                        self.cache[current_chroot] = self.zkcli.get_children(current_chroot)
-                    except kazoo.exceptions.NoNodeError:
-                        # We may be typing a nonexistent path
-                        # (for example with the 'create' command)
-                        self.cache[current_chroot] = []
-
+                children = self.cache.get(current_chroot)
                 completions = [
                     '/%s' % (node)
-                    for node in self.cache[current_chroot]
+                    for node in children
                     if node.startswith(current_node)
                 ]
 
+                # The node under the cursor is likely to be completed next
+                if current_node in children:
+                    self.cache.prefetch(join_path(current_chroot, current_node))
+
                 for completion in completions:
                     yield Completion(completion, -(len(current_node) + 1))
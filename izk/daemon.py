@@ -0,0 +1,246 @@
+"""A local daemon running commands over a session kept open between calls.
+
+`izk --serve` listens on a Unix socket, and `izk --socket PATH --eval CMD`
+sends the command to it instead of opening a new zookeeper session. Each
+request and response is a JSON line: the client sends the command along with
+its options, and the daemon streams back the stdout and stderr output of the
+command as it is written, followed by its status.
+
+"""
+import contextlib
+import io
+import json
+import os
+import socket
+import socketserver
+import sys
+import tempfile
+import threading
+
+from .runner import ZkCommandRunner, UnauthorizedWrite
+from .validation import parse_command, CommandValidationError, UnknownCommand
+
+
+def default_socket_path():
+    """Return the path of the daemon socket of the current user"""
+    directory = os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir()
+    return os.path.join(directory, 'izk-%d.sock' % (os.getuid()))
+
+
+def unsupported_reason(command):
+    """Return why the daemon can't run the command, or None if it can.
+
+    Commands run one at a time, so a command starting an editor, or running
+    until interrupted, would block all the clients of the daemon.
+
+    """
+    try:
+        parsed = parse_command(command)
+    except (CommandValidationError, UnknownCommand):
+        return None  # reported when run
+    if parsed.name == 'edit' or (parsed.name == 'set' and len(parsed.args) < 2):
+        return 'it starts an editor'
+    if parsed.name in ('watch', 'top') and parsed.kwargs.get('count') is None:
+        return 'it runs until interrupted, without --count'
+    return None
+
+
+class ConnectionClient:
+    """Proxy of the daemon client, with the read-only mode of a single connection.
+
+    A connection can only switch to read-write mode if the daemon was started
+    with writes authorized.
+
+    """
+
+    def __init__(self, zkcli, writable, read_only=True):
+        self._zkcli = zkcli
+        self._writable = writable
+        self._read_only = read_only or not writable
+
+    def __getattr__(self, name):
+        return getattr(self._zkcli, name)
+
+    @property
+    def read_only(self):
+        return self._read_only
+
+    @read_only.setter
+    def read_only(self, value):
+        if not value and not self._writable:
+            raise UnauthorizedWrite('Write operations are not authorized by the izk daemon')
+        self._read_only = value
+
+
+class ClientDisconnected(Exception):
+    """Exception raised when the output of a command can't be sent to the client."""
+
+
+class _MessageStream(io.TextIOBase):
+    """Text stream sending everything written to it as JSON messages of the given kind."""
+
+    def __init__(self, send, kind):
+        self._send = send
+        self._kind = kind
+
+    def writable(self):
+        return True
+
+    def isatty(self):
+        return False
+
+    def write(self, text):
+        if text:
+            try:
+                self._send({self._kind: text})
+            except OSError as exc:
+                raise ClientDisconnected(exc)
+        return len(text)
+
+
+class CommandHandler(socketserver.StreamRequestHandler):
+    """Run the commands received on a connection, with a runner of its own.
+
+    Commands print their output to sys.stdout, which is process-wide, so the
+    commands of all the connections are run one at a time.
+
+    """
+
+    def send(self, message):
+        self.wfile.write(json.dumps(message).encode('utf-8') + b'\n')
+        self.wfile.flush()
+
+    def setup_connection(self, request):
+        from pygments.styles import get_style_by_name
+        from .prompt import g
+        style = request.get('style', 'none')
+        g.style = None if style == 'none' else get_style_by_name(style)
+        # There is no terminal to ask for confirmation
+        g.confirm = bool(request.get('yes'))
+        zkcli = ConnectionClient(
+            self.server.zkcli, self.server.writable, read_only=not request.get('write'))
+        return ZkCommandRunner(zkcli)
+
+    def run(self, runner, command):
+        """Run the command, streaming its output, and return whether it succeeded"""
+        from .prompt import run_cmd
+        stdout = _MessageStream(self.send, 'stdout')
+        stderr = _MessageStream(self.send, 'stderr')
+        reason = unsupported_reason(command)
+        if reason is not None:
+            message = '%r is not supported by the izk daemon, as %s' % (
+                command.strip(), reason)
+            print(message, file=stderr)
+            return False
+        with self.server.lock:
+            with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+                try:
+                    return run_cmd(runner, command, stderr=stderr)
+                except ClientDisconnected:
+                    raise
+                except Exception as exc:
+                    print('Error: %s' % (str(exc) or exc.__class__.__name__), file=stderr)
+                    return False
+
+    def handle(self):
+        runner = None
+        try:
+            for line in self.rfile:
+                request = json.loads(line.decode('utf-8'))
+                if runner is None:
+                    runner = self.setup_connection(request)
+                try:
+                    succeeded = self.run(runner, request['command'])
+                except KeyboardInterrupt:  # exit or quit
+                    self.send({'status': 0})
+                    return
+                self.send({'status': 0 if succeeded else 1})
+        except (ClientDisconnected, OSError, ValueError):
+            pass  # the client disconnected, or sent an invalid request
+
+
+class DaemonServer(socketserver.ThreadingUnixStreamServer):
+    """Unix socket server running the commands of its clients over a single session.
+
+    The socket is only accessible to the current user. Writes are only
+    authorized if `writable` is True, and requested by the client.
+
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, zkcli, writable=False):
+        self.socket_path = socket_path
+        self.zkcli = zkcli
+        self.writable = writable
+        self.lock = threading.Lock()
+        self._remove_stale_socket()
+        umask = os.umask(0o077)
+        try:
+            super().__init__(socket_path, CommandHandler)
+        finally:
+            os.umask(umask)
+
+    def _remove_stale_socket(self):
+        if not os.path.exists(self.socket_path):
+            return
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            try:
+                sock.connect(self.socket_path)
+            except OSError:
+                os.unlink(self.socket_path)  # left by a daemon that was killed
+            else:
+                raise OSError(
+                    'An izk daemon is already listening on %s' % (self.socket_path))
+
+    def server_close(self):
+        super().server_close()
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.socket_path)
+
+
+def serve(zkcli, socket_path, writable=False):  # pragma: no cover
+    """Run the commands sent to the socket until interrupted"""
+    server = DaemonServer(socket_path, zkcli, writable=writable)
+    print('Listening on %s' % (socket_path), file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def send_commands(
+    socket_path, commands, write=False, style='none', yes=False, on_error='stop',
+    stdout=None, stderr=None
+):
+    """Send the commands to the daemon, print their output, and return the failure count.
+
+    If `on_error` is 'stop', no command is sent after the first failure.
+
+    """
+    stdout, stderr = stdout or sys.stdout, stderr or sys.stderr
+    nb_failures = 0
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        responses = sock.makefile('rb')
+        for command in commands:
+            request = {'command': command, 'write': write, 'style': style, 'yes': yes}
+            sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+            for line in responses:
+                message = json.loads(line.decode('utf-8'))
+                if 'stdout' in message:
+                    stdout.write(message['stdout'])
+                elif 'stderr' in message:
+                    stderr.write(message['stderr'])
+                else:
+                    break
+            else:
+                raise ConnectionError('The izk daemon closed the connection')
+            stdout.flush()
+            if message['status']:
+                nb_failures += 1
+                if on_error == 'stop':
+                    break
+    return nb_failures
@@ -0,0 +1,229 @@
+import collections
+import difflib
+import posixpath
+import re
+
+from kazoo.exceptions import NodeExistsError, NoNodeError
+
+from .pipeline import pipelined, walk, apply_batched, DEFAULT_BATCH_SIZE
+from .utils import relocate, is_reserved
+
+# A path on another ensemble, such as zk://host1:2181,host2:2181/config
+ZK_LOCATION = re.compile(r'zk://(?P<hosts>[^/\s]+)(?P<path>/[^\s]*)')
+
+TreeDifference = collections.namedtuple('TreeDifference', 'path status data_a data_b')
+
+ADDED, REMOVED, CHANGED = 'added', 'removed', 'changed'
+
+
+def parse_location(location):
+    """Return the (hosts, path) of a location, hosts being None for a local path"""
+    m = ZK_LOCATION.fullmatch(location)
+    if m:
+        return m.group('hosts'), m.group('path')
+    return None, location
+
+
+def relative_key(path, root):
+    """Return the path components of a node below the root, sorting nodes depth-first"""
+    relative = path[len(root.rstrip('/')):].strip('/')
+    return tuple(relative.split('/')) if relative else ()
+
+
+def merge_walks(zkcli_a, path_a, zkcli_b, path_b, missing_ok=False):
+    """Yield (key, node_a, node_b) for each node of both subtrees, walked at the same time.
+
+    As both walks yield nodes sorted by path components, they are merged like
+    sorted lists, the node missing in either subtree being None. The walks
+    keep their requests in flight while the other one is consumed, so both
+    subtrees are fetched concurrently. If `missing_ok` is True, a missing
+    subtree root is handled as an empty subtree.
+
+    """
+    def walk_subtree(zkcli, path):
+        if missing_ok and zkcli.exists(path) is None:
+            return iter(())
+        return walk(zkcli, path)
+
+    walk_a, walk_b = walk_subtree(zkcli_a, path_a), walk_subtree(zkcli_b, path_b)
+    node_a, node_b = next(walk_a, None), next(walk_b, None)
+    while node_a is not None or node_b is not None:
+        key_a = relative_key(node_a.path, path_a) if node_a is not None else None
+        key_b = relative_key(node_b.path, path_b) if node_b is not None else None
+        if key_b is None or (key_a is not None and key_a < key_b):
+            yield key_a, node_a, None
+            node_a = next(walk_a, None)
+        elif key_a is None or key_b < key_a:
+            yield key_b, None, node_b
+            node_b = next(walk_b, None)
+        else:
+            yield key_a, node_a, node_b
+            node_a, node_b = next(walk_a, None), next(walk_b, None)
+
+
+class _NoRequest:
+    """Placeholder result of the items of a pipeline that don't need a request."""
+
+    def get(self):
+        return None
+
+
+class _PairResult:
+    """The async results of the same request sent to both ensembles."""
+
+    def __init__(self, result_a, result_b):
+        self.result_a = result_a
+        self.result_b = result_b
+
+    def get(self):
+        return self.result_a.get(), self.result_b.get()
+
+
+def diff_trees(zkcli_a, path_a, zkcli_b, path_b):
+    """Yield a TreeDifference for each node differing between both subtrees.
+
+    Nodes only present in one subtree are reported as added or removed,
+    without reporting their descendants. The data of the nodes present in
+    both subtrees is fetched from both ensembles through a bounded pipeline,
+    unless their stats show that neither has any data, and is compared as
+    bytes. Only the data of the differing nodes is returned.
+
+    """
+    # Descendants of a node only present in one subtree are not reported
+    missing_root = None
+
+    def reported_nodes():
+        nonlocal missing_root
+        for key, node_a, node_b in merge_walks(zkcli_a, path_a, zkcli_b, path_b):
+            path = '/' + '/'.join(key)
+            if node_a is not None and node_b is not None:
+                yield path, node_a, node_b
+                continue
+            if missing_root is not None and key[:len(missing_root)] == missing_root:
+                continue
+            missing_root = key
+            yield path, node_a, node_b
+
+    def fetch_data(item):
+        _, node_a, node_b = item
+        return _PairResult(zkcli_a.get_async(node_a.path), zkcli_b.get_async(node_b.path))
+
+    def to_compare():
+        for path, node_a, node_b in reported_nodes():
+            if node_b is None:
+                yield TreeDifference(path, REMOVED, None, None)
+            elif node_a is None:
+                yield TreeDifference(path, ADDED, None, None)
+            elif node_a.stat.dataLength or node_b.stat.dataLength:
+                yield path, node_a, node_b
+
+    # Differences that don't require fetching data go through the pipeline
+    # untouched, to keep the output in depth-first order.
+    def fetch(item):
+        return _NoRequest() if isinstance(item, TreeDifference) else fetch_data(item)
+
+    for item, result in pipelined(fetch, to_compare()):
+        if isinstance(item, TreeDifference):
+            yield item
+        elif result is not None:
+            (data_a, _), (data_b, _) = result
+            if data_a != data_b:
+                yield TreeDifference(item[0], CHANGED, data_a, data_b)
+
+
+def unified_diff(data_a, data_b, name_a, name_b):
+    """Return the lines of a unified diff between two node payloads"""
+    lines_a = (data_a or b'').decode('utf-8', 'replace').splitlines()
+    lines_b = (data_b or b'').decode('utf-8', 'replace').splitlines()
+    return difflib.unified_diff(lines_a, lines_b, name_a, name_b, lineterm='')
+
+
+def sync_operations(src_zkcli, src_path, dst_zkcli, dst_path, delete=False):
+    """Yield the operations making the destination subtree identical to the source subtree.
+
+    Both subtrees are walked concurrently, and the source data is fetched
+    through a bounded pipeline, along with the destination data when the
+    stats can't tell whether both differ. Only the missing nodes and the nodes
+    with different data yield a create or set_data operation, parents
+    before children. If `delete` is True, the destination nodes missing from
+    the source then yield delete operations, children before parents.
+    Ephemeral source nodes and nodes reserved by zookeeper are not synchronized.
+
+    """
+    extraneous = []
+
+    def fetch(item):
+        _, dst_node, src_node = item
+        # The destination data is only needed if the stats can't tell whether it differs
+        compare_data = (
+            dst_node is not None and src_node.stat.dataLength and
+            dst_node.stat.dataLength == src_node.stat.dataLength)
+        return _PairResult(
+            src_zkcli.get_async(src_node.path),
+            dst_zkcli.get_async(dst_node.path) if compare_data else _NoRequest())
+
+    def nodes():
+        merged = merge_walks(dst_zkcli, dst_path, src_zkcli, src_path, missing_ok=True)
+        for key, dst_node, src_node in merged:
+            relative_path = '/' + '/'.join(key)
+            path = relocate(relative_path, '/', dst_path)
+            if (is_reserved(path) or is_reserved(relocate(relative_path, '/', src_path)) or
+                    (src_node and src_node.stat.ephemeralOwner)):
+                continue
+            if src_node is None:
+                if delete:
+                    extraneous.append(path)
+                continue
+            yield path, dst_node, src_node
+
+    for (path, dst_node, src_node), result in pipelined(fetch, nodes()):
+        if result is None:
+            continue  # the source node was deleted in the meantime
+        (src_data, _), dst_result = result
+        src_data = src_data or b''
+        if dst_node is None:
+            yield ('create', path, src_data)
+        elif dst_result is None:
+            if dst_node.stat.dataLength != len(src_data):
+                yield ('set_data', path, src_data, -1)
+        elif dst_result[0] != src_data:
+            yield ('set_data', path, src_data, -1)
+    for path in reversed(extraneous):
+        yield ('delete', path)
+
+
+def sync_trees(
+    src_zkcli, src_path, dst_zkcli, dst_path, delete=False, batch_size=DEFAULT_BATCH_SIZE,
+    rate=None
+):
+    """Make the destination subtree identical to the source one, and return a write Counter.
+
+    The operations computed by sync_operations are applied in pipelined
+    multi() transactions on the destination, at most `rate` per second. The
+    destination nodes created or deleted in the meantime are respectively
+    overwritten and recreated, or ignored when they were to be deleted.
+
+    """
+    counts = collections.Counter()
+    names = {'create': 'created', 'set_data': 'updated', 'delete': 'deleted'}
+
+    def counted(operations):
+        for operation in operations:
+            counts[names[operation[0]]] += 1
+            yield operation
+
+    def on_error(operation, exc):
+        name, path = operation[:2]
+        if name == 'create' and isinstance(exc, NodeExistsError):
+            dst_zkcli.set(path, operation[2])
+        elif name == 'set_data' and isinstance(exc, NoNodeError):
+            dst_zkcli.create(path, operation[2])
+        elif name != 'delete' or not isinstance(exc, NoNodeError):
+            raise exc
+
+    if dst_path != '/':
+        dst_zkcli.ensure_path(posixpath.dirname(dst_path))
+    operations = sync_operations(src_zkcli, src_path, dst_zkcli, dst_path, delete=delete)
+    apply_batched(
+        dst_zkcli, counted(operations), batch_size=batch_size, rate=rate, on_error=on_error)
+    return counts
@@ -0,0 +1,428 @@
+"""Compact on-disk format for znode subtree dumps.
+
+A dump is made of blocks of records, each block being compressed separately,
+followed by a sparse index holding the offset and first path of each block:
+
+    MAGIC | codec name length (B) | codec name
+    block 0: compressed length (I) | compressed records
+    ...
+    block N
+    index: for each block, offset (Q) | nb records (I) | first path length (H) | first path
+    footer: index offset (Q) | nb blocks (I) | nb records (Q) | MAGIC
+
+Records are written in depth-first order, with children sorted by name,
+which means that they are sorted by path components. A single node can thus
+be found by bisecting the index, and decompressing a single block.
+
+Each record is made of a fixed-size header (see RECORD), followed by the path,
+the node data, and the names of its children, separated by newlines (which
+are forbidden in znode names).
+
+"""
+import bisect
+import collections
+import gzip
+import io
+import lzma
+import mmap
+import posixpath
+import struct
+
+from kazoo.exceptions import NodeExistsError, NoNodeError, BadVersionError
+from kazoo.protocol.states import ZnodeStat
+
+from .pipeline import pipelined, walk, apply_batched, ResolvedResult, DEFAULT_BATCH_SIZE
+from .utils import relocate, is_reserved
+
+MAGIC = b'IZKDUMP1'
+CODECS = {
+    'none': (bytes, bytes),
+    'gzip': (gzip.compress, gzip.decompress),
+    'lzma': (lzma.compress, lzma.decompress),
+}
+
+# path length, data length, children length, followed by the ZnodeStat fields
+RECORD = struct.Struct('>HII qqqqiiiqiiq')
+BLOCK_HEADER = struct.Struct('>I')
+INDEX_ENTRY = struct.Struct('>QIH')
+FOOTER = struct.Struct('>QIQ8s')
+
+# Data length of a node without any data
+NO_DATA = 0xFFFFFFFF
+
+# Size of the uncompressed records of a block
+BLOCK_SIZE = 256 * 1024
+
+# Number of decompressed blocks kept in memory when reading a dump
+BLOCK_CACHE_SIZE = 16
+
+DumpRecord = collections.namedtuple('DumpRecord', 'path data stat children')
+
+# What to do when importing a node that already exists
+CONFLICT_POLICIES = ('skip', 'overwrite', 'fail')
+
+
+class InvalidDump(ValueError):
+    """Exception raised when a file is not a valid izk dump."""
+
+
+def path_key(path):
+    """Return a key sorting paths in depth-first order"""
+    return tuple(path.rstrip('/').split('/'))
+
+
+def encode_record(path, data, stat, children):
+    path = path.encode('utf-8')
+    children = '\n'.join(children).encode('utf-8')
+    data_length = NO_DATA if data is None else len(data)
+    header = RECORD.pack(len(path), data_length, len(children), *stat)
+    return b''.join((header, path, data or b'', children))
+
+
+def decode_records(block):
+    """Yield the DumpRecord of an uncompressed block"""
+    offset = 0
+    while offset < len(block):
+        path_length, data_length, children_length, *stat = RECORD.unpack_from(block, offset)
+        offset += RECORD.size
+        path = block[offset:offset + path_length].decode('utf-8')
+        offset += path_length
+        data = None
+        if data_length != NO_DATA:
+            data = block[offset:offset + data_length]
+            offset += data_length
+        children = block[offset:offset + children_length].decode('utf-8')
+        children = children.split('\n') if children else []
+        offset += children_length
+        yield DumpRecord(path, data, ZnodeStat(*stat), children)
+
+
+class DumpWriter:
+    """Stream records to a dump file, with a memory usage bounded by the block size."""
+
+    def __init__(self, fileobj, codec='none'):
+        if codec not in CODECS:
+            raise ValueError('Unknown codec %r' % (codec))
+        self.fileobj = fileobj
+        self.compress, _ = CODECS[codec]
+        self.block = []
+        self.block_size = 0
+        self.block_first_path = None
+        self.index = []
+        self.nb_records = 0
+        codec = codec.encode('utf-8')
+        self.offset = fileobj.write(MAGIC + bytes([len(codec)]) + codec)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+
+    def write(self, path, data, stat, children):
+        if self.block_first_path is None:
+            self.block_first_path = path
+        record = encode_record(path, data, stat, children)
+        self.block.append(record)
+        self.block_size += len(record)
+        self.nb_records += 1
+        if self.block_size >= BLOCK_SIZE:
+            self._flush_block()
+
+    def _flush_block(self):
+        if not self.block:
+            return
+        payload = self.compress(b''.join(self.block))
+        self.index.append((self.offset, len(self.block), self.block_first_path))
+        self.offset += self.fileobj.write(BLOCK_HEADER.pack(len(payload)) + payload)
+        self.block, self.block_size, self.block_first_path = [], 0, None
+
+    def close(self):
+        self._flush_block()
+        index_offset = self.offset
+        for offset, nb_records, first_path in self.index:
+            first_path = first_path.encode('utf-8')
+            self.fileobj.write(INDEX_ENTRY.pack(offset, nb_records, len(first_path)))
+            self.fileobj.write(first_path)
+        self.fileobj.write(
+            FOOTER.pack(index_offset, len(self.index), self.nb_records, MAGIC))
+        self.fileobj.flush()
+
+
+class DumpReader:
+    """Read the records of a dump file, either sequentially or by path.
+
+    Files are memory-mapped, so that opening a dump only reads its header and
+    index, and looking a node up only pages in the block holding it. The
+    records of the last read blocks are kept in an LRU cache.
+
+    """
+
+    def __init__(self, fileobj, cache_size=BLOCK_CACHE_SIZE):
+        self.fileobj = fileobj
+        self.cache_size = cache_size
+        self._blocks = collections.OrderedDict()  # block number -> {path: record}
+        try:
+            self._buffer = mmap.mmap(fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, io.UnsupportedOperation, ValueError):
+            self._buffer = None  # not a file, or an empty one
+
+        header = self._read(0, len(MAGIC) + 1)
+        if len(header) != len(MAGIC) + 1 or not header.startswith(MAGIC):
+            raise InvalidDump('Not an izk dump')
+        codec = self._read(len(header), header[-1]).decode('utf-8')
+        if codec not in CODECS:
+            raise InvalidDump('Unknown codec %r' % (codec))
+        self.codec = codec
+        _, self.decompress = CODECS[codec]
+
+        self.file_size = self._size()
+        if self.file_size < len(header) + len(codec) + FOOTER.size:
+            raise InvalidDump('Truncated izk dump')
+        index_offset, nb_blocks, self.nb_records, magic = FOOTER.unpack(
+            self._read(self.file_size - FOOTER.size, FOOTER.size))
+        if magic != MAGIC:
+            raise InvalidDump('Truncated izk dump')
+        self.block_offsets, self.block_keys = [], []
+        offset = index_offset
+        for _ in range(nb_blocks):
+            block_offset, _, path_length = INDEX_ENTRY.unpack(
+                self._read(offset, INDEX_ENTRY.size))
+            offset += INDEX_ENTRY.size
+            first_path = self._read(offset, path_length).decode('utf-8')
+            offset += path_length
+            self.block_offsets.append(block_offset)
+            self.block_keys.append(path_key(first_path))
+
+    def __len__(self):
+        return self.nb_records
+
+    def _size(self):
+        if self._buffer is not None:
+            return len(self._buffer)
+        return self.fileobj.seek(0, io.SEEK_END)
+
+    def _read(self, offset, size):
+        if self._buffer is not None:
+            return self._buffer[offset:offset + size]
+        self.fileobj.seek(offset)
+        return self.fileobj.read(size)
+
+    def close(self):
+        if self._buffer is not None:
+            self._buffer.close()
+
+    def read_block(self, block_number):
+        offset = self.block_offsets[block_number]
+        length, = BLOCK_HEADER.unpack(self._read(offset, BLOCK_HEADER.size))
+        return self.decompress(self._read(offset + BLOCK_HEADER.size, length))
+
+    def __iter__(self):
+        for block_number in range(len(self.block_offsets)):
+            yield from decode_records(self.read_block(block_number))
+
+    def _block_records(self, block_number):
+        records = self._blocks.get(block_number)
+        if records is not None:
+            self._blocks.move_to_end(block_number)
+            return records
+        records = {
+            record.path: record
+            for record in decode_records(self.read_block(block_number))}
+        self._blocks[block_number] = records
+        if len(self._blocks) > self.cache_size:
+            self._blocks.popitem(last=False)
+        return records
+
+    def lookup(self, path):
+        """Return the DumpRecord of the argument path, or None if it was not exported"""
+        path = path.rstrip('/') or '/'
+        block_number = bisect.bisect_right(self.block_keys, path_key(path)) - 1
+        if block_number < 0:
+            return None
+        return self._block_records(block_number).get(path)
+
+
+class DumpClient:
+    """Read-only stand-in for a kazoo client, answering reads from a dump file.
+
+    It exposes the subset of the kazoo API used by the read commands, so that
+    an exported subtree can be browsed offline with the same command runner.
+
+    """
+
+    connected = True
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.reader = DumpReader(fileobj)
+        first_record = next(iter(self.reader), None)
+        self.root = first_record.path if first_record else '/'
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self.reader.close()
+        self.fileobj.close()
+
+    @property
+    def read_only(self):
+        return True
+
+    @read_only.setter
+    def read_only(self, value):
+        """A dump can't be written to, so the client stays read-only"""
+
+    def add_listener(self, listener):
+        """A dump is never disconnected, so the listener is never called"""
+
+    def remove_listener(self, listener):
+        """Nothing to do, as the listener is never called"""
+
+    def _record(self, path):
+        record = self.reader.lookup(path)
+        if record is None:
+            raise NoNodeError(path)
+        return record
+
+    def _answer(self, func, *args):
+        try:
+            return ResolvedResult(value=func(*args))
+        except NoNodeError as exc:
+            return ResolvedResult(exception=exc)
+
+    def get_async(self, path, watch=None):
+        return self._answer(lambda: self._record(path)[1:3])
+
+    def get(self, path, watch=None):
+        return self.get_async(path).get()
+
+    def get_children_async(self, path, watch=None, include_data=False):
+        def children():
+            record = self._record(path)
+            return (record.children, record.stat) if include_data else record.children
+        return self._answer(children)
+
+    def get_children(self, path, watch=None, include_data=False):
+        return self.get_children_async(path, include_data=include_data).get()
+
+    def exists_async(self, path, watch=None):
+        record = self.reader.lookup(path)
+        return ResolvedResult(value=record.stat if record is not None else None)
+
+    def exists(self, path, watch=None):
+        return self.exists_async(path).get()
+
+    def stat(self, path):
+        return self.exists(path)
+
+    def command(self, cmd=b'ruok'):
+        """Describe the dump, in place of the answer of a zookeeper node"""
+        return 'Dump of %s: %d nodes, %s compression, %s\n' % (
+            self.root, len(self.reader), self.reader.codec,
+            getattr(self.fileobj, 'name', 'in memory'))
+
+    def command_all(self, cmd=b'ruok', timeout=None):
+        return {getattr(self.fileobj, 'name', 'dump'): self.command(cmd)}
+
+
+def export_tree(zkcli, path, fileobj, codec='none'):
+    """Stream the subtree of the argument path to a dump, and return the number of nodes.
+
+    The subtree is walked with pipelined requests, and the data of the walked
+    nodes is fetched through a second pipeline, so that only a bounded number
+    of nodes are held in memory at any time.
+
+    """
+    nodes = walk(zkcli, path)
+    with DumpWriter(fileobj, codec) as writer:
+        for node, result in pipelined(lambda node: zkcli.get_async(node.path), nodes):
+            if result is None:
+                continue  # the node was deleted in the meantime
+            data, stat = result
+            writer.write(node.path, data, stat, node.children)
+    return writer.nb_records
+
+
+def import_tree(
+    zkcli, fileobj, path, on_conflict='skip', batch_size=DEFAULT_BATCH_SIZE, rate=None,
+    progress=None
+):
+    """Create the nodes of a dump under the argument path, and return a Counter of actions.
+
+    The dumped subtree root is imported as the argument path, and the nodes are
+    created parents before children, in pipelined multi() transactions. When a
+    node already exists, it is either skipped, overwritten, or, if its version
+    differs from the dumped one, a BadVersionError is raised (`on_conflict`
+    being 'skip', 'overwrite' or 'fail'). Under 'fail', nodes already holding
+    the dumped data are left untouched, so that an import can be run again.
+
+    """
+    reader = DumpReader(fileobj)
+    counts = collections.Counter()
+    if not len(reader):
+        return counts
+    src_root = next(iter(reader)).path
+    if path != '/':
+        zkcli.ensure_path(posixpath.dirname(path))
+
+    destinations = (
+        (relocate(record.path, src_root, path), record) for record in reader)
+    destinations = (
+        (dest, record) for dest, record in destinations if not is_reserved(dest))
+
+    def check(item):
+        # The data is only needed to tell identical nodes apart from conflicts
+        if on_conflict == 'fail':
+            return zkcli.get_async(item[0])
+        return zkcli.exists_async(item[0])
+
+    def operations():
+        # The existence of the nodes is checked ahead of the writes, in a pipeline
+        for (dest, record), result in pipelined(check, destinations):
+            data = record.data or b''
+            if on_conflict == 'fail' and result is not None:
+                current, stat = result
+            else:
+                current, stat = None, result
+            if stat is None:
+                counts['created'] += 1
+                yield ('create', dest, data)
+            elif on_conflict == 'skip':
+                counts['skipped'] += 1
+            elif on_conflict == 'overwrite':
+                counts['updated'] += 1
+                yield ('set_data', dest, data, -1)
+            elif current == data:
+                counts['skipped'] += 1
+            elif stat.version != record.stat.version:
+                raise BadVersionError('%s has version %d instead of %d' % (
+                    dest, stat.version, record.stat.version))
+            else:
+                counts['updated'] += 1
+                yield ('set_data', dest, data, stat.version)
+
+    def on_error(operation, exc):
+        # The node was created in the meantime, possibly by ourselves before a
+        # connection loss: apply the conflict policy.
+        name, dest, data, *_ = operation
+        if name != 'create' or not isinstance(exc, NodeExistsError):
+            raise exc
+        if on_conflict == 'fail':
+            if zkcli.get(dest)[0] != data:
+                raise exc
+            return
+        if on_conflict == 'overwrite':
+            zkcli.set(dest, data)
+
+    done = apply_batched(
+        zkcli, operations(), batch_size=batch_size, rate=rate, on_error=on_error,
+        progress=progress, total=len(reader))
+    if progress and done < len(reader):
+        progress(len(reader), len(reader))  # some nodes were skipped
+    return counts
@@ -1,15 +1,41 @@
 import json
 import functools
 import shutil
+import sys
 
 import colored
-from pygments import highlight, lexers, formatters
-from pygments import styles
 
 
-STYLE_NAMES = list(styles.get_all_styles()) + ['none']
+class StyleNames:
+    """The names of the color styles, only listed when displaying them.
+
+    Listing the styles imports all of them, so checking whether a style
+    exists only looks it up.
+
+    """
+
+    def __contains__(self, name):
+        from pygments.styles import get_style_by_name
+        from pygments.util import ClassNotFound
+        if name == 'none':
+            return True
+        try:
+            get_style_by_name(name)
+        except ClassNotFound:
+            return False
+        return True
+
+    def __iter__(self):
+        from pygments.styles import get_all_styles
+        return iter(list(get_all_styles()) + ['none'])
+
+
+STYLE_NAMES = StyleNames()
 PARENT_ZNODE_STYLE = angry = colored.fg("blue") + colored.attr("bold")
 
+# Payloads larger than this number of characters are displayed without highlighting
+HIGHLIGHT_MAX_SIZE = 256 * 1024
+
 
 def chunks(sequence, num_chunks):
     """Yield successive n-sized chunks from l."""
@@ -29,6 +55,56 @@ def columnize(items, nb_columns):
     return lines
 
 
+def write_lines(lines, stream=None, batch_size=1024):
+    """Write the lines to the stream, buffering them to avoid a write per line"""
+    stream = stream or sys.stdout
+    buf = []
+    for line in lines:
+        buf.append(line)
+        if len(buf) >= batch_size:
+            stream.write('\n'.join(buf) + '\n')
+            stream.flush()
+            buf = []
+    if buf:
+        stream.write('\n'.join(buf) + '\n')
+    stream.flush()
+
+
+def print_progress(done, total, label, stream=None):
+    """Display the progress of a long-running operation on a single line"""
+    stream = stream or sys.stderr
+    percent = 100 * done // total if total else 100
+    stream.write('\r%s %d/%d (%d%%)' % (label, done, total, percent))
+    if done >= total:
+        stream.write('\n')
+    stream.flush()
+
+
+def format_size(size):
+    """Return a human-readable size, such as 1.5K or 12.0M"""
+    for unit in ('B', 'K', 'M', 'G'):
+        if size < 1024:
+            break
+        size /= 1024
+    else:
+        unit = 'T'
+    return '%d%s' % (size, unit) if unit == 'B' else '%.1f%s' % (size, unit)
+
+
+@functools.lru_cache(maxsize=None)
+def get_lexer(name):
+    """Return the pygments lexer of the argument name, instanciated only once"""
+    from pygments import lexers
+    return lexers.get_lexer_by_name(name)
+
+
+@functools.lru_cache(maxsize=None)
+def get_formatter(style):
+    """Return the terminal formatter of the argument style, instanciated only once"""
+    from pygments import formatters
+    return formatters.Terminal256Formatter(style=style)
+
+
 def colorize(f):
     @functools.wraps(f)
     def wrapper(*args, **kwargs):
@@ -39,19 +115,21 @@ def colorize(f):
             return
         if g.style is None:
             return out
+        # Highlighting is done in pure python, and takes seconds for large payloads
+        if len(out) > HIGHLIGHT_MAX_SIZE:
+            return out
         printable = repr(out)
-        lexer = lexers.PythonLexer()
-        try:
-            serialized = json.loads(out)
-        except ValueError:
-            pass
-        else:
-            if isinstance(serialized, (tuple, list, dict)):
+        lexer = get_lexer('python')
+        # Only attempt to deserialize payloads that could be JSON containers
+        if out.lstrip()[:1] in ('{', '['):
+            try:
+                serialized = json.loads(out)
+            except ValueError:
+                pass
+            else:
                 printable = json.dumps(serialized, indent=2)
-                lexer = lexers.JsonLexer()
-        printable = highlight(
-            printable,
-            lexer,
-            formatters.Terminal256Formatter(style=g.style))
+                lexer = get_lexer('json')
+        from pygments import highlight
+        printable = highlight(printable, lexer, get_formatter(g.style))
         return printable
     return wrapper
@@ -0,0 +1,73 @@
+"""The grammar of the shell commands, shared by the parser, the completer and the lexer."""
+
+KEYWORDS = [
+    # 'addauth',
+    'bench',
+    # 'close',
+    # 'connect',
+    'create',
+    'delete',
+    'diff',
+    'du',
+    'edit',
+    'exit',
+    'export',
+    # 'delquota',
+    'find',
+    'get',
+    # 'getAcl',
+    'grep',
+    'help',
+    'import',
+    # 'history',
+    # 'listquota',
+    'ls',
+    'mirror',
+    'ping',
+    # 'ls2',
+    'tree',
+    'ftree',
+    # 'printwatches',
+    'quit',
+    # 'redo',
+    'raw',
+    'rmr',
+    'set',
+    # 'setAcl',
+    # 'setquota',
+    'stat',
+    'sync',
+    'timing',
+    'toggle_write',
+    'top',
+    'watch',
+]
+
+# A zookeeper CLI command
+COMMAND = r'(%s)' % ('|'.join(KEYWORDS))
+
+# A znode path
+PATH = r'/[^\s]*'
+
+# A znode path, possibly on another ensemble, such as zk://host:2181/path
+ZK_LOCATION = r'(zk://[^/\s]+)?/[^\s]*'
+
+# A string-value
+QUOTED_STR = r"('[^']*'|\"[^\"]*\")"
+
+# A local file path
+FILENAME = r'[^\s]+'
+
+# A command option name, such as --depth
+OPTION = r'--[a-z][a-z-]*'
+
+# An integer value
+NUMBER = r'\d+'
+
+# A single 4 letter word
+ZK_FOUR_LETTER_WORDS = [
+    "conf", "cons", "crst", "dump",
+    "envi", "ruok", "srst", "srvr",
+    "stat", "wchs", "wchc", "wchp", "mntr"
+]
+ZK_FOUR_LETTER_WORD = r'(%s)' % ('|'.join(ZK_FOUR_LETTER_WORDS))
@@ -0,0 +1,123 @@
+import collections
+import math
+import time
+
+from kazoo.exceptions import NoNodeError
+
+# Relative width of the histogram buckets: recorded values are rounded up by at most 2%
+BUCKET_GROWTH = 1.02
+
+# Smallest latency told apart by the histogram, in seconds
+MIN_LATENCY = 1e-6
+
+# Percentiles displayed in latency reports
+REPORTED_PERCENTILES = (50, 90, 99)
+
+
+class LatencyHistogram:
+    """Latencies counted in buckets of exponentially growing width.
+
+    Only the number of values falling in each bucket is stored, so that the
+    memory used doesn't depend on the number of recorded values, and the
+    percentiles are accurate to BUCKET_GROWTH. The minimum, maximum and
+    total are kept exact.
+
+    """
+
+    def __init__(self):
+        self.buckets = collections.Counter()  # bucket index -> number of values
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def __len__(self):
+        return self.count
+
+    @staticmethod
+    def _bucket(value):
+        if value <= MIN_LATENCY:
+            return 0
+        return math.ceil(math.log(value / MIN_LATENCY, BUCKET_GROWTH))
+
+    def record(self, value):
+        """Record a latency, in seconds"""
+        self.buckets[self._bucket(value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        """Add the values recorded by another histogram to this one"""
+        self.buckets.update(other.buckets)
+        self.count += other.count
+        self.total += other.total
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def percentile(self, percent):
+        """Return the upper bound of the bucket holding the argument percentile"""
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(self.count * percent / 100))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(max(MIN_LATENCY * BUCKET_GROWTH ** index, self.min), self.max)
+        return self.max
+
+
+def format_latency(seconds):
+    if seconds is None:
+        return '-'
+    if seconds < 1:
+        return '%.2fms' % (seconds * 1000)
+    return '%.2fs' % (seconds)
+
+
+def format_histogram(histogram, percentiles=REPORTED_PERCENTILES):
+    """Return a one line summary of the histogram: count, min, percentiles and max"""
+    fields = ['n=%d' % (histogram.count), 'min=%s' % (format_latency(histogram.min))]
+    fields.extend(
+        'p%d=%s' % (percent, format_latency(histogram.percentile(percent)))
+        for percent in percentiles)
+    fields.append('max=%s' % (format_latency(histogram.max)))
+    return ' '.join(fields)
+
+
+def probe(zkcli, path='/', count=100, concurrency=1, operation='exists', histogram=None):
+    """Send `count` requests on the path, and return the histogram of their latency.
+
+    At most `concurrency` requests are in flight at any given time. As
+    zookeeper answers the requests of a session in order, the latency of a
+    request is measured when the response of the oldest one in flight is
+    waited on.
+
+    """
+    histogram = histogram if histogram is not None else LatencyHistogram()
+    request = getattr(zkcli, '%s_async' % (operation))
+    in_flight = collections.deque()
+
+    def resolve():
+        sent_at, async_result = in_flight.popleft()
+        try:
+            async_result.get()
+        except NoNodeError:
+            pass
+        histogram.record(time.perf_counter() - sent_at)
+
+    for _ in range(count):
+        in_flight.append((time.perf_counter(), request(path)))
+        if len(in_flight) >= concurrency:
+            resolve()
+    while in_flight:
+        resolve()
+    return histogram
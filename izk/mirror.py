@@ -0,0 +1,349 @@
+"""In-memory replica of a subtree, kept current by watches.
+
+Each node is stored as a (data, packed stat, children names) tuple, the stat
+being packed into 68 bytes instead of a ZnodeStat of 11 int objects. Every
+mirrored node holds a data watch and a child watch, re-registered each time
+they fire, in the manner of kazoo's TreeCache recipe. As the responses and the
+watch events are delivered by different kazoo threads, a response is dropped,
+or its request sent again, when an event of its node arrived in the meantime.
+As kazoo drops all the watches when the connection is lost, the mirror then
+stops answering reads, and reloads the whole subtree once reconnected.
+
+"""
+import collections
+import logging
+import struct
+import threading
+
+from kazoo.exceptions import NoNodeError, KazooException
+from kazoo.protocol.states import EventType, KazooState, ZnodeStat
+
+from .pipeline import ResolvedResult, DEFAULT_WINDOW
+from .utils import join_path
+
+logger = logging.getLogger(__name__)
+
+STAT = struct.Struct('>qqqqiiiqiiq')
+
+# Default bound of the memory used by a mirror
+DEFAULT_MIRROR_MAX_BYTES = 256 * 1024 * 1024
+
+# Approximate memory overhead of a mirrored node and of a child name, on top of their length
+NODE_OVERHEAD = 240
+CHILD_NAME_OVERHEAD = 56
+
+
+class MirrorTooLarge(Exception):
+    """Exception raised when a subtree does not fit in the mirror memory bound."""
+
+
+class MirroredTree:
+    """Replica of the subtree of a path, loaded once and kept current by watches.
+
+    The subtree is loaded with at most `window` requests in flight. If its
+    approximate memory usage exceeds `max_bytes`, the replica is dropped and
+    the mirror disabled, as it can't be kept complete.
+
+    """
+
+    def __init__(
+        self, zkcli, path, max_bytes=DEFAULT_MIRROR_MAX_BYTES, window=DEFAULT_WINDOW
+    ):
+        self.zkcli = zkcli
+        self.path = path
+        self.max_bytes = max_bytes
+        self.window = window
+        self.size = 0
+        self.enabled = True
+        self._nodes = {}  # path -> (data, packed stat, children)
+        self._lock = threading.RLock()
+        self._to_load = collections.deque()
+        self._in_flight = 0
+        self._pumping = False
+        self._loaded = threading.Event()
+        self.stale = False  # the connection was lost, and the watches with it
+        self._generation = 0  # incremented by each reload
+        self._sequence = 0  # incremented by each watch event
+        self._changes = {}  # (watch kind, path) -> sequence number of its last event
+        zkcli.add_listener(self._on_state_change)
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def covers(self, path):
+        """Return whether the argument path is answered by the mirror"""
+        return self.enabled and not self.stale and self._loaded.is_set() and (
+            path == self.path or path.startswith(self.path.rstrip('/') + '/'))
+
+    def load(self, timeout=None):
+        """Load the subtree, and block until it is fully mirrored"""
+        self._schedule(self.path)
+        if not self._loaded.wait(timeout):
+            raise KazooException('Timed out while mirroring %s' % (self.path))
+        if not self.enabled:
+            raise MirrorTooLarge(
+                '%s does not fit in %d bytes' % (self.path, self.max_bytes))
+        if self.path not in self._nodes:
+            raise NoNodeError('%s does not exist' % (self.path))
+
+    # Node storage
+
+    @staticmethod
+    def _node_size(path, data, children):
+        return (
+            NODE_OVERHEAD + len(path) + len(data or b'') +
+            sum(len(child) + CHILD_NAME_OVERHEAD for child in children))
+
+    def _store(self, path, data, stat, children):
+        with self._lock:
+            if not self.enabled:
+                return
+            self._discard(path)
+            self._nodes[path] = (data, STAT.pack(*stat), tuple(sorted(children)))
+            self.size += self._node_size(path, data, children)
+            if self.size > self.max_bytes:
+                logger.warning(
+                    'Mirror of %s exceeds %d bytes: disabled', self.path, self.max_bytes)
+                self.enabled = False
+                self._nodes.clear()
+                self.size = 0
+                self._to_load.clear()
+
+    def _discard(self, path):
+        node = self._nodes.pop(path, None)
+        if node is not None:
+            self.size -= self._node_size(path, node[0], node[2])
+        return node
+
+    def _remove(self, path):
+        """Remove a node and its descendants from the mirror"""
+        with self._lock:
+            node = self._discard(path)
+            if node is None:
+                return
+            for child in node[2]:
+                self._remove(join_path(path, child))
+
+    def lookup(self, path):
+        """Return the (data, stat, children) of a mirrored node, or None if it is missing"""
+        node = self._nodes.get(path)
+        if node is None:
+            return None
+        data, stat, children = node
+        return data, ZnodeStat(*STAT.unpack(stat)), list(children)
+
+    # Loading, with a bounded number of requests in flight
+
+    def _schedule(self, path):
+        with self._lock:
+            self._to_load.append(path)
+        self._pump()
+
+    def _pump(self):
+        """Send the requests of the nodes to load, keeping at most `window` in flight"""
+        with self._lock:
+            # Responses received while sending requests are handled by the outer loop
+            if self._pumping:
+                return
+            self._pumping = True
+        while True:
+            with self._lock:
+                if not self._to_load or self._in_flight >= self.window:
+                    self._pumping = False
+                    if not self._to_load and not self._in_flight:
+                        self._loaded.set()
+                    return
+                path = self._to_load.popleft()
+                self._in_flight += 1
+            self._request(path)
+
+    def _changed(self, kind, path):
+        """Record a watch event of a node, and return its sequence number"""
+        with self._lock:
+            self._sequence += 1
+            self._changes[kind, path] = self._sequence
+            return self._sequence
+
+    def _last_changes(self, path):
+        return self._changes.get(('data', path)), self._changes.get(('children', path))
+
+    def _request(self, path):
+        generation = self._generation
+        changes = self._last_changes(path)
+        data_result = self.zkcli.get_async(path, watch=self._on_data_event)
+        children_result = self.zkcli.get_children_async(
+            path, watch=self._on_child_event, include_data=True)
+
+        def on_children(async_result):
+            # Responses are received in the order of the requests, so the
+            # data response is already available.
+            try:
+                data, _ = data_result.get()
+                children, stat = async_result.get()
+                if generation != self._generation:
+                    raise KazooException('reloaded in the meantime')
+            except NoNodeError:
+                self._remove(path)  # deleted before being mirrored
+            except KazooException as exc:
+                logger.warning('Could not mirror %s: %s', path, exc)
+            else:
+                with self._lock:
+                    if changes != self._last_changes(path):
+                        # The node changed before being stored: request it again
+                        self._to_load.append(path)
+                    else:
+                        self._store(path, data, stat, children)
+                        if self.enabled:
+                            self._to_load.extend(
+                                join_path(path, child) for child in children)
+            with self._lock:
+                self._in_flight -= 1
+            self._pump()
+
+        children_result.rawlink(on_children)
+
+    # Connection state and watch callbacks
+
+    def _on_state_change(self, state):
+        """Connection listener, called by kazoo: must not block"""
+        if state in (KazooState.SUSPENDED, KazooState.LOST):
+            with self._lock:
+                self.stale = True
+                self._to_load.clear()
+        elif self.stale and self.enabled:
+            logger.warning('Connection restored: reloading the mirror of %s', self.path)
+            with self._lock:
+                self._generation += 1
+                self._changes.clear()
+                self._nodes.clear()
+                self.size = 0
+                self._loaded.clear()
+                self.stale = False
+            self._schedule(self.path)
+
+    def _on_data_event(self, event):
+        # NONE events are sent when the connection is lost, without a path
+        if not self.enabled or event.type == EventType.NONE:
+            return
+        sequence = self._changed('data', event.path)
+        if event.type == EventType.DELETED:
+            self._remove(event.path)
+            return
+        if event.path not in self._nodes:
+            return  # its pending request is sent again
+
+        def on_data(async_result):
+            try:
+                data, stat = async_result.get()
+            except NoNodeError:
+                self._remove(event.path)
+                return
+            except KazooException:
+                return
+            with self._lock:
+                # Responses to outdated requests are superseded by the pending ones
+                if self._changes.get(('data', event.path)) != sequence:
+                    return
+                node = self._nodes.get(event.path)
+                if node is not None:
+                    self._store(event.path, data, stat, node[2])
+
+        self.zkcli.get_async(event.path, watch=self._on_data_event).rawlink(on_data)
+
+    def _on_child_event(self, event):
+        if not self.enabled or event.type != EventType.CHILD:  # including NONE events
+            return
+        sequence = self._changed('children', event.path)
+        if event.path not in self._nodes:
+            return  # its pending request is sent again
+
+        def on_children(async_result):
+            try:
+                children, stat = async_result.get()
+            except KazooException:
+                return
+            with self._lock:
+                if self._changes.get(('children', event.path)) != sequence:
+                    return
+                node = self._nodes.get(event.path)
+                if node is None:
+                    return
+                data, _, previous = node
+                self._store(event.path, data, stat, children)
+                for child in set(previous) - set(children):
+                    self._remove(join_path(event.path, child))
+                added = sorted(set(children) - set(previous))
+            for child in added:
+                self._schedule(join_path(event.path, child))
+
+        self.zkcli.get_children_async(
+            event.path, watch=self._on_child_event, include_data=True).rawlink(on_children)
+
+
+class MirrorClient:
+    """Proxy of a kazoo client, answering the reads of the mirrored subtree locally.
+
+    Reads setting a watch, reads outside of the mirrored subtree and writes are
+    sent to the server.
+
+    """
+
+    def __init__(self, zkcli, mirror):
+        self._zkcli = zkcli
+        self.mirror = mirror
+
+    def __getattr__(self, name):
+        return getattr(self._zkcli, name)
+
+    @property
+    def read_only(self):
+        return self._zkcli.read_only
+
+    @read_only.setter
+    def read_only(self, value):
+        self._zkcli.read_only = value
+
+    def _lookup(self, path):
+        node = self.mirror.lookup(path)
+        if node is None:
+            raise NoNodeError(path)
+        return node
+
+    def _answer(self, func, *args):
+        try:
+            return ResolvedResult(value=func(*args))
+        except NoNodeError as exc:
+            return ResolvedResult(exception=exc)
+
+    def get_async(self, path, watch=None):
+        if watch is not None or not self.mirror.covers(path):
+            return self._zkcli.get_async(path, watch=watch)
+        return self._answer(lambda: self._lookup(path)[:2])
+
+    def get(self, path, watch=None):
+        return self.get_async(path, watch=watch).get()
+
+    def get_children_async(self, path, watch=None, include_data=False):
+        if watch is not None or not self.mirror.covers(path):
+            return self._zkcli.get_children_async(
+                path, watch=watch, include_data=include_data)
+
+        def children():
+            _, stat, children = self._lookup(path)
+            return (children, stat) if include_data else children
+        return self._answer(children)
+
+    def get_children(self, path, watch=None, include_data=False):
+        return self.get_children_async(path, watch=watch, include_data=include_data).get()
+
+    def exists_async(self, path, watch=None):
+        if watch is not None or not self.mirror.covers(path):
+            return self._zkcli.exists_async(path, watch=watch)
+        node = self.mirror.lookup(path)
+        return ResolvedResult(value=node[1] if node is not None else None)
+
+    def exists(self, path, watch=None):
+        return self.exists_async(path, watch=watch).get()
+
+    def stat(self, path):
+        return self.exists(path)
@@ -0,0 +1,149 @@
+import collections
+import csv
+import json
+import re
+import time
+
+# Metrics that are ever increasing counters, displayed as per-second rates
+COUNTERS = ('zk_packets_received', 'zk_packets_sent')
+
+# Metrics recorded in CSV files, in order
+RECORDED_METRICS = (
+    'zk_server_state', 'zk_packets_received', 'zk_packets_sent', 'zk_outstanding_requests',
+    'zk_avg_latency', 'zk_max_latency', 'zk_num_alive_connections', 'zk_znode_count',
+    'zk_watch_count', 'zk_approximate_data_size', 'zk_client_queued',
+)
+
+# A connection listed by cons, such as ' /10.0.0.1:52236[1](queued=0,recved=1,...)'
+CONNECTION = re.compile(r'\s*/(?P<address>\S+?)\[\d+\]\((?P<stats>.*)\)')
+
+Sample = collections.namedtuple('Sample', 'host time metrics error')
+
+
+def parse_value(value):
+    for value_type in (int, float):
+        try:
+            return value_type(value)
+        except ValueError:
+            pass
+    return value
+
+
+def parse_mntr(output):
+    """Return the metrics of a mntr answer, as a dict mapping their name to their value"""
+    metrics = {}
+    for line in output.splitlines():
+        name, _, value = line.partition('\t')
+        if value:
+            metrics[name.strip()] = parse_value(value.strip())
+    return metrics
+
+
+def parse_cons(output):
+    """Return the list of client connections of a cons answer, as dicts of their stats"""
+    connections = []
+    for line in output.splitlines():
+        m = CONNECTION.fullmatch(line)
+        if not m:
+            continue
+        connection = {'address': m.group('address')}
+        for stat in m.group('stats').split(','):
+            name, _, value = stat.partition('=')
+            connection[name] = parse_value(value)
+        connections.append(connection)
+    return connections
+
+
+def sample_ensemble(zkcli):
+    """Send mntr and cons to all the ensemble nodes, and return a Sample per node"""
+    mntr, cons = zkcli.command_all(b'mntr'), zkcli.command_all(b'cons')
+    now = time.time()
+    samples = []
+    for host, output in mntr.items():
+        if output.startswith('Error: '):
+            samples.append(Sample(host, now, {}, output[len('Error: '):]))
+            continue
+        metrics = parse_mntr(output)
+        connections = parse_cons(cons.get(host, ''))
+        metrics['zk_client_queued'] = sum(
+            connection.get('queued', 0) for connection in connections)
+        samples.append(Sample(host, now, metrics, None))
+    return samples
+
+
+def rates(previous, current):
+    """Return the per-second rate of each counter between two samples of the same node"""
+    elapsed = current.time - previous.time
+    if elapsed <= 0:
+        return {}
+    return {
+        counter: (current.metrics[counter] - previous.metrics[counter]) / elapsed
+        for counter in COUNTERS
+        if counter in current.metrics and counter in previous.metrics
+    }
+
+
+def _metric(name):
+    return lambda metrics, rates: metrics.get(name, '-')
+
+
+def _rate(name):
+    return lambda metrics, rates: '%.0f' % (rates[name]) if name in rates else '-'
+
+
+# Columns of the top table: header, width, and function of the node metrics and rates
+COLUMNS = [
+    ('HOST', 22, _metric('host')),
+    ('STATE', 10, _metric('zk_server_state')),
+    ('RECV/S', 9, _rate('zk_packets_received')),
+    ('SENT/S', 9, _rate('zk_packets_sent')),
+    ('OUTST', 6, _metric('zk_outstanding_requests')),
+    ('QUEUED', 7, _metric('zk_client_queued')),
+    ('LAT AVG', 8, _metric('zk_avg_latency')),
+    ('LAT MAX', 8, _metric('zk_max_latency')),
+    ('CONNS', 6, _metric('zk_num_alive_connections')),
+    ('ZNODES', 9, _metric('zk_znode_count')),
+    ('WATCHES', 8, _metric('zk_watch_count')),
+]
+
+
+def format_table(samples, previous_samples=None):
+    """Return the lines of a table of the node metrics, with rates since previous samples"""
+    previous_samples = previous_samples or {}
+    lines = [' '.join(header.ljust(width) for header, width, _ in COLUMNS).rstrip()]
+    for sample in samples:
+        if sample.error:
+            lines.append('%s %s' % (sample.host.ljust(COLUMNS[0][1]), sample.error))
+            continue
+        previous = previous_samples.get(sample.host)
+        sample_rates = rates(previous, sample) if previous and not previous.error else {}
+        metrics = dict(sample.metrics, host=sample.host)
+        lines.append(' '.join(
+            str(column(metrics, sample_rates)).ljust(width)
+            for _, width, column in COLUMNS).rstrip())
+    return lines
+
+
+class MetricsRecorder:
+    """Append the samples to a file, either as CSV rows or as JSON lines."""
+
+    def __init__(self, fileobj, fmt='jsonl'):
+        self.fileobj = fileobj
+        self.fmt = fmt
+        if fmt == 'csv':
+            self.writer = csv.writer(fileobj)
+            if not fileobj.tell():
+                self.writer.writerow(('time', 'host') + RECORDED_METRICS)
+
+    def write(self, samples):
+        for sample in samples:
+            if sample.error:
+                continue
+            if self.fmt == 'csv':
+                self.writer.writerow(
+                    ['%.3f' % (sample.time), sample.host] +
+                    [sample.metrics.get(metric, '') for metric in RECORDED_METRICS])
+            else:
+                record = dict(sample.metrics, time=round(sample.time, 3), host=sample.host)
+                self.fileobj.write(json.dumps(record, separators=(',', ':')) + '\n')
+        self.fileobj.flush()
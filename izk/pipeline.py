@@ -0,0 +1,333 @@
+import collections
+import heapq
+import time
+
+from kazoo.exceptions import (
+    KazooException, NoNodeError, ConnectionLoss, OperationTimeoutError)
+
+from .utils import join_path, is_reserved
+
+# Maximum number of requests sent to zookeeper without having received a response
+DEFAULT_WINDOW = 512
+
+# Maximum number of nodes fetched ahead of a walk, as a multiple of the window
+PREFETCH_FACTOR = 8
+
+# Number of operations per multi() transaction, and number of transactions in flight
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_TRANSACTION_WINDOW = 8
+
+# Number of seconds to wait for the connection to be re-established
+RECONNECTION_TIMEOUT = 60
+
+# Exceptions after which we don't know whether a request was applied
+CONNECTION_ERRORS = (ConnectionLoss, OperationTimeoutError)
+
+
+def pipelined(async_func, items, window=DEFAULT_WINDOW):
+    """Call the kazoo async function on each item, and yield (item, result) in order.
+
+    At most `window` requests are in flight at any given time, which allows
+    many requests to be sent in a single round-trip, without flooding the
+    connection. Nodes deleted in the meantime yield a None result.
+
+    """
+    in_flight = collections.deque()
+
+    def resolve():
+        item, async_result = in_flight.popleft()
+        try:
+            return item, async_result.get()
+        except NoNodeError:
+            return item, None
+
+    for item in items:
+        in_flight.append((item, async_func(item)))
+        if len(in_flight) >= window:
+            yield resolve()
+    while in_flight:
+        yield resolve()
+
+
+class _WalkNode:
+    """A znode discovered during a walk, along with its pending request."""
+
+    __slots__ = ('path', 'key', 'result', 'children', 'stat')
+
+    def __init__(self, path, key):
+        self.path = path
+        self.key = key  # sorting the nodes by key sorts them in depth-first order
+        self.result = None
+        self.children = None
+        self.stat = None
+
+
+WalkedNode = collections.namedtuple('WalkedNode', 'path depth children stat')
+
+
+def walk(zkcli, path, max_depth=None, window=DEFAULT_WINDOW):
+    """Yield a WalkedNode for each node of the argument path subtree, in depth-first order.
+
+    The nodes about to be visited are prefetched, keeping at most `window`
+    requests in flight, and every response received while waiting for the
+    next node to visit is used to discover more nodes to prefetch. Walking a
+    subtree thus costs about one round-trip per level, instead of one
+    round-trip per node. Nodes located at `max_depth` are yielded with their
+    stat, but their children are not listed.
+
+    """
+    outstanding = 0  # number of requests sent without having processed their response
+    prefetched = 0  # number of requested nodes that have not been visited yet
+    in_flight = collections.deque()
+    to_fetch = []  # heap of the discovered nodes, in depth-first order
+
+    def fetch(node):
+        nonlocal outstanding, prefetched
+        if max_depth is not None and len(node.key) >= max_depth:
+            node.result = zkcli.exists_async(node.path)
+        else:
+            node.result = zkcli.get_children_async(node.path, include_data=True)
+        in_flight.append(node)
+        outstanding += 1
+        prefetched += 1
+
+    def expand(node):
+        nonlocal outstanding
+        outstanding -= 1
+        try:
+            result = node.result.get()
+        except NoNodeError:
+            result = None
+        node.children = []
+        if result is None:
+            return  # the node was deleted during the walk
+        if max_depth is not None and len(node.key) >= max_depth:
+            node.stat = result
+        else:
+            children, node.stat = result
+            node.children = [
+                _WalkNode(join_path(node.path, child), node.key + (child,))
+                for child in sorted(children)]
+            for child in node.children:
+                heapq.heappush(to_fetch, (child.key, child))
+
+    root = _WalkNode(path, ())
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if node.result is None:
+            fetch(node)
+        if node.children is None:
+            expand(node)
+        prefetched -= 1
+
+        # Discover the children of all the nodes for which a response arrived
+        # in the meantime, to be able to request the next level right away.
+        while in_flight and (
+                in_flight[0].children is not None or in_flight[0].result.ready()):
+            ready_node = in_flight.popleft()
+            if ready_node.children is None:
+                expand(ready_node)
+        # Bound the number of prefetched nodes kept in memory ahead of the walk
+        while to_fetch and outstanding < window and prefetched < PREFETCH_FACTOR * window:
+            _, next_node = heapq.heappop(to_fetch)
+            if next_node.result is None:
+                fetch(next_node)
+
+        if node.stat is None:
+            if node is root:
+                raise NoNodeError('%s does not exist' % (path))
+            continue
+        stack.extend(reversed(node.children))
+        children = [child.key[-1] for child in node.children]
+        yield WalkedNode(node.path, len(node.key), children, node.stat)
+
+
+class RateLimiter:
+    """Limit the number of operations per second, by sleeping when going too fast."""
+
+    def __init__(self, rate=None):
+        self.rate = rate
+        self.allowance = 0
+        self.last_check = time.monotonic()
+
+    def acquire(self, nb_ops=1):
+        """Block until `nb_ops` operations can be performed without exceeding the rate"""
+        if not self.rate:
+            return
+        now = time.monotonic()
+        # Allow a burst of at most one second worth of operations
+        elapsed, self.last_check = now - self.last_check, now
+        self.allowance = min(self.allowance + elapsed * self.rate, self.rate)
+        self.allowance -= nb_ops
+        if self.allowance < 0:
+            time.sleep(-self.allowance / self.rate)
+
+
+def wait_until_connected(zkcli, timeout=RECONNECTION_TIMEOUT):
+    """Wait for kazoo to re-establish the connection, after a connection loss"""
+    deadline = time.monotonic() + timeout
+    while not zkcli.connected:
+        if time.monotonic() > deadline:
+            raise ConnectionLoss('Could not reconnect after %ds' % (timeout))
+        time.sleep(0.1)
+
+
+class ResolvedResult:
+    """Mimic a kazoo async result, for requests answered without reaching the server.
+
+    This is also the result of a request that could not even be sent.
+
+    """
+
+    def __init__(self, value=None, exception=None):
+        self.value = value
+        self.exception = exception
+
+    def ready(self):
+        return True
+
+    def get(self, block=True, timeout=None):
+        if self.exception is not None:
+            raise self.exception
+        return self.value
+
+    def rawlink(self, callback):
+        callback(self)
+
+
+def commit_batches(
+    zkcli, batches, window=DEFAULT_TRANSACTION_WINDOW, limiter=None
+):
+    """Commit each batch of operations in a multi() transaction, and yield (batch, results).
+
+    Each operation is a tuple made of the name of a kazoo transaction method
+    followed by its arguments, such as ('delete', '/a/b'). At most `window`
+    transactions are in flight at any given time. As zookeeper applies the
+    requests of a session in order, a batch can depend on the previous ones.
+
+    The results are the list returned by kazoo, containing an exception for
+    each operation of a failed transaction. A connection loss is yielded as
+    the results of the batch, as we can't know if it was applied or not.
+
+    """
+    limiter = limiter or RateLimiter()
+    in_flight = collections.deque()
+
+    def resolve():
+        batch, async_result = in_flight.popleft()
+        try:
+            return batch, async_result.get()
+        except CONNECTION_ERRORS as exc:
+            return batch, exc
+
+    for batch in batches:
+        limiter.acquire(len(batch))
+        transaction = zkcli.transaction()
+        for operation, *args in batch:
+            getattr(transaction, operation)(*args)
+        try:
+            in_flight.append((batch, transaction.commit_async()))
+        except CONNECTION_ERRORS as exc:
+            in_flight.append((batch, ResolvedResult(exception=exc)))
+        if len(in_flight) >= window:
+            yield resolve()
+    while in_flight:
+        yield resolve()
+
+
+def transaction_failed(results):
+    """Return whether the results of a transaction indicate a failure"""
+    return isinstance(results, Exception) or any(
+        isinstance(result, Exception) for result in results)
+
+
+def batched(items, batch_size):
+    """Group the items into lists of at most batch_size items"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def apply_one(zkcli, operation):
+    """Apply a single transaction operation outside of a transaction.
+
+    The operation is retried after connection losses, which means that it may
+    have been applied already (e.g. a create raising a NodeExistsError).
+
+    """
+    name, *args = operation
+    method = {
+        'create': zkcli.create,
+        'delete': zkcli.delete,
+        'set_data': zkcli.set,
+    }[name]
+    while True:
+        try:
+            return method(*args)
+        except CONNECTION_ERRORS:
+            wait_until_connected(zkcli)
+
+
+def apply_batched(
+    zkcli, operations, batch_size=DEFAULT_BATCH_SIZE, rate=None, on_error=None,
+    progress=None, total=None
+):
+    """Apply the operations in pipelined multi() transactions, and return their number.
+
+    If a transaction fails, because of a conflicting operation or of a
+    connection loss, its operations are applied one by one, and the errors are
+    passed to the `on_error(operation, exception)` callable, or raised if None.
+    At most `rate` operations are applied per second. The `progress` callable
+    is called with the number of applied operations and `total` after each batch.
+
+    """
+    done = 0
+    for batch, results in commit_batches(
+            zkcli, batched(operations, batch_size), limiter=RateLimiter(rate)):
+        if transaction_failed(results):
+            if isinstance(results, CONNECTION_ERRORS):
+                wait_until_connected(zkcli)
+            for operation in batch:
+                try:
+                    apply_one(zkcli, operation)
+                except KazooException as exc:
+                    if on_error is None:
+                        raise
+                    on_error(operation, exc)
+        done += len(batch)
+        if progress:
+            progress(done, total)
+    return done
+
+
+def delete_recursive(
+    zkcli, path, batch_size=DEFAULT_BATCH_SIZE, rate=None, progress=None
+):
+    """Delete the argument node and all its descendants, leaves before parents.
+
+    The subtree is collected with a pipelined walk, and deleted in batches of
+    multi() transactions. If a transaction fails, because a node was deleted
+    in the meantime or the connection was lost, its nodes are deleted one by
+    one, ignoring missing nodes. The root node and the nodes reserved by
+    zookeeper are never deleted. The `progress` callable is called with the
+    number of deleted nodes and the total number of nodes after each batch.
+
+    """
+    def ignore_missing_nodes(operation, exc):
+        if not isinstance(exc, NoNodeError):
+            raise exc
+
+    paths = [
+        node.path for node in walk(zkcli, path)
+        if node.path != '/' and not is_reserved(node.path)]
+    paths.reverse()  # in reversed depth-first order, children come before parents
+    return apply_batched(
+        zkcli, (('delete', node_path) for node_path in paths),
+        batch_size=batch_size, rate=rate, on_error=ignore_missing_nodes,
+        progress=progress, total=len(paths))
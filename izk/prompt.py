@@ -1,41 +1,36 @@
 import argparse
+import functools
 import threading
 import os
+import sys
+import time
 
 from pathlib import Path
-from prompt_toolkit.shortcuts import prompt
-from prompt_toolkit.history import InMemoryHistory
-from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
-try:
-    from prompt_toolkit.lexers import PygmentsLexer
-except ImportError:
-    def PygmentsLexer(lexer):
-        return lexer
-try:
-    from prompt_toolkit.styles.pygments import style_from_pygments_cls
-except ImportError:
-    def style_from_pygments_cls(style):
-        return style
-from pygments import styles
-from kazoo.exceptions import NoNodeError, NotEmptyError
+from kazoo.exceptions import (
+    NoNodeError, NodeExistsError, NotEmptyError, BadVersionError, ConnectionLoss,
+    KazooException)
 
 from .runner import ZkCommandRunner, command_usage, UnauthorizedWrite
-from .lexer import ZkCliLexer
 from .zk import ExtendedKazooClient
-from .completion import ZkCompleter
+from .script import run_script, read_commands, open_script, ON_ERROR_CHOICES
 from .validation import UnknownCommand, CommandValidationError, ask_for_confirmation
-from .formatting import STYLE_NAMES
+from .formatting import STYLE_NAMES, format_size
+from .mirror import MirroredTree, MirrorClient, MirrorTooLarge
+from .dump import DumpClient, InvalidDump
+from .daemon import serve, send_commands, default_socket_path
+from .trace import TracingClient
+from .pipeline import wait_until_connected
 from .utils import bool_from_str
 from . import __version__
 
 
-history = InMemoryHistory()
-auto_suggest = AutoSuggestFromHistory()
 g = threading.local()
 
 DEFAULT_ZK_URL = 'localhost:2181'
 DEFAULT_COLOR_STYLE = 'monokai'
 DEFAULT_INPUT_MODE = 'vi'
+# Number of seconds to wait for the session to be connected, before printing the headers
+CONNECTION_TIMEOUT = 30
 EDITING_MODE_CHOICES = ('vi', 'emacs')
 
 def infer_input_mode_from_inputrc():
@@ -106,6 +101,48 @@ def parse_args():
         nargs='?',
         type=str,
         help='Evaluate a single zk command and exit')
+    parser.add_argument(
+        '--script',
+        help="Run the commands of a script file (or of stdin if '-') over a single "
+        "session, and exit")
+    parser.add_argument(
+        '--dump',
+        help="Browse a file created by the export command, instead of connecting to "
+        "zookeeper")
+    parser.add_argument(
+        '--mirror',
+        help="Load the subtree of a path in memory, kept current by watches, and answer "
+        "its reads locally")
+    parser.add_argument(
+        '--serve',
+        help="Run a daemon keeping the session open, and running the commands sent to "
+        "its Unix socket by --socket",
+        action='store_true')
+    parser.add_argument(
+        '--socket',
+        help="Send the --eval or --script commands to the daemon listening on this "
+        "socket. Default for --serve: %s" % (default_socket_path()),
+        action=EnvDefault,
+        required=False)
+    parser.add_argument(
+        '--trace',
+        help="Report the requests sent to zookeeper and the time spent by each command",
+        action='store_true')
+    parser.add_argument(
+        '--trace-output',
+        help="Append the profile of each command to a JSON lines file. Implies --trace")
+    parser.add_argument(
+        '--on-error',
+        help="What to do when a script command fails. Default: stop",
+        action=EnvDefault,
+        default='stop',
+        choices=ON_ERROR_CHOICES)
+    parser.add_argument(
+        '--yes',
+        help='Answer yes to all confirmation questions',
+        action=EnvDefault,
+        type=bool,
+        default=False)
     parser.add_argument(
         '--write',
         help='Authorize write operations (update/insert/remove)',
@@ -132,8 +169,41 @@ def parse_args():
     return parser.parse_args()
 
 
-def print_headers(zkcli):
-    print(zkcli.command(b'srvr'))
+def open_client(args, background=False):
+    """Return the client of the session: a zookeeper connection, or a dump file reader.
+
+    If `background` is True, the zookeeper session is connected in the
+    background, the requests sent in the meantime being queued.
+
+    """
+    if args.dump:
+        return DumpClient(open(args.dump, 'rb'))
+    zkcli = ExtendedKazooClient(hosts=args.zk_url, timeout=2, read_only=not args.write)
+    zkcli.connect_in_background = background
+    return zkcli
+
+
+def mirror_subtree(zkcli, path):
+    """Return a client answering the reads of the path subtree from an in-memory mirror"""
+    mirror = MirroredTree(zkcli, path)
+    start = time.monotonic()
+    try:
+        mirror.load()
+    except (NoNodeError, MirrorTooLarge) as exc:
+        print('Could not mirror %s: %s' % (path, exc), file=sys.stderr)
+        sys.exit(1)
+    print('Mirrored %d nodes of %s in %.2fs, using %s' % (
+        len(mirror), path, time.monotonic() - start, format_size(mirror.size)))
+    return MirrorClient(zkcli, mirror)
+
+
+def print_headers(zkcli, timeout=CONNECTION_TIMEOUT):
+    """Print the server headers once the session is connected"""
+    try:
+        wait_until_connected(zkcli, timeout=timeout)
+        print(zkcli.command(b'srvr'))
+    except ConnectionLoss:
+        print('Could not connect to zookeeper in %ds' % (timeout), file=sys.stderr)
 
 
 def render_prompt(step, read_only):
@@ -141,42 +211,77 @@ def render_prompt(step, read_only):
     return '(%s %d) > ' % (mode, step)
 
 
-def run_cmd(runner, cmd):
+def run_cmd(runner, cmd, stderr=None):
+    """Run the command and print its output. Return whether the command succeeded."""
     try:
-        out = runner.run(cmd)
+        with runner.traced(cmd, stream=stderr):
+            out = runner.run(cmd)
+            if out is not None:
+                print(out)
     except CommandValidationError as exc:
         # The command was invalid. Print command help and usage.
-        print(exc, end='\n\n')
-        print(command_usage(exc.command))
+        print(exc, end='\n\n', file=stderr)
+        print(command_usage(exc.command), file=stderr)
     except (
-        NoNodeError, NotEmptyError, UnknownCommand, UnauthorizedWrite
+        NoNodeError, NodeExistsError, NotEmptyError, BadVersionError, UnknownCommand,
+        UnauthorizedWrite, OSError, InvalidDump
     ) as exc:
-        print(exc)
+        print(exc, file=stderr)
+    except KazooException as exc:
+        # Any other error sent by zookeeper, such as a connection loss
+        print('Error: %s' % (str(exc) or exc.__class__.__name__), file=stderr)
     else:
-        if out is not None:
-            print(out)
+        return True
+    return False
 
 
-def main():  # pragma: no cover
-    cmd_index = 0
-    args = parse_args()
-    g.style = None if args.style == 'none' else styles.get_style_by_name(args.style)
+def run_on_daemon(args):  # pragma: no cover
+    """Run the --eval or --script commands on the daemon listening on the --socket path"""
+    options = dict(write=args.write, style=args.style, yes=args.yes)
+    if args.eval:
+        send_commands(args.socket, [args.eval], **options)
+        return
+    with open_script(args.script) as script:
+        nb_failures = send_commands(
+            args.socket, read_commands(script), on_error=args.on_error, **options)
+    sys.exit(1 if nb_failures else 0)
 
-    with ExtendedKazooClient(
-        hosts=args.zk_url,
-        timeout=2,
-        read_only=not args.write
-    ) as zkcli:
-        cmdrunner = ZkCommandRunner(zkcli)
-        if args.eval:
-            run_cmd(cmdrunner, args.eval)
-            return
 
-        print_headers(zkcli)
-        while True:
-            # We need a new completer for each command
-            completer = ZkCompleter(zkcli)
-            try:
+def interactive_loop(zkcli, cmdrunner, args):  # pragma: no cover
+    """Prompt for commands and run them until the user quits.
+
+    The prompt is displayed at once, while the server headers are fetched in
+    the background, and printed above it once the session is connected.
+
+    """
+    from prompt_toolkit.shortcuts import prompt
+    from prompt_toolkit.history import InMemoryHistory
+    from prompt_toolkit.auto_suggest import AutoSuggestFromHistory
+    from prompt_toolkit.patch_stdout import patch_stdout
+    try:
+        from prompt_toolkit.lexers import PygmentsLexer
+    except ImportError:
+        def PygmentsLexer(lexer):
+            return lexer
+    try:
+        from prompt_toolkit.styles.pygments import style_from_pygments_cls
+    except ImportError:
+        def style_from_pygments_cls(style):
+            return style
+    from .completion import ZkCompleter, PathCache
+    from .lexer import ZkCliLexer
+
+    history = InMemoryHistory()
+    auto_suggest = AutoSuggestFromHistory()
+    threading.Thread(target=print_headers, args=(zkcli,), daemon=True).start()
+    # The completion cache is shared by all the commands of the session
+    completion_cache = PathCache(zkcli)
+    cmd_index = 0
+    while True:
+        # We need a new completer for each command
+        completer = ZkCompleter(zkcli, cache=completion_cache)
+        try:
+            with patch_stdout():
                 cmd = prompt(
                     render_prompt(cmd_index, zkcli.read_only),
                     history=history,
@@ -185,14 +290,56 @@ def main():  # pragma: no cover
                     lexer=PygmentsLexer(ZkCliLexer),
                     style=style_from_pygments_cls(g.style),
                     vi_mode=args.input_mode == 'vi')
-                run_cmd(cmdrunner, cmd)
-            except (KeyboardInterrupt, EOFError):
-                if ask_for_confirmation('Quit?', confirm_on_exc=True):
-                    break
-            except Exception:
-                raise
-            finally:
-                cmd_index += 1
+            if cmd.strip():
+                # Commands typed while connecting are run once the session is connected
+                wait_until_connected(zkcli, timeout=CONNECTION_TIMEOUT)
+            run_cmd(cmdrunner, cmd)
+        except ConnectionLoss as exc:
+            print(exc, file=sys.stderr)
+        except (KeyboardInterrupt, EOFError):
+            if ask_for_confirmation('Quit?', confirm_on_exc=True):
+                break
+        finally:
+            cmd_index += 1
+
+
+def main():  # pragma: no cover
+    args = parse_args()
+    if args.style == 'none':
+        g.style = None
+    else:
+        from pygments.styles import get_style_by_name
+        g.style = get_style_by_name(args.style)
+    # When reading a script from stdin, there is no way to ask for confirmation
+    g.confirm = True if args.yes else (False if args.script == '-' else None)
+    interactive = not args.eval and not args.script and not args.serve
+    if args.socket and not args.serve and not interactive:
+        run_on_daemon(args)
+        return
+
+    # The prompt is displayed without waiting for the connection, unless a
+    # subtree has to be mirrored first
+    with open_client(args, background=interactive and not args.mirror) as zkcli:
+        if args.mirror:
+            zkcli = mirror_subtree(zkcli, args.mirror)
+        cmdrunner = ZkCommandRunner(zkcli)
+        if args.trace or args.trace_output:
+            trace_output = open(args.trace_output, 'a') if args.trace_output else None
+            cmdrunner.zkcli = cmdrunner.tracer = TracingClient(zkcli, output=trace_output)
+        if args.serve:
+            serve(zkcli, args.socket or default_socket_path(), writable=args.write)
+            return
+        if args.eval:
+            run_cmd(cmdrunner, args.eval)
+            return
+        if args.script:
+            with open_script(args.script) as script:
+                nb_failures = run_script(
+                    cmdrunner, read_commands(script),
+                    functools.partial(run_cmd, stderr=sys.stderr),
+                    on_error=args.on_error)
+            sys.exit(1 if nb_failures else 0)
+        interactive_loop(zkcli, cmdrunner, args)
 
 
 if __name__ == '__main__':
@@ -1,21 +1,43 @@
-import re
+import collections
+import contextlib
 import datetime
 import functools
+import itertools
 import tempfile
 import subprocess
 import os
+import re
+import sys
+import time
 
 import colored
-from kazoo.exceptions import NoNodeError, NotEmptyError
-
-from .lexer import COMMAND, PATH, QUOTED_STR, KEYWORDS, ZK_FOUR_LETTER_WORD
-from .formatting import colorize, columnize, PARENT_ZNODE_STYLE
-from .validation import validate_command_input, ask_for_confirmation
+from kazoo.exceptions import KazooException, ConnectionLoss, NoNodeError, NotEmptyError
+from kazoo.handlers.threading import KazooTimeoutError
+
+from .grammar import KEYWORDS
+from .formatting import (
+    colorize, columnize, format_size, write_lines, print_progress, PARENT_ZNODE_STYLE)
+from .validation import (
+    parse_command, tokenize, ask_for_confirmation, CommandValidationError)
+from .pipeline import pipelined, walk, delete_recursive, DEFAULT_BATCH_SIZE
+from .bench import run_benchmark, format_result, DEFAULT_BENCH_PATH, DEFAULT_MIX
+from .diff import (
+    diff_trees, sync_operations, sync_trees, parse_location, unified_diff, ADDED, REMOVED)
+from .dump import export_tree, import_tree
+from .search import find, grep, parse_size, ByteBudget
+from .latency import probe, format_histogram
+from .monitor import sample_ensemble, format_table, MetricsRecorder
+from .trace import TracingClient, format_profile
+from .usage import subtree_usage
+from .watch import TreeWatcher, render_events
+from .utils import join_path, relocate
+from .zk import ExtendedKazooClient
 
-# A CLI user-input token can either be a command, a path or a string
-TOKEN = r'(%s)' % '|'.join([COMMAND, PATH, QUOTED_STR, ZK_FOUR_LETTER_WORD])
 NODES_PER_LINE = 3
 
+# Number of children displayed in the du summary
+DU_LARGEST_CHILDREN = 10
+
 
 class UnauthorizedWrite(Exception):
     """Exception raised when a write operation is triggered in RO mode."""
@@ -67,12 +89,36 @@ def write_op(f):
 class ZkCommandRunner:
     """Object in charge of running the zookeeper commands."""
 
-    def __init__(self, zkcli):
+    def __init__(self, zkcli, client_factory=ExtendedKazooClient):
         self.zkcli = zkcli
+        self.client_factory = client_factory  # to connect to other ensembles
+        self.tracer = None  # the TracingClient wrapping zkcli, in timing mode
+
+    @contextlib.contextmanager
+    def _connect(self, location, read_only=True):
+        """Yield the client and path of a local path, or of a zk://hosts/path location"""
+        hosts, path = parse_location(location)
+        if hosts is None:
+            yield self.zkcli, path
+            return
+        with self._open(hosts, read_only=read_only) as zkcli:
+            yield zkcli, path
+
+    @contextlib.contextmanager
+    def _open(self, hosts, read_only=True):
+        """Yield a client connected to the argument hosts, possibly followed by a chroot"""
+        with contextlib.ExitStack() as stack:
+            # Only the connection errors are reported as such, not the command ones
+            try:
+                zkcli = stack.enter_context(
+                    self.client_factory(hosts=hosts, timeout=2, read_only=read_only))
+            except (KazooException, KazooTimeoutError) as exc:
+                raise ConnectionLoss('Could not connect to %s: %s' % (
+                    hosts, str(exc) or exc.__class__.__name__)) from exc
+            yield zkcli
 
     def _tokenize(self, command_str):
-        tokens = re.findall(TOKEN, command_str)
-        return [tok[0].strip() for tok in tokens]
+        return tokenize(command_str)
 
     def exit(self):
         """Close the shell"""
@@ -108,50 +154,253 @@ class ZkCommandRunner:
         except NoNodeError:
             raise NoNodeError('%s does not exist' % (path))
 
+        # Fetch the stats of all children in a pipelined batch, instead of
+        # performing one round-trip per child to know whether it has children
         nodes = sorted(nodes)
         fmt_nodes = []
-        for node in nodes:
-            if self.zkcli.get_children('/'.join((path, node))):
+        children = [join_path(path, node) for node in nodes]
+        stats = pipelined(self.zkcli.exists_async, children)
+        for node, (_, stat) in zip(nodes, stats):
+            if stat is not None and stat.numChildren:
                 node = colored.stylize(node, PARENT_ZNODE_STYLE)
             fmt_nodes.append(node)
 
         nodes = columnize(fmt_nodes, NODES_PER_LINE)
         return nodes
 
-    def _tree(self, path, level, full):
-        padding = '│   ' * (level - 1) + '├── ' if level else ''
-        print_path = path if full else (path.rsplit('/')[-1] or '/')
+    def _tree(self, path, full, depth=None, max_nodes=None):
+        def lines():
+            walker = walk(self.zkcli, path, max_depth=depth)
+            nodes = itertools.islice(walker, max_nodes) if max_nodes is not None else walker
+            for node in nodes:
+                padding = '│   ' * (node.depth - 1) + '├── ' if node.depth else ''
+                print_path = node.path if full else (node.path.rsplit('/')[-1] or '/')
+                if node.stat.numChildren:
+                    print_path = colored.stylize(print_path, PARENT_ZNODE_STYLE)
+                yield padding + print_path
+            if max_nodes is not None and next(walker, None) is not None:
+                yield '[truncated after %s nodes]' % (max_nodes)
+
+        write_lines(lines())
+
+    def tree(self, path, depth=None, max_nodes=None):
+        """Display a tree of a ZNode recursively
+
+        Usage: tree <path> [--depth N] [--max-nodes N]
+        Examples: tree /test
+                  tree /test --depth 2 --max-nodes 1000
+
+        """
+        self._tree(path, False, depth, max_nodes)
+
+    def ftree(self, path, depth=None, max_nodes=None):
+        """Display a tree of a ZNode recursively with full path
+
+        Usage: ftree <path> [--depth N] [--max-nodes N]
+        Examples: ftree /test
+                  ftree /test --depth 2 --max-nodes 1000
+
+        """
+        self._tree(path, True, depth, max_nodes)
+
+    def diff(self, path_a, path_b):
+        """Display the differences between two subtrees, possibly on another ensemble
+
+        Usage: diff <path> <path>
+        Examples: diff /config/staging /config/prod
+                  diff /config zk://prod-zk1:2181,prod-zk2:2181/config
+
+        Nodes only present in the first or second subtree are displayed with
+        a - or + prefix, and nodes with different data with a ~ prefix,
+        followed by the diff of their data.
 
+        """
+        counts = collections.Counter()
+        prefixes = {ADDED: '+', REMOVED: '-'}
+
+        def lines():
+            with self._connect(path_a) as (zkcli_a, root_a), \
+                    self._connect(path_b) as (zkcli_b, root_b):
+                for difference in diff_trees(zkcli_a, root_a, zkcli_b, root_b):
+                    counts[difference.status] += 1
+                    if difference.status in prefixes:
+                        yield '%s %s' % (prefixes[difference.status], difference.path)
+                        continue
+                    yield '~ %s' % (difference.path)
+                    yield from unified_diff(
+                        difference.data_a, difference.data_b,
+                        relocate(difference.path, '/', path_a),
+                        relocate(difference.path, '/', path_b))
+            yield '%d added, %d removed, %d changed' % (
+                counts['added'], counts['removed'], counts['changed'])
+
+        write_lines(lines(), batch_size=1)
+
+    def sync(self, src_path, dst_path, delete=False, dry_run=False,
+             batch_size=DEFAULT_BATCH_SIZE, rate=None):
+        """Copy the missing and different ZNodes of a subtree to another path or ensemble
+
+        Usage: sync <src-path> <dst-path> [--delete] [--dry-run] [--batch-size N]
+                                          [--rate OPS_PER_SEC]
+        Examples: sync /config /config-backup
+                  sync /config zk://prod-zk1:2181/config --dry-run
+                  sync zk://old-zk:2181/ / --delete --rate 1000
+
+        Only the nodes missing from the destination, or having different data,
+        are written. Extraneous destination nodes are deleted with --delete.
+        Except with --dry-run, the shell must be in write mode, even when the
+        destination is on another ensemble.
+
+        """
+        if dry_run:
+            prefixes = {'create': '+', 'set_data': '~', 'delete': '-'}
+            with self._connect(src_path) as (src_zkcli, src_root), \
+                    self._connect(dst_path) as (dst_zkcli, dst_root):
+                write_lines(
+                    ('%s %s' % (prefixes[operation[0]], operation[1])
+                     for operation in sync_operations(
+                         src_zkcli, src_root, dst_zkcli, dst_root, delete=delete)),
+                    batch_size=1)
+            return
+        if self.zkcli.read_only:
+            raise UnauthorizedWrite('Un-authorized write operation in read-only mode')
+        if delete and not ask_for_confirmation(
+                'Are you sure you want to delete the nodes of %s missing from %s?' % (
+                    dst_path, src_path)):
+            return
+        with self._connect(src_path) as (src_zkcli, src_root), \
+                self._connect(dst_path, read_only=False) as (dst_zkcli, dst_root):
+            counts = sync_trees(
+                src_zkcli, src_root, dst_zkcli, dst_root, delete=delete,
+                batch_size=batch_size, rate=rate)
+        return 'Synchronized %s: %d created, %d updated, %d deleted' % (
+            dst_path, counts['created'], counts['updated'], counts['deleted'])
+
+    def du(self, path, depth=1, largest=DU_LARGEST_CHILDREN):
+        """Display the data size and number of nodes of a ZNode subtree
+
+        Usage: du <path> [--depth N]
+        Examples: du /test
+                  du /test --depth 3
+
+        The subtrees located at most N levels below the path (1 by default) are
+        displayed as soon as they are walked, followed by the largest children.
+
+        """
+        children = []
+
+        def lines():
+            for usage in subtree_usage(self.zkcli, path, max_depth=depth):
+                if usage.depth == 1:
+                    children.append(usage)
+                yield '%-8s %-8d %s' % (
+                    format_size(usage.data_length), usage.nb_nodes, usage.path)
+            if children:
+                yield '\nLargest children:'
+                children.sort(key=lambda usage: usage.data_length, reverse=True)
+                for usage in children[:largest]:
+                    yield '%-8s %-8d %s' % (
+                        format_size(usage.data_length), usage.nb_nodes, usage.path)
+
+        # Stream the results, as walking a large subtree can take a while
+        write_lines(lines(), batch_size=1)
+
+    def find(self, path, depth=None, **criteria):
+        """Find the ZNodes of a subtree matching all the given criteria
+
+        Usage: find <path> [--name GLOB] [--regex REGEX] [--ephemeral] [--owner SESSION_ID]
+                           [--mtime [+-]DAYS] [--size [+-]N[K|M|G]] [--children [+-]N]
+                           [--depth N]
+        Examples: find / --ephemeral --owner 0x1000a2b3c4d0000
+                  find /config --name '*.json' --size +100K
+                  find / --children +1000 --depth 3
+                  find /locks --mtime +30  # not modified for more than 30 days
+
+        +N means more than N, -N less than N, and N exactly N. Matching nodes
+        are displayed as soon as they are found.
+
+        """
+        for pattern in ('name', 'regex'):
+            if criteria.get(pattern):
+                criteria[pattern] = criteria[pattern].strip("'").strip('"')
         try:
-            nodes = self.zkcli.get_children(path)
+            nodes = find(self.zkcli, path, max_depth=depth, **criteria)
+        except re.error as exc:
+            raise CommandValidationError(
+                'find', 'Invalid regex %r: %s' % (criteria['regex'], exc))
+        matches = (node.path for node in nodes)
+        write_lines(matches, batch_size=1)
 
-            if nodes:
-                print_path = colored.stylize(print_path, PARENT_ZNODE_STYLE)
-            print(padding + print_path)
+    def grep(self, pattern, path, ignore_case=False, max_bytes=None):
+        """Search a pattern in the data of the ZNodes of a subtree
 
-            for node in nodes:
-                node = path + node if path == '/' else path + '/' + node
-                self._tree(node, level+1, full)
-        except NoNodeError as exc:
-            raise NoNodeError('%s does not exist' % (path))
+        Usage: grep <pattern> <path> [--ignore-case] [--max-bytes N[K|M|G]]
+        Examples: grep db-01.example.com /services
+                  grep 'timeout.*ms' /config --ignore-case --max-bytes 100M
 
-    def tree(self, path):
-        """Display a tree of a ZNode recursively
+        Each matching line is displayed after the path of its node. The search
+        stops before fetching more than --max-bytes of node data.
+
+        """
+        pattern = pattern.strip("'").strip('"')
+        budget = ByteBudget(parse_size(max_bytes) if max_bytes else None)
+
+        try:
+            matches = grep(self.zkcli, pattern, path, ignore_case, budget)
+        except re.error as exc:
+            raise CommandValidationError('grep', 'Invalid pattern %r: %s' % (pattern, exc))
+
+        def lines():
+            for node_path, line in matches:
+                yield '%s: %s' % (colored.stylize(node_path, PARENT_ZNODE_STYLE), line)
+            if budget.exhausted:
+                yield '[stopped after fetching %s]' % (format_size(budget.fetched))
+
+        write_lines(lines(), batch_size=1)
 
-        Usage: tree <path>
-        Example: tree /test
+    def export(self, path, filename, compression='none'):
+        """Export a ZNode and its descendants to a local file
+
+        Usage: export <path> <file> [--compression none|gzip|lzma]
+        Examples: export /config config.izk
+                  export /config config.izk.xz --compression lzma
 
         """
-        self._tree(path, 0, False)
+        if os.path.isdir(filename):
+            raise IsADirectoryError('%s is a directory' % (filename))
+        # Export to a temporary file, only replacing the target once complete
+        directory, basename = os.path.split(os.path.abspath(filename))
+        f = tempfile.NamedTemporaryFile(
+            dir=directory, prefix='.%s.' % (basename), suffix='.tmp', delete=False)
+        try:
+            with f:
+                nb_nodes = export_tree(self.zkcli, path, f, codec=compression)
+            os.replace(f.name, filename)
+        except BaseException:
+            os.unlink(f.name)
+            raise
+        return 'Exported %d nodes to %s' % (nb_nodes, filename)
 
-    def ftree(self, path):
-        """Display a tree of a ZNode recursively with full path
+    @write_op
+    def import_(self, filename, path, on_conflict='skip', batch_size=DEFAULT_BATCH_SIZE,
+                rate=None):
+        """Import the ZNodes of an exported file under a path
+
+        Usage: import <file> <path> [--on-conflict skip|overwrite|fail]
+                                    [--batch-size N] [--rate OPS_PER_SEC]
+        Examples: import config.izk /config
+                  import config.izk /config --on-conflict overwrite
 
-        Usage: ftree <path>
-        Example: ftree /test
+        The 'fail' conflict policy aborts the import when an existing node
+        has a different version than the exported one.
 
         """
-        self._tree(path, 0, True)
+        with open(filename, 'rb') as f:
+            counts = import_tree(
+                self.zkcli, f, path, on_conflict=on_conflict, batch_size=batch_size,
+                rate=rate, progress=functools.partial(print_progress, label='Imported'))
+        return 'Imported %s: %d created, %d updated, %d skipped' % (
+            path, counts['created'], counts['updated'], counts['skipped'])
 
     def _get(self, path):
         try:
@@ -246,15 +495,26 @@ class ZkCommandRunner:
                 raise NoNodeError('%s does not exist' % (path))
 
     @write_op
-    def rmr(self, path):
+    def rmr(self, path, rate=None, batch_size=DEFAULT_BATCH_SIZE):
         """Recursively delete all children ZNodes, along with argument node.
 
-        Usage: rmr <path>
-        Example: rmr /test
+        Usage: rmr <path> [--rate OPS_PER_SEC] [--batch-size N]
+        Examples: rmr /test
+                  rmr /test --rate 1000 --batch-size 100
 
         """
         if ask_for_confirmation("You're about to recursively delete %s. Proceed?" % (path)):
-            self.zkcli.delete(path, recursive=True)
+            try:
+                delete_recursive(
+                    self.zkcli, path,
+                    batch_size=batch_size,
+                    rate=rate,
+                    progress=functools.partial(print_progress, label='Deleted'))
+            except NoNodeError:
+                raise NoNodeError('%s does not exist' % (path))
+            except NotEmptyError:
+                raise NotEmptyError(
+                    'Nodes were created under %s while deleting it: run rmr again' % (path))
 
     def stat(self, path):
         """Display a ZNode's metadata
@@ -282,6 +542,50 @@ class ZkCommandRunner:
         ]
         return '\n'.join(lines)
 
+    def mirror(self):
+        """Display the status of the local mirror of a subtree
+
+        Usage: mirror
+
+        The mirror is set up by running izk with --mirror <path>.
+
+        """
+        mirror = getattr(self.zkcli, 'mirror', None)
+        if mirror is None:
+            return 'No mirror. Run izk with --mirror <path> to set one up'
+        if not mirror.enabled:
+            return 'Mirror of %s disabled, as it exceeded %s' % (
+                mirror.path, format_size(mirror.max_bytes))
+        if not mirror.covers(mirror.path):
+            return 'Mirror of %s reloading: its reads are sent to the server' % (
+                mirror.path)
+        return 'Mirroring %s: %d nodes, using %s out of %s' % (
+            mirror.path, len(mirror), format_size(mirror.size),
+            format_size(mirror.max_bytes))
+
+    def watch(self, path, recursive=False, count=None):
+        """Display the changes of a ZNode, or of its whole subtree, as they happen
+
+        Usage: watch <path> [--recursive] [--count N]
+        Examples: watch /config
+                  watch /services --recursive
+                  watch /leader --count 1  # wait for the next change
+
+        Press Ctrl-C to stop watching. The changes of the same kind on the same
+        node are merged, and displayed a few times per second.
+
+        """
+        watcher = TreeWatcher(self.zkcli, path, recursive=recursive)
+        watcher.start()
+        print('Watching %s. Press Ctrl-C to stop' % (path), file=sys.stderr)
+        try:
+            for lines in render_events(watcher, max_events=count):
+                write_lines(lines)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.stop()
+
     def toggle_write(self):
         """Activate/deactivate read-only mode
 
@@ -290,20 +594,168 @@ class ZkCommandRunner:
         """
         self.zkcli.read_only = not self.zkcli.read_only
 
-    def raw(self, _4lcmd):
+    def top(self, interval=2, count=None, output=None, format='jsonl'):
+        """Display live metrics of all the ensemble nodes
+
+        Usage: top [--interval SECONDS] [--count N] [--output FILE] [--format csv|jsonl]
+        Examples: top
+                  top --interval 10 --output metrics.jsonl
+                  top --count 360 --output metrics.csv --format csv
+
+        The mntr and cons commands are sent to all the ensemble nodes every
+        interval, and the packet counters are displayed as rates per second.
+        The samples are appended to the output file, if any. Press Ctrl-C to stop.
+
+        """
+        recorder_file = open(output, 'a', newline='') if output else None
+        recorder = MetricsRecorder(recorder_file, fmt=format) if output else None
+        previous = {}
+        clear = '\x1b[H\x1b[2J' if sys.stdout.isatty() else ''
+        try:
+            for iteration in itertools.count(1):
+                samples = sample_ensemble(self.zkcli)
+                if recorder is not None:
+                    recorder.write(samples)
+                sys.stdout.write(clear)
+                write_lines(format_table(samples, previous))
+                previous = {sample.host: sample for sample in samples}
+                if count is not None and iteration >= count:
+                    break
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if recorder_file is not None:
+                recorder_file.close()
+
+    @write_op
+    def bench(
+        self, path=DEFAULT_BENCH_PATH, requests=1000, mix=DEFAULT_MIX, size=128, nodes=100,
+        concurrency=32, seed=0
+    ):
+        """Measure the throughput and latency of a mix of reads and writes
+
+        Usage: bench [path] [--requests N] [--mix OP=WEIGHT,...] [--size BYTES] [--nodes N]
+                     [--concurrency C] [--seed N]
+        Examples: bench
+                  bench /tmp/bench --requests 100000 --mix read=60,write=20,create=20
+                  bench --size 4096 --concurrency 1
+
+        The operations are read, write, create and delete. They are drawn at
+        random from the mix, and sent on the nodes of a scratch path, which
+        must not exist, and is deleted with all its nodes afterwards. The same
+        seed sends the same operations.
+
+        """
+        try:
+            result = run_benchmark(
+                self.zkcli, requests=requests, path=path, mix=mix, size=size, nodes=nodes,
+                concurrency=concurrency, seed=seed)
+        except ValueError as exc:  # an invalid mix or number of nodes
+            raise CommandValidationError('bench', str(exc))
+        return '\n'.join(format_result(result))
+
+    def ping(self, path='/', count=100, concurrency=1, get=False, per_host=False):
+        """Measure the latency of requests sent to zookeeper
+
+        Usage: ping [path] [--count N] [--concurrency C] [--get] [--per-host]
+        Examples: ping
+                  ping /config --count 1000 --concurrency 10
+                  ping --per-host  # measure the latency of each ensemble node
+
+        exists requests are sent on the path, or get requests with --get, with
+        at most C requests in flight, and the minimum, median, 90th and 99th
+        percentiles and maximum latencies are displayed. With --per-host, a
+        short-lived session is opened to each ensemble node in turn.
+
+        """
+        operation = 'get' if get else 'exists'
+        if not per_host:
+            histogram = probe(
+                self.zkcli, path, count=count, concurrency=concurrency, operation=operation)
+            return '%s %s: %s' % (operation, path, format_histogram(histogram))
+
+        # The ensemble nodes are unknown when browsing a dump
+        hosts = getattr(self.zkcli, 'hosts', None)
+        if not hosts:
+            return 'No ensemble node to ping: --per-host requires a zookeeper connection'
+
+        chroot = getattr(self.zkcli, 'chroot', None) or ''
+
+        def lines():
+            for host, port in hosts:
+                try:
+                    with self._open('%s:%d%s' % (host, port, chroot)) as zkcli:
+                        histogram = probe(
+                            zkcli, path, count=count, concurrency=concurrency,
+                            operation=operation)
+                except KazooException as exc:
+                    yield '%s:%d Error: %s' % (
+                        host, port, str(exc) or exc.__class__.__name__)
+                else:
+                    yield '%s:%d %s' % (host, port, format_histogram(histogram))
+
+        write_lines(lines(), batch_size=1)
+
+    def raw(self, _4lcmd, all=False):
         """Send the 4-letter-word command to the zookeeper server
 
-        Usage: raw <4-letter-word>
-        Example: raw srvr
+        Usage: raw <4-letter-word> [--all]
+        Examples: raw srvr
+                  raw mntr --all  # sends the command to all the ensemble nodes
 
         """
         _4lcmd = _4lcmd.encode('utf-8')
-        return self.zkcli.command(_4lcmd)
+        if not all:
+            return self.zkcli.command(_4lcmd)
+        results = self.zkcli.command_all(_4lcmd)
+        return '\n'.join(
+            '%s\n%s' % (colored.stylize(host, PARENT_ZNODE_STYLE), out.rstrip('\n'))
+            for host, out in results.items())
+
+    def timing(self, state=None):
+        """Report the requests sent to zookeeper and the time spent by each command
+
+        Usage: timing [on|off]
+        Examples: timing on
+                  timing  # toggles the timing mode
+
+        After each command, the number of requests sent by operation, their
+        payload size, the time spent waiting for zookeeper versus locally, and
+        the slowest request are displayed.
+
+        """
+        enable = self.tracer is None if state is None else state == 'on'
+        if enable and self.tracer is None:
+            self.zkcli = self.tracer = TracingClient(self.zkcli)
+        elif not enable and self.tracer is not None:
+            self.zkcli, self.tracer = self.tracer.client, None
+        return 'Timing is %s' % ('on' if enable else 'off')
+
+    @contextlib.contextmanager
+    def traced(self, command_str, stream=None):
+        """Report the profile of the command run in the block, in timing mode"""
+        tracer = self.tracer
+        if tracer is None or not command_str.strip():
+            yield
+            return
+        tracer.start(command_str.strip())
+        try:
+            yield
+        finally:
+            profile = tracer.stop()
+            if self.tracer is tracer:  # not reported if timing was just switched off
+                print(format_profile(profile), file=stream or sys.stderr)
 
-    @validate_command_input
     def run(self, command_str):
-        if command_str:
-            tokens = self._tokenize(command_str)
-            command, args = tokens[0].strip(), tokens[1:]
-            out = getattr(self, command)(*args)
+        if command_str.strip():
+            started_at = time.perf_counter()
+            command = parse_command(command_str)
+            if self.tracer is not None:
+                self.tracer.profile.parse_time += time.perf_counter() - started_at
+            out = getattr(self, command.name)(*command.args, **command.kwargs)
             return out
+
+
+# import is a reserved keyword, and can't be used as a method name
+setattr(ZkCommandRunner, 'import', ZkCommandRunner.import_)
@@ -0,0 +1,119 @@
+import sys
+import contextlib
+
+from .pipeline import DEFAULT_WINDOW
+from .runner import ZkCommandRunner
+from .validation import parse_command, UnknownCommand, CommandValidationError
+
+# The read commands that can be sent ahead of time, mapped to the kazoo method they call
+PIPELINABLE_COMMANDS = {
+    'get': 'get',
+    'ls': 'get_children',
+    'stat': 'exists',
+}
+
+ON_ERROR_CHOICES = ('stop', 'continue')
+
+
+class PrefetchingClient:
+    """Proxy of a kazoo client, answering reads from requests sent ahead of time."""
+
+    def __init__(self, zkcli):
+        self._zkcli = zkcli
+        self._prefetched = {}
+
+    def __getattr__(self, name):
+        return getattr(self._zkcli, name)
+
+    def prefetch(self, method, path):
+        if (method, path) not in self._prefetched:
+            self._prefetched[method, path] = getattr(self._zkcli, method + '_async')(path)
+
+    def _result(self, method, path):
+        async_result = self._prefetched.pop((method, path), None)
+        if async_result is None:
+            async_result = getattr(self._zkcli, method + '_async')(path)
+        return async_result.get()
+
+    def get(self, path, watch=None):
+        if watch is not None:
+            return self._zkcli.get(path, watch=watch)
+        return self._result('get', path)
+
+    def get_children(self, path, watch=None, include_data=False):
+        if watch is not None or include_data:
+            return self._zkcli.get_children(path, watch=watch, include_data=include_data)
+        return self._result('get_children', path)
+
+    def stat(self, path):
+        return self._result('exists', path)
+
+
+def read_commands(lines):
+    """Yield the commands of a script, skipping blank lines and comments"""
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith('#'):
+            yield line
+
+
+@contextlib.contextmanager
+def open_script(filename):
+    """Open the script file, or read the script from stdin if filename is '-'"""
+    if filename == '-':
+        yield sys.stdin
+    else:
+        with open(filename) as script:
+            yield script
+
+
+def _pipelinable(command_str):
+    try:
+        command = parse_command(command_str)
+    except (UnknownCommand, CommandValidationError):
+        return None
+    if command.name in PIPELINABLE_COMMANDS:
+        return PIPELINABLE_COMMANDS[command.name], command.args[0]
+
+
+def run_script(runner, commands, run_cmd, on_error='stop', window=DEFAULT_WINDOW):
+    """Run the commands over the runner session, and return the number of failed commands.
+
+    The requests of consecutive read commands (get, ls, stat) are sent ahead
+    of time, at most `window` at a time, and the commands are then run in the
+    input order, so that their output is identical to a sequential run. If
+    `on_error` is 'stop', the script is aborted after the first failure.
+
+    """
+    prefetching_client = PrefetchingClient(runner.zkcli)
+    read_runner = ZkCommandRunner(prefetching_client)
+    read_runner.tracer = runner.tracer
+    nb_failures = 0
+    batch = []
+
+    def execute(cmd_runner, command_str):
+        """Run the command, and return whether the script should go on"""
+        nonlocal nb_failures
+        if run_cmd(cmd_runner, command_str):
+            return True
+        nb_failures += 1
+        return on_error != 'stop'
+
+    def flush():
+        for _, prefetch in batch:
+            prefetching_client.prefetch(*prefetch)
+        pending, batch[:] = batch[:], []
+        return all(execute(read_runner, command_str) for command_str, _ in pending)
+
+    for command_str in commands:
+        prefetch = _pipelinable(command_str)
+        if prefetch is not None:
+            batch.append((command_str, prefetch))
+            if len(batch) < window:
+                continue
+        if not flush():
+            return nb_failures
+        if prefetch is None and not execute(runner, command_str):
+            return nb_failures
+    flush()
+    return nb_failures
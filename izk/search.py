@@ -0,0 +1,149 @@
+import fnmatch
+import posixpath
+import re
+import time
+
+from .pipeline import pipelined, walk
+
+# Multipliers of the size suffixes accepted by the --size predicate
+SIZE_UNITS = {'': 1, 'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+SIZE = re.compile(r'([+-]?\d+)([KMG]?)')
+
+SECONDS_PER_DAY = 24 * 3600
+
+
+def compare(value, criteria, scale=1):
+    """Compare a value to a find-like criteria: '+N' (more than N), '-N' (less) or 'N'"""
+    reference = int(criteria) * scale
+    if criteria.startswith('+'):
+        return value > reference
+    elif criteria.startswith('-'):
+        return value < -reference
+    return value == reference
+
+
+def compile_predicates(
+    name=None, regex=None, ephemeral=False, owner=None, mtime=None, size=None,
+    children=None, now=None
+):
+    """Return the list of predicates that a node must all match, each taking a WalkedNode.
+
+    - name: glob that the node name must match
+    - regex: regular expression that the node path must contain
+    - ephemeral: match ephemeral nodes only
+    - owner: id of the session owning the ephemeral nodes, in decimal or hexadecimal
+    - mtime: days since the node data was last modified (+N, -N or N)
+    - size: size of the node data, in bytes or with a K, M or G suffix (+N, -N or N)
+    - children: number of children of the node (+N, -N or N)
+
+    """
+    predicates = []
+    if name is not None:
+        predicates.append(
+            lambda node: fnmatch.fnmatchcase(posixpath.basename(node.path), name))
+    if regex is not None:
+        pattern = re.compile(regex)
+        predicates.append(lambda node: pattern.search(node.path) is not None)
+    if ephemeral:
+        predicates.append(lambda node: node.stat.ephemeralOwner != 0)
+    if owner is not None:
+        session_id = int(owner, 16) if owner.startswith('0x') else int(owner)
+        predicates.append(lambda node: node.stat.ephemeralOwner == session_id)
+    if mtime is not None:
+        now = time.time() if now is None else now
+        predicates.append(lambda node: compare(
+            int(now - node.stat.mtime / 1000) // SECONDS_PER_DAY, mtime))
+    if size is not None:
+        criteria, unit = SIZE.fullmatch(size).groups()
+        predicates.append(
+            lambda node: compare(node.stat.dataLength, criteria, SIZE_UNITS[unit]))
+    if children is not None:
+        predicates.append(lambda node: compare(node.stat.numChildren, children))
+    return predicates
+
+
+def find(zkcli, path, max_depth=None, **criteria):
+    """Return an iterator over the WalkedNode of the path subtree matching all the criteria.
+
+    The subtree is walked concurrently, with a bounded number of requests in
+    flight, and the matching nodes are yielded as soon as they are walked. The
+    walk does not descend below `max_depth`, and as the stat of each node is
+    fetched along with its children, no request is sent to evaluate the
+    predicates (see compile_predicates for the available criteria). An invalid
+    regex raises re.error at once, before the walk starts.
+
+    """
+    predicates = compile_predicates(**criteria)
+    return (
+        node for node in walk(zkcli, path, max_depth=max_depth)
+        if all(predicate(node) for predicate in predicates))
+
+
+def parse_size(size):
+    """Return the number of bytes of a size such as 512, 10K or 2M"""
+    number, unit = SIZE.fullmatch(size).groups()
+    return int(number) * SIZE_UNITS[unit]
+
+
+class ByteBudget:
+    """Count the bytes fetched by a search, until a maximum is reached."""
+
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self.fetched = 0
+        self.exhausted = False
+
+    def spend(self, nb_bytes):
+        """Return whether nb_bytes can be fetched without exceeding the maximum"""
+        if self.max_bytes is not None and self.fetched + nb_bytes > self.max_bytes:
+            self.exhausted = True
+            return False
+        self.fetched += nb_bytes
+        return True
+
+
+def matching_lines(data, pattern):
+    """Yield each line of the data matching the compiled bytes pattern, decoded"""
+    position = 0
+    # The position can step past the end, after a match on the last line
+    while position < len(data):
+        match = pattern.search(data, position)
+        if match is None:
+            return
+        start = data.rfind(b'\n', 0, match.start()) + 1
+        end = data.find(b'\n', match.end())
+        end = len(data) if end == -1 else end
+        yield data[start:end].decode('utf-8', 'replace')
+        position = end + 1
+
+
+def grep(zkcli, pattern, path, ignore_case=False, budget=None):
+    """Return an iterator over a (path, line) tuple for each subtree data line matching.
+
+    The data of the walked nodes is fetched through a bounded pipeline of
+    get requests, skipping the nodes that the stat shows to be empty, and is
+    searched as bytes, only decoding the matching lines. The search stops
+    before fetching the node that would exceed the ByteBudget, if any. An
+    invalid pattern raises re.error at once, before the walk starts.
+
+    """
+    pattern = re.compile(pattern.encode('utf-8'), re.IGNORECASE if ignore_case else 0)
+    return _grep(zkcli, pattern, path, budget or ByteBudget())
+
+
+def _grep(zkcli, pattern, path, budget):
+    def nodes_to_fetch():
+        for node in walk(zkcli, path):
+            if not node.stat.dataLength:
+                continue
+            if not budget.spend(node.stat.dataLength):
+                return
+            yield node
+
+    results = pipelined(lambda node: zkcli.get_async(node.path), nodes_to_fetch())
+    for node, result in results:
+        if result is None:
+            continue  # the node was deleted in the meantime
+        data, _ = result
+        for line in matching_lines(data, pattern):
+            yield node.path, line
@@ -0,0 +1,247 @@
+"""Instrumentation of the requests sent to zookeeper by the shell commands.
+
+The client of the runner is wrapped in a TracingClient, recording the
+number, payload size and latency of the requests of each command in a
+CommandProfile, along with the time spent waiting for their responses.
+Payload sizes count the paths, data and children names, but not the
+protocol headers.
+
+"""
+import collections
+import json
+import threading
+import time
+
+from .formatting import format_size
+
+TracedRequest = collections.namedtuple('TracedRequest', 'operation path latency')
+
+
+class CommandProfile:
+    """The requests sent, and the time spent, while running a command."""
+
+    def __init__(self, command=''):
+        self.command = command
+        self.started_at = time.perf_counter()
+        self.elapsed = None
+        self.requests = collections.Counter()  # operation -> number of requests
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.parse_time = 0.0
+        self.wait_time = 0.0  # time blocked waiting for responses
+        self.slowest = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(self.requests.values())
+
+    def sent(self, operation, bytes_out):
+        with self._lock:
+            self.requests[operation] += 1
+            self.bytes_out += bytes_out
+
+    def received(self, request, bytes_in):
+        with self._lock:
+            self.bytes_in += bytes_in
+            if self.slowest is None or request.latency > self.slowest.latency:
+                self.slowest = request
+
+    def waited(self, duration):
+        with self._lock:
+            self.wait_time += duration
+
+    def stop(self):
+        self.elapsed = time.perf_counter() - self.started_at
+
+    @property
+    def local_time(self):
+        """Time spent by izk itself: parsing, formatting and rendering"""
+        return max(0.0, (self.elapsed or 0.0) - self.wait_time - self.parse_time)
+
+    def to_dict(self):
+        return {
+            'command': self.command,
+            'requests': len(self),
+            'operations': dict(self.requests),
+            'bytes_out': self.bytes_out,
+            'bytes_in': self.bytes_in,
+            'elapsed': round(self.elapsed or 0.0, 6),
+            'wait': round(self.wait_time, 6),
+            'parse': round(self.parse_time, 6),
+            'local': round(self.local_time, 6),
+            'slowest': self.slowest._asdict() if self.slowest else None,
+        }
+
+
+def format_profile(profile):
+    """Return a one line summary of the command profile"""
+    def ms(seconds):
+        return '%.2fms' % (seconds * 1000)
+
+    operations = ', '.join(
+        '%s %d' % (operation, count) for operation, count in profile.requests.most_common())
+    line = '%d requests%s, %s out, %s in' % (
+        len(profile), ' (%s)' % (operations) if operations else '',
+        format_size(profile.bytes_out), format_size(profile.bytes_in))
+    line += ' | %s total: %s waiting for zookeeper, %s parsing, %s local' % (
+        ms(profile.elapsed or 0.0), ms(profile.wait_time), ms(profile.parse_time),
+        ms(profile.local_time))
+    if profile.slowest is not None:
+        line += ' | slowest: %s %s %s' % (
+            profile.slowest.operation, profile.slowest.path, ms(profile.slowest.latency))
+    return line
+
+
+def _response_size(operation, value):
+    if operation == 'get':
+        return len(value[0] or b'')
+    if operation == 'get_children':
+        children = value[0] if isinstance(value, tuple) else value
+        return sum(len(child) for child in children)
+    return 0
+
+
+class _TracedResult:
+    """Async result measuring the time spent blocked waiting for the response."""
+
+    def __init__(self, async_result, profile):
+        self._async_result = async_result
+        self._profile = profile
+
+    def __getattr__(self, name):
+        return getattr(self._async_result, name)
+
+    def get(self, block=True, timeout=None):
+        started_at = time.perf_counter()
+        try:
+            return self._async_result.get(block, timeout)
+        finally:
+            self._profile.waited(time.perf_counter() - started_at)
+
+
+class _TracedTransaction:
+    """Proxy of a transaction, tracing its commit as a single multi request."""
+
+    def __init__(self, transaction, client):
+        self._transaction = transaction
+        self._client = client
+
+    def __getattr__(self, name):
+        return getattr(self._transaction, name)
+
+    def commit_async(self):
+        return self._client._trace('multi', '', 0, self._transaction.commit_async)
+
+    def commit(self):
+        return self.commit_async().get()
+
+
+class TracingClient:
+    """Proxy of a kazoo client, recording the requests sent in the current profile.
+
+    Each finished profile is appended as a JSON line to `output`, if set.
+
+    """
+
+    def __init__(self, zkcli, output=None):
+        self.client = zkcli
+        self.output = output
+        self.profile = CommandProfile()
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    @property
+    def read_only(self):
+        return self.client.read_only
+
+    @read_only.setter
+    def read_only(self, value):
+        self.client.read_only = value
+
+    def start(self, command=''):
+        """Start recording the profile of a new command, and return it"""
+        self.profile = CommandProfile(command)
+        return self.profile
+
+    def stop(self):
+        """Stop recording the current profile, write it to the output, and return it"""
+        profile = self.profile
+        profile.stop()
+        if self.output is not None:
+            self.output.write(json.dumps(profile.to_dict(), separators=(',', ':')) + '\n')
+            self.output.flush()
+        return profile
+
+    def _trace(self, operation, path, bytes_out, send, *args, **kwargs):
+        profile = self.profile
+        profile.sent(operation, bytes_out)
+        sent_at = time.perf_counter()
+        async_result = send(*args, **kwargs)
+
+        def on_response(result):
+            latency = time.perf_counter() - sent_at
+            try:
+                bytes_in = _response_size(operation, result.get())
+            except Exception:
+                bytes_in = 0
+            profile.received(TracedRequest(operation, path, latency), bytes_in)
+
+        async_result.rawlink(on_response)
+        return _TracedResult(async_result, profile)
+
+    # Asynchronous requests
+
+    def get_async(self, path, watch=None):
+        return self._trace('get', path, len(path), self.client.get_async, path, watch=watch)
+
+    def get_children_async(self, path, watch=None, include_data=False):
+        return self._trace(
+            'get_children', path, len(path), self.client.get_children_async, path,
+            watch=watch, include_data=include_data)
+
+    def exists_async(self, path, watch=None):
+        return self._trace(
+            'exists', path, len(path), self.client.exists_async, path, watch=watch)
+
+    def set_async(self, path, value, version=-1):
+        return self._trace(
+            'set', path, len(path) + len(value or b''), self.client.set_async, path, value,
+            version=version)
+
+    def create_async(self, path, value=b'', **kwargs):
+        return self._trace(
+            'create', path, len(path) + len(value or b''), self.client.create_async, path,
+            value, **kwargs)
+
+    def delete_async(self, path, version=-1):
+        return self._trace(
+            'delete', path, len(path), self.client.delete_async, path, version=version)
+
+    def transaction(self):
+        return _TracedTransaction(self.client.transaction(), self)
+
+    # Synchronous requests, sent through their traced asynchronous versions
+
+    def get(self, path, watch=None):
+        return self.get_async(path, watch=watch).get()
+
+    def get_children(self, path, watch=None, include_data=False):
+        return self.get_children_async(path, watch=watch, include_data=include_data).get()
+
+    def exists(self, path, watch=None):
+        return self.exists_async(path, watch=watch).get()
+
+    def stat(self, path):
+        return self.exists(path)
+
+    def set(self, path, value, version=-1):
+        return self.set_async(path, value, version=version).get()
+
+    def create(self, path, value=b'', **kwargs):
+        return self.create_async(path, value, **kwargs).get()
+
+    def delete(self, path, version=-1, recursive=False):
+        if recursive:
+            return self.client.delete(path, version=version, recursive=True)
+        return self.delete_async(path, version=version).get()
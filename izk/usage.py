@@ -0,0 +1,37 @@
+import collections
+
+from .pipeline import walk
+
+SubtreeUsage = collections.namedtuple('SubtreeUsage', 'path depth data_length nb_nodes')
+
+
+def subtree_usage(zkcli, path, max_depth=None):
+    """Yield the SubtreeUsage of each subtree rooted at most `max_depth` levels below path.
+
+    The subtree is walked concurrently, fetching the node stats but none of
+    their data. As nodes are walked in depth-first order, a subtree usage is
+    yielded as soon as the walk leaves it, children before their parent, and
+    the usage of the argument path itself is yielded last.
+
+    """
+    # The usage of the ancestors of the current node, being aggregated
+    stack = []
+
+    def leave():
+        path, depth, data_length, nb_nodes = stack.pop()
+        if stack:
+            stack[-1][2] += data_length
+            stack[-1][3] += nb_nodes
+        if max_depth is None or depth <= max_depth:
+            return SubtreeUsage(path, depth, data_length, nb_nodes)
+
+    for node in walk(zkcli, path):
+        while stack and stack[-1][1] >= node.depth:
+            usage = leave()
+            if usage:
+                yield usage
+        stack.append([node.path, node.depth, node.stat.dataLength, 1])
+    while stack:
+        usage = leave()
+        if usage:
+            yield usage
@@ -1,4 +1,26 @@
+# Nodes reserved by zookeeper, that can't be written
+RESERVED_PATH = '/zookeeper'
+
+
 def bool_from_str(s):
     if s.isdigit():
         return bool(int(s))
     return s.lower() in ['yes', 'true']
+
+
+def join_path(parent, child):
+    """Return the path of the child znode, without doubling the root slash"""
+    return parent + child if parent.endswith('/') else parent + '/' + child
+
+
+def relocate(path, src_root, dst_root):
+    """Return the path of a node of the src_root subtree, moved under dst_root"""
+    if path == src_root:
+        return dst_root
+    suffix = path[len(src_root.rstrip('/')):]
+    return dst_root.rstrip('/') + suffix or '/'
+
+
+def is_reserved(path):
+    """Return whether the path is reserved by zookeeper"""
+    return path == RESERVED_PATH or path.startswith(RESERVED_PATH + '/')
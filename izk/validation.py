@@ -1,10 +1,18 @@
 import re
-import functools
+import collections
 
-from .lexer import COMMAND, PATH, ZK_FOUR_LETTER_WORD, QUOTED_STR
+from .grammar import (
+    COMMAND, PATH, ZK_FOUR_LETTER_WORD, ZK_LOCATION, QUOTED_STR, NUMBER, FILENAME)
 
 
 def ask_for_confirmation(message, confirm_on_exc=False):
+    from .prompt import g
+    # The answer can be set beforehand, when running non-interactively
+    answer = getattr(g, 'confirm', None)
+    if answer is not None:
+        if not answer:
+            print('%s Aborting' % (message))
+        return answer
     try:
         message = '%s [y/n] ' % (message)
         while True:
@@ -33,17 +41,27 @@ class Token(str):
     def __str__(self):
         return self.string
 
-    def __add__(self, other):
-        if isinstance(other, Optional):
-            return r'%s\s*%s' % (str(self), str(other))
-        return r'%s\s+%s' % (str(self), str(other))
-
 
 class Optional(Token):
     """A token that can be ommitted in a command"""
 
-    def __str__(self):
-        return r'%s?' % (self.string)
+
+class Options(Optional):
+    """Named options that can be passed in any order, after the other tokens.
+
+    Each option is given as a keyword argument mapping the option name to the
+    pattern of its value, or to None if the option is a flag.
+
+    Example: Options(depth=NUMBER, max_nodes=NUMBER) matches '--max-nodes 10 --depth 2'
+
+    """
+
+    def __new__(cls, **options):
+        return super().__new__(cls, ' '.join('--%s' % (name) for name in sorted(options)))
+
+    def __init__(self, **options):
+        self.options = options
+        self.string = str.__str__(self)
 
 
 class UnknownCommand(ValueError):
@@ -61,77 +79,165 @@ class CommandValidationError(ValueError):
         return self.message
 
 
+# A word of the user input: either a quoted string, or anything up to the next space
+QUOTED_OR_WORD = r'(%s|\S+)' % (QUOTED_STR)
+WORD = re.compile(r'\s*' + QUOTED_OR_WORD)
+COMMAND_PREFIX = re.compile(COMMAND)
+
+# An operation of a benchmark mix
+BENCH_OPERATION = r'(read|write|create|delete)'
+
+# Type of the values matching a pattern, when they're not strings
+VALUE_TYPES = {NUMBER: int}
+
+# The compiled grammar of a command: its positional arguments and options
+ArgSpec = collections.namedtuple('ArgSpec', 'regex optional')
+OptionSpec = collections.namedtuple('OptionSpec', 'name regex type')
+CommandSpec = collections.namedtuple('CommandSpec', 'args nb_required_args options')
+ParsedCommand = collections.namedtuple('ParsedCommand', 'name args kwargs')
+
+
 class CommandValidator:
     """Object in charge of validating the user input for a given command."""
 
     patterns = {
+        'bench': [
+            Optional(PATH),
+            Options(
+                requests=NUMBER, mix=r'{0}=\d+(,{0}=\d+)*'.format(BENCH_OPERATION),
+                size=NUMBER, nodes=NUMBER, concurrency=NUMBER, seed=NUMBER)],
         'create': PATH,
         'delete': PATH,
+        'diff': [ZK_LOCATION, ZK_LOCATION],
+        'du': [PATH, Options(depth=NUMBER)],
         'edit': PATH,
         'exit': None,
+        'export': [PATH, FILENAME, Options(compression=r'(none|gzip|lzma)')],
+        'find': [
+            PATH,
+            Options(
+                name=QUOTED_OR_WORD, regex=QUOTED_OR_WORD, ephemeral=None,
+                owner=r'(0x[0-9a-fA-F]+|\d+)', mtime=r'[+-]?\d+', size=r'[+-]?\d+[KMG]?',
+                children=r'[+-]?\d+', depth=NUMBER)],
         'get': PATH,
+        'grep': [
+            QUOTED_OR_WORD, PATH, Options(ignore_case=None, max_bytes=r'\d+[KMG]?')],
         'help': Optional(COMMAND),
+        'import': [
+            FILENAME, PATH,
+            Options(on_conflict=r'(skip|overwrite|fail)', batch_size=NUMBER, rate=NUMBER)],
         'ls': PATH,
-        'tree': PATH,
-        'ftree': PATH,
+        'mirror': None,
+        'ping': [
+            Optional(PATH),
+            Options(count=NUMBER, concurrency=NUMBER, get=None, per_host=None)],
+        'tree': [PATH, Options(depth=NUMBER, max_nodes=NUMBER)],
+        'ftree': [PATH, Options(depth=NUMBER, max_nodes=NUMBER)],
         'quit': None,
-        'raw': ZK_FOUR_LETTER_WORD,
-        'rmr': PATH,
+        'raw': [ZK_FOUR_LETTER_WORD, Options(all=None)],
+        'rmr': [PATH, Options(rate=NUMBER, batch_size=NUMBER)],
         'set': [PATH, Optional(QUOTED_STR)],
         'stat': PATH,
+        'sync': [
+            ZK_LOCATION, ZK_LOCATION,
+            Options(delete=None, dry_run=None, batch_size=NUMBER, rate=NUMBER)],
+        'timing': Optional(r'(on|off)'),
         'toggle_write': None,
+        'top': [
+            Options(interval=NUMBER, count=NUMBER, output=FILENAME, format=r'(csv|jsonl)')],
+        'watch': [PATH, Options(recursive=None, count=NUMBER)],
     }
 
     def __init__(self, input_str):
         self.input_str = input_str
-        self.command = self._parse_command_name()
-        self.pattern = self.make_pattern()
-
-    def _parse_command_name(self):
-        command_pattern = r'(%s)\s*' % (COMMAND)
-        m = re.match(command_pattern, self.input_str)
-        if not m:
-            raise UnknownCommand('Command %r not found' % (self.input_str))
-        return m.group(1).strip()
-
-    def _make_pattern(self, tokens):
-        """Return a regex pattern given the input tokens"""
-
-        # First, transform the input in a list of Tokens, including the command
-        if tokens in (None, ''):
-            tokens = []
-        elif isinstance(tokens, str) and not isinstance(tokens, Token):
-            tokens = [Token(tokens)]
-        elif isinstance(tokens, list):
-            tokens = [tok if isinstance(tok, Token) else Token(tok) for tok in tokens]
-        else:
-            tokens = [tokens]
-
-        # the first token will be preceeded by the command
-        tokens = [Token(self.command)] + tokens
-
-        # Glue the tokens together, and rely on their __add__ method to perform the magic
-        pattern = functools.reduce(Token.__add__, tokens)
-
-        return r'^\s*%s\s*$' % (pattern)
-
-    def make_pattern(self):
-        tokens = self.patterns[self.command]
-        return self._make_pattern(tokens)
+        self.command = parse_command_name(input_str)
 
     def validate(self):
-        return bool(re.match(self.pattern, self.input_str))
-
-
-def validate_command_input(f):
-    """Validate the input command and execute it, if valid"""
+        try:
+            parse_command(self.input_str)
+        except CommandValidationError:
+            return False
+        return True
+
+
+def compile_command_spec(tokens):
+    """Compile the tokens of a CommandValidator pattern into a CommandSpec"""
+    if tokens in (None, ''):
+        tokens = []
+    elif not isinstance(tokens, list):
+        tokens = [tokens]
+    args, options = [], {}
+    for token in tokens:
+        if isinstance(token, Options):
+            for name, value_pattern in token.options.items():
+                options['--' + name.replace('_', '-')] = OptionSpec(
+                    name=name,
+                    regex=re.compile(value_pattern) if value_pattern else None,
+                    type=VALUE_TYPES.get(value_pattern, str))
+        else:
+            args.append(ArgSpec(
+                regex=re.compile(str.__str__(token)),
+                optional=isinstance(token, Optional)))
+    nb_required_args = sum(1 for arg in args if not arg.optional)
+    return CommandSpec(args, nb_required_args, options)
+
+
+# The parse table of all commands, compiled once and for all
+COMMAND_SPECS = {
+    command: compile_command_spec(tokens)
+    for command, tokens in CommandValidator.patterns.items()
+}
+
+
+def tokenize(input_str):
+    """Split the input into words, keeping quoted strings whole"""
+    if "'" not in input_str and '"' not in input_str:
+        return input_str.split()
+    return [m.group(1) for m in WORD.finditer(input_str)]
+
+
+def parse_command_name(input_str):
+    m = COMMAND_PREFIX.match(input_str.strip())
+    if not m:
+        raise UnknownCommand('Command %r not found' % (input_str))
+    return m.group(0)
+
+
+def parse_command(input_str):
+    """Validate and parse the input in a single pass, and return a ParsedCommand.
+
+    The positional arguments are returned as strings, and the option values are
+    converted to their type (e.g. --depth 2 is returned as {'depth': 2}).
+
+    """
+    words = tokenize(input_str)
+    spec = COMMAND_SPECS.get(words[0]) if words else None
+    if spec is None:
+        name = parse_command_name(input_str)
+        raise CommandValidationError(name, 'Command %r is invalid' % (input_str))
+    name = words[0]
+
+    args, kwargs = [], {}
+    nb_words, i = len(words), 1
+    while i < nb_words:
+        word = words[i]
+        i += 1
+        option = spec.options.get(word)
+        if option is not None:
+            if option.regex is None:
+                kwargs[option.name] = True
+                continue
+            if i < nb_words and option.regex.fullmatch(words[i]):
+                kwargs[option.name] = option.type(words[i])
+                i += 1
+                continue
+        elif not kwargs and len(args) < len(spec.args):
+            # positional arguments can't follow options
+            if spec.args[len(args)].regex.fullmatch(word):
+                args.append(word)
+                continue
+        raise CommandValidationError(name, 'Command %r is invalid' % (input_str))
 
-    @functools.wraps(f)
-    def wrapper(runner, input_str):
-        if input_str.strip():
-            validator = CommandValidator(input_str.strip())
-            if not validator.validate():
-                validation_error_msg = 'Command %r is invalid' % (input_str)
-                raise CommandValidationError(validator.command, validation_error_msg)
-        return f(runner, input_str)
-    return wrapper
+    if len(args) < spec.nb_required_args:
+        raise CommandValidationError(name, 'Command %r is invalid' % (input_str))
+    return ParsedCommand(name, args, kwargs)
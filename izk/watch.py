@@ -0,0 +1,218 @@
+import collections
+import datetime
+import threading
+import time
+
+from kazoo.exceptions import KazooException, NoNodeError
+from kazoo.protocol.states import EventType, KazooState
+
+from .utils import join_path
+
+# Number of seconds between two screen updates, during which events are coalesced
+RENDER_INTERVAL = 0.2
+
+ChangeEvent = collections.namedtuple('ChangeEvent', 'time type path zxid detail')
+
+CREATED, CHANGED, DELETED, CHILDREN = 'created', 'changed', 'deleted', 'children'
+# Connection events
+LOST, RESYNCED = 'lost', 'resynced'
+
+
+class TreeWatcher:
+    """Watch the changes of a node, or of all the nodes of its subtree if `recursive`.
+
+    Zookeeper watches only fire once, so each watch is registered again as
+    soon as it fires, and the new stat of the node is used to date the change.
+    Events are appended to a queue by the kazoo threads, and drained by the
+    consumer.
+
+    As kazoo drops all the watches when the connection is lost, the watched
+    nodes are walked again once reconnected, registering their watches again
+    and reporting the changes made in the meantime.
+
+    """
+
+    def __init__(self, zkcli, path, recursive=False):
+        self.zkcli = zkcli
+        self.path = path
+        self.recursive = recursive
+        self.events = collections.deque()
+        self._children = {}  # path -> set of the known children names
+        self._mzxids = {}  # path -> zxid of the last known change of the node data
+        self._lock = threading.Lock()
+        self._stopped = False
+        self._disconnected = False
+
+    def start(self):
+        self.zkcli.add_listener(self._on_state_change)
+        self._watch(self.path)
+
+    def stop(self):
+        """Ignore the watches that are still registered, as they can't be removed"""
+        self._stopped = True
+        self.zkcli.remove_listener(self._on_state_change)
+
+    def drain(self):
+        """Return the events received since the last call"""
+        events = []
+        while self.events:
+            events.append(self.events.popleft())
+        return events
+
+    def _push(self, event_type, path, zxid=None, timestamp=None, detail=''):
+        self.events.append(ChangeEvent(
+            timestamp / 1000 if timestamp else time.time(), event_type, path, zxid, detail))
+
+    def _watch(self, path, created=False, resync=False):
+        """Watch the data and children of a node, reporting its creation if `created`.
+
+        If `resync`, report the deletion or change of the node since it was
+        last seen.
+
+        """
+        def on_stat(async_result):
+            try:
+                stat = async_result.get()
+            except KazooException:
+                return
+            with self._lock:
+                if stat is None:
+                    mzxid = self._mzxids.pop(path, None)
+                else:
+                    mzxid = self._mzxids.get(path, stat.mzxid)
+                    self._mzxids[path] = stat.mzxid
+            if created and stat is not None:
+                self._push(CREATED, path, stat.czxid, stat.ctime)
+            elif resync and stat is None and mzxid is not None:
+                self._push(DELETED, path)
+                with self._lock:
+                    self._children.pop(path, None)
+            elif resync and stat is not None and stat.mzxid != mzxid:
+                self._push(CHANGED, path, stat.mzxid, stat.mtime)
+
+        self.zkcli.exists_async(path, watch=self._on_data_event).rawlink(on_stat)
+        self._watch_children(path)
+
+    def _watch_children(self, path):
+        def on_children(async_result):
+            try:
+                children, stat = async_result.get()
+            except NoNodeError:
+                return  # the data watch reports the deletion
+            except KazooException:
+                return
+            children = set(children)
+            with self._lock:
+                previous = self._children.get(path)
+                self._children[path] = children
+            if previous is None:
+                added, removed = (children if self.recursive else ()), ()
+            else:
+                added, removed = children - previous, previous - children
+            if not self.recursive and (added or removed):
+                detail = ' '.join(
+                    ['+' + child for child in sorted(added)] +
+                    ['-' + child for child in sorted(removed)])
+                self._push(CHILDREN, path, stat.pzxid, detail=detail)
+            if self.recursive:
+                for child in sorted(added):
+                    self._watch(join_path(path, child), created=previous is not None)
+
+        self.zkcli.get_children_async(
+            path, watch=self._on_child_event, include_data=True).rawlink(on_children)
+
+    def _on_state_change(self, state):
+        """Connection listener, called by kazoo: must not block"""
+        if self._stopped:
+            return
+        if state in (KazooState.SUSPENDED, KazooState.LOST):
+            if not self._disconnected:
+                self._disconnected = True
+                self._push(LOST, self.path, detail='connection lost')
+        elif self._disconnected:
+            self._disconnected = False
+            self._push(RESYNCED, self.path, detail='connection restored, watches re-synced')
+            with self._lock:
+                paths = sorted(self._children) if self.recursive else [self.path]
+            for path in paths:
+                self._watch(path, resync=True)
+
+    def _on_data_event(self, event):
+        # NONE events are sent when the connection is lost, without a path
+        if self._stopped or event.type == EventType.NONE:
+            return
+        if event.type == EventType.DELETED:
+            self._push(DELETED, event.path)
+            with self._lock:
+                self._children.pop(event.path, None)
+                self._mzxids.pop(event.path, None)
+            if event.path == self.path:
+                self._watch(event.path, created=True)  # report its re-creation
+            return
+
+        def on_stat(async_result):
+            try:
+                stat = async_result.get()
+            except KazooException:
+                return
+            if stat is None:
+                return  # the deletion is reported by the new watch
+            with self._lock:
+                self._mzxids[event.path] = stat.mzxid
+            if event.type == EventType.CREATED:
+                self._push(CREATED, event.path, stat.czxid, stat.ctime)
+                self._watch_children(event.path)
+            else:
+                self._push(CHANGED, event.path, stat.mzxid, stat.mtime)
+
+        self.zkcli.exists_async(event.path, watch=self._on_data_event).rawlink(on_stat)
+
+    def _on_child_event(self, event):
+        if self._stopped or event.type != EventType.CHILD:
+            return
+        self._watch_children(event.path)
+
+
+def coalesce(events):
+    """Merge the events of the same type on the same node, and return (event, count) tuples.
+
+    The last event of each group is kept, in the order of the first one.
+
+    """
+    groups = collections.OrderedDict()
+    for event in events:
+        key = (event.type, event.path)
+        _, count = groups.get(key, (None, 0))
+        groups[key] = (event, count + 1)
+    return list(groups.values())
+
+
+def format_event(event, count=1):
+    timestamp = datetime.datetime.fromtimestamp(event.time).strftime('%H:%M:%S.%f')[:-3]
+    line = '%s %-8s %s' % (timestamp, event.type, event.path)
+    if event.zxid is not None:
+        line += ' zxid=0x%x' % (event.zxid)
+    if event.detail:
+        line += ' ' + event.detail
+    if count > 1:
+        line += ' (x%d)' % (count)
+    return line
+
+
+def render_events(watcher, interval=RENDER_INTERVAL, max_events=None):
+    """Yield the formatted lines of the watched events, a batch every `interval` seconds.
+
+    Events received during an interval are coalesced, so that bursts of
+    changes are rendered in a single screen update of bounded size. Stop
+    after `max_events` events, if set.
+
+    """
+    nb_events = 0
+    while max_events is None or nb_events < max_events:
+        time.sleep(interval)
+        events = watcher.drain()
+        if max_events is not None:
+            events = events[:max_events - nb_events]
+        nb_events += len(events)
+        if events:
+            yield [format_event(event, count) for event, count in coalesce(events)]
@@ -1,15 +1,47 @@
+import socket
+import concurrent.futures
+
 from kazoo.client import KazooClient
 from kazoo.exceptions import NoNodeError, ConnectionLoss
 
+# Number of seconds to wait for a zookeeper node to answer a 4 letter word
+FOUR_LETTER_WORD_TIMEOUT = 5
+
+
+def send_4lw(host, port, cmd, timeout=FOUR_LETTER_WORD_TIMEOUT):
+    """Send a 4 letter word to a zookeeper node, and return its decoded answer.
+
+    The zookeeper server closes the connection after having answered, so we
+    read from the socket until the end.
+
+    """
+    out = []
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        sock.sendall(cmd)
+        while True:
+            data = sock.recv(8192)
+            if not data:
+                break
+            out.append(data)
+    return b''.join(out).decode('utf-8', 'replace')
+
 
 class ExtendedKazooClient(KazooClient):
 
+    # Whether entering the client context connects in the background, instead of blocking
+    connect_in_background = False
+
     def __enter__(self):
-        self.start()
+        if self.connect_in_background:
+            self.start_async()
+        else:
+            self.start()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.stop()
+        if getattr(self, '_4lw_executor', None) is not None:
+            self._4lw_executor.shutdown(wait=False)
 
     def command(self, cmd='ruok'):
         """Sends a commmand to the ZK node.
@@ -21,22 +53,33 @@ class ExtendedKazooClient(KazooClient):
         """
         if not self._live.is_set():
             raise ConnectionLoss("No connection to server")
-        out = []
         peer = self._connection._socket.getpeername()
-        if len(peer) > 2:
-            peer = peer[:2]
-        sock = self.handler.create_connection(
-            peer, timeout=self._session_timeout / 1000.0)
-        sock.sendall(cmd)
-        while True:
-            data = sock.recv(8192)
-            if not data:
-                break
-            out.append(data)
+        return send_4lw(*peer[:2], cmd, timeout=self._session_timeout / 1000.0)
+
+    def command_all(self, cmd='ruok', timeout=FOUR_LETTER_WORD_TIMEOUT):
+        """Send a command to all the nodes of the ensemble at the same time.
 
-        sock.close()
-        result = b''.join(out)
-        return result.decode('utf-8', 'replace')
+        Return a dict mapping each 'host:port' to the node answer, or to the
+        error that occured while contacting it.
+
+        """
+        hosts = ['%s:%d' % (host, port) for host, port in self.hosts]
+        # The threads are kept from one call to the next, as the connections
+        # can't be: zookeeper closes them after having answered.
+        if getattr(self, '_4lw_executor', None) is None:
+            self._4lw_executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=len(hosts))
+        futures = [
+            self._4lw_executor.submit(send_4lw, host, port, cmd, timeout)
+            for host, port in self.hosts
+        ]
+        results = {}
+        for host, future in zip(hosts, futures):
+            try:
+                results[host] = future.result()
+            except OSError as exc:
+                results[host] = 'Error: %s' % (exc)
+        return results
 
     def stat(self, node_path):
         try:
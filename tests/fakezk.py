@@ -0,0 +1,344 @@
+"""An in-memory stand-in for the kazoo client, with injectable latency.
+
+Every request sent to the fake client is counted, and every time a caller
+has to wait for a response, a round-trip is counted. Synchronous calls
+always cost one round-trip, whereas asynchronous calls issued back to back
+are pipelined, and only cost a round-trip when their result is waited on.
+
+"""
+import time
+import posixpath
+
+from kazoo.exceptions import (
+    NoNodeError, NodeExistsError, NotEmptyError, BadVersionError, RolledBackError)
+from kazoo.protocol.states import (
+    ZnodeStat, WatchedEvent, EventType, KeeperState, KazooState)
+
+
+class FakeAsyncResult:
+    """Mimic kazoo's IAsyncResult, resolving after the injected latency."""
+
+    def __init__(self, client, value=None, exception=None):
+        self.client = client
+        self.value = value
+        self.exception = exception
+        self.ready_at = time.perf_counter() + client.latency
+
+    def ready(self):
+        return time.perf_counter() >= self.ready_at
+
+    def get(self, block=True, timeout=None):
+        delay = self.ready_at - time.perf_counter()
+        if delay > 0:
+            self.client.round_trips += 1
+            time.sleep(delay)
+        if self.exception is not None:
+            raise self.exception
+        return self.value
+
+    def rawlink(self, callback):
+        callback(self)
+
+
+class FakeTransaction:
+    """Mimic kazoo's TransactionRequest, applying all operations or none."""
+
+    def __init__(self, client):
+        self.client = client
+        self.operations = []
+
+    def create(self, path, value=b'', **kwargs):
+        self.operations.append(('create', path, value))
+
+    def delete(self, path, version=-1):
+        self.operations.append(('delete', path, version))
+
+    def set_data(self, path, value, version=-1):
+        self.operations.append(('set_data', path, value, version))
+
+    def check(self, path, version):
+        self.operations.append(('check', path, version))
+
+    def _check_version(self, path, version):
+        if version != -1 and self.client._node(path).version != version:
+            raise BadVersionError(path)
+
+    def _apply(self, operation, path, *args):
+        """Apply the operation, and return its result along with a function undoing it"""
+        client = self.client
+        parent, name = posixpath.dirname(path), posixpath.basename(path)
+        if operation == 'create':
+            result = client._create(path, args[0])
+
+            def undo():
+                del client.nodes[path]
+                client.nodes[parent].children.discard(name)
+            return result, undo
+
+        self._check_version(path, args[-1])
+        node = client._node(path)
+        if operation == 'delete':
+            result = client._delete(path)
+
+            def undo():
+                client.nodes[path] = node
+                client.nodes[parent].children.add(name)
+            return result, undo
+
+        if operation == 'set_data':
+            data, version, mzxid = node.data, node.version, node.mzxid
+            result = client._set(path, args[0])
+
+            def undo():
+                node.data, node.version, node.mzxid = data, version, mzxid
+            return result, undo
+        return True, None
+
+    def _commit(self):
+        results, undos = [], []
+        for index, operation in enumerate(self.operations):
+            try:
+                result, undo = self._apply(*operation)
+            except Exception as exc:
+                for undo in reversed(undos):
+                    undo()
+                return (
+                    [RolledBackError()] * index + [exc] +
+                    [RolledBackError()] * (len(self.operations) - index - 1))
+            results.append(result)
+            if undo is not None:
+                undos.append(undo)
+        return results
+
+    def commit_async(self):
+        return self.client._async(self._commit)
+
+    def commit(self):
+        return self.commit_async().get()
+
+
+class FakeZnode:
+
+    def __init__(self, data, zxid, ephemeral_owner=0):
+        self.data = data
+        self.czxid = self.mzxid = self.pzxid = zxid
+        self.ctime = self.mtime = int(time.time() * 1000)
+        self.version = self.cversion = 0
+        self.ephemeral_owner = ephemeral_owner
+        self.children = set()
+
+    def stat(self):
+        return ZnodeStat(
+            self.czxid, self.mzxid, self.ctime, self.mtime, self.version,
+            self.cversion, 0, self.ephemeral_owner, len(self.data),
+            len(self.children), self.pzxid)
+
+
+class FakeZkClient:
+    """In-memory znode tree exposing the subset of the kazoo API used by izk."""
+
+    def __init__(self, latency=0, read_only=False):
+        self.latency = latency
+        self.read_only = read_only
+        self.connected = True
+        self.requests = 0
+        self.round_trips = 0
+        self.zxid = 0
+        self.nodes = {'/': FakeZnode(b'', 0)}
+        self.data_watches = {}
+        self.child_watches = {}
+        self.listeners = []
+
+    def reset_counters(self):
+        self.requests = 0
+        self.round_trips = 0
+
+    def _async(self, func, *args, **kwargs):
+        self.requests += 1
+        try:
+            return FakeAsyncResult(self, value=func(*args, **kwargs))
+        except Exception as exc:
+            return FakeAsyncResult(self, exception=exc)
+
+    def _node(self, path):
+        try:
+            return self.nodes[path]
+        except KeyError:
+            raise NoNodeError(path)
+
+    # Seeding helpers
+
+    def seed(self, path, data=b'', ephemeral_owner=0):
+        """Create a node and its missing parents, without any request cost."""
+        parent = posixpath.dirname(path)
+        if parent not in self.nodes:
+            self.seed(parent)
+        if path not in self.nodes:
+            self._create(path, data, ephemeral_owner)
+        return self.nodes[path]
+
+    def seed_wide(self, path, width, data=b''):
+        """Seed `width` leaf children under the argument path"""
+        for i in range(width):
+            self.seed('%s/node-%06d' % (path.rstrip('/'), i), data)
+
+    def seed_deep(self, path, depth, width, data=b''):
+        """Seed a tree of the argument depth, where each node has `width` children"""
+        if depth == 0:
+            return
+        for i in range(width):
+            child = '%s/node-%d' % (path.rstrip('/'), i)
+            self.seed(child, data)
+            self.seed_deep(child, depth - 1, width, data)
+
+    # Watches
+
+    def _add_watch(self, watches, path, watch):
+        if watch is not None:
+            watches.setdefault(path, set()).add(watch)
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    def lose_connection(self):
+        """Mimic kazoo on a connection loss: notify the listeners, and drop the watches"""
+        self.connected = False
+        for listener in list(self.listeners):
+            listener(KazooState.SUSPENDED)
+        watches = [
+            watch for watches in (self.data_watches, self.child_watches)
+            for watch_set in watches.values() for watch in watch_set]
+        self.data_watches, self.child_watches = {}, {}
+        for watch in watches:
+            watch(WatchedEvent(EventType.NONE, KeeperState.CONNECTING, None))
+
+    def restore_connection(self):
+        self.connected = True
+        for listener in list(self.listeners):
+            listener(KazooState.CONNECTED)
+
+    def _trigger(self, watches, path, event_type):
+        for watch in watches.pop(path, ()):
+            watch(WatchedEvent(event_type, KeeperState.CONNECTED, path))
+
+    # Internal, latency-free operations
+
+    def _create(self, path, data, ephemeral_owner=0):
+        if path in self.nodes:
+            raise NodeExistsError(path)
+        parent = self._node(posixpath.dirname(path))
+        self.zxid += 1
+        self.nodes[path] = FakeZnode(data, self.zxid, ephemeral_owner)
+        parent.children.add(posixpath.basename(path))
+        parent.cversion += 1
+        parent.pzxid = self.zxid
+        self._trigger(self.data_watches, path, EventType.CREATED)
+        self._trigger(self.child_watches, posixpath.dirname(path), EventType.CHILD)
+        return path
+
+    def _delete(self, path):
+        node = self._node(path)
+        if node.children:
+            raise NotEmptyError(path)
+        del self.nodes[path]
+        self.zxid += 1
+        parent = self.nodes[posixpath.dirname(path)]
+        parent.children.discard(posixpath.basename(path))
+        parent.cversion += 1
+        parent.pzxid = self.zxid
+        self._trigger(self.data_watches, path, EventType.DELETED)
+        self._trigger(self.child_watches, path, EventType.DELETED)
+        self._trigger(self.child_watches, posixpath.dirname(path), EventType.CHILD)
+        return True
+
+    def _set(self, path, value):
+        node = self._node(path)
+        self.zxid += 1
+        node.data = value
+        node.version += 1
+        node.mzxid = self.zxid
+        node.mtime = int(time.time() * 1000)
+        self._trigger(self.data_watches, path, EventType.CHANGED)
+        return node.stat()
+
+    def _get(self, path, watch=None):
+        node = self._node(path)
+        self._add_watch(self.data_watches, path, watch)
+        return node.data, node.stat()
+
+    def _get_children(self, path, include_data=False, watch=None):
+        node = self._node(path)
+        self._add_watch(self.child_watches, path, watch)
+        children = sorted(node.children)
+        if include_data:
+            return children, node.stat()
+        return children
+
+    def _exists(self, path, watch=None):
+        node = self.nodes.get(path)
+        self._add_watch(self.data_watches, path, watch)
+        return node.stat() if node is not None else None
+
+    # kazoo API
+
+    def get_async(self, path, watch=None):
+        return self._async(self._get, path, watch)
+
+    def get(self, path, watch=None):
+        return self.get_async(path, watch).get()
+
+    def get_children_async(self, path, watch=None, include_data=False):
+        return self._async(self._get_children, path, include_data, watch)
+
+    def get_children(self, path, watch=None, include_data=False):
+        return self.get_children_async(path, watch, include_data).get()
+
+    def exists_async(self, path, watch=None):
+        return self._async(self._exists, path, watch)
+
+    def exists(self, path, watch=None):
+        return self.exists_async(path, watch).get()
+
+    def stat(self, path):
+        return self.exists(path)
+
+    def create_async(self, path, value=b'', makepath=False, **kwargs):
+        if makepath:
+            self.seed(posixpath.dirname(path))
+        return self._async(self._create, path, value)
+
+    def create(self, path, value=b'', makepath=False, **kwargs):
+        return self.create_async(path, value, makepath=makepath).get()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def ensure_path(self, path):
+        self.seed(path)
+        self.requests += 1
+        self.round_trips += 1
+        return True
+
+    def set_async(self, path, value, version=-1):
+        return self._async(self._set, path, value)
+
+    def set(self, path, value, version=-1):
+        return self.set_async(path, value, version).get()
+
+    def delete_async(self, path, version=-1):
+        return self._async(self._delete, path)
+
+    def transaction(self):
+        return FakeTransaction(self)
+
+    def delete(self, path, version=-1, recursive=False):
+        if recursive:
+            for child in self.get_children(path):
+                self.delete(posixpath.join(path, child), recursive=True)
+        return self.delete_async(path).get()
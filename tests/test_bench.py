@@ -0,0 +1,61 @@
+import pytest
+from kazoo.exceptions import NodeExistsError
+
+from izk.bench import Benchmark, parse_mix, run_benchmark, format_result
+
+from tests.fakezk import FakeZkClient
+
+
+def test_parse_mix():
+    assert dict(parse_mix('read=70,write=20,delete=10')) == {
+        'read': 70, 'write': 20, 'delete': 10}
+    with pytest.raises(ValueError):
+        parse_mix('read=0')
+    with pytest.raises(ValueError):
+        parse_mix('scan=10')
+
+
+def test_run_benchmark():
+    zkcli = FakeZkClient(latency=0.001)
+    result = run_benchmark(
+        zkcli, requests=200, path='/bench', mix='read=50,write=20,create=20,delete=10',
+        nodes=10, concurrency=16)
+    assert sum(histogram.count for histogram in result.histograms.values()) == 200
+    assert set(result.histograms) == {'read', 'write', 'create', 'delete'}
+    assert not result.errors
+    assert '/bench' not in zkcli.nodes
+    lines = format_result(result)
+    assert lines[0].startswith('200 requests in')
+    assert lines[1].startswith('read ')
+
+
+def test_benchmark_reproducible():
+    def operations(seed):
+        zkcli = FakeZkClient()
+        benchmark = Benchmark(zkcli, path='/bench', mix='read=1,write=1', seed=seed)
+        benchmark.setup()
+        benchmark.run(50)
+        return [node.version for path, node in sorted(zkcli.nodes.items())]
+
+    assert operations(1) == operations(1)
+    assert operations(1) != operations(2)
+
+
+def test_benchmark_refuses_existing_path():
+    zkcli = FakeZkClient()
+    zkcli.seed('/bench/important')
+    with pytest.raises(NodeExistsError):
+        run_benchmark(zkcli, path='/bench')
+    assert '/bench/important' in zkcli.nodes
+
+
+def test_benchmark_cleans_up_on_error():
+    zkcli = FakeZkClient()
+
+    def fail(*args, **kwargs):
+        raise RuntimeError('connection lost')
+
+    zkcli.set_async = fail
+    with pytest.raises(RuntimeError):
+        run_benchmark(zkcli, path='/bench', mix='write=1', requests=10)
+    assert '/bench' not in zkcli.nodes
@@ -0,0 +1,143 @@
+import pytest
+import unittest.mock as mock
+
+from kazoo.handlers.threading import KazooTimeoutError
+from kazoo.protocol.states import WatchedEvent, EventType, KeeperState
+from prompt_toolkit.document import Document
+
+from izk.completion import ZkCompleter, PathCache, FETCH_TIMEOUT
+from tests.fakezk import FakeZkClient
+
+
+@pytest.fixture
+def zkcli():
+    zkcli = FakeZkClient()
+    for path in ('/brokers/ids/1', '/brokers/topics', '/config'):
+        zkcli.seed(path)
+    return zkcli
+
+
+def complete(completer, text):
+    for word in text.split(' ')[:-1]:
+        list(completer.get_completions(Document(word), None))
+        list(completer.get_completions(Document(word + ' '), None))
+    return [c.text for c in completer.get_completions(Document(text), None)]
+
+
+def test_complete_commands(zkcli):
+    assert complete(ZkCompleter(zkcli), 'tr') == ['tree']
+
+
+def test_complete_paths(zkcli):
+    assert complete(ZkCompleter(zkcli), 'ls /br') == ['/brokers']
+    assert complete(ZkCompleter(zkcli), 'ls /brokers/') == ['/ids', '/topics']
+    assert complete(ZkCompleter(zkcli), 'create /nope/') == []
+
+
+def test_no_path_completion_while_disconnected(zkcli):
+    zkcli.connected = False
+    assert complete(ZkCompleter(zkcli), 'ls /br') == []
+    assert zkcli.requests == 0
+
+
+def test_cache_fetch_timeout(zkcli):
+    cache = PathCache(zkcli)
+    async_result = mock.Mock(**{'get.side_effect': KazooTimeoutError()})
+    with mock.patch.object(zkcli, 'get_children_async', return_value=async_result):
+        assert cache.get('/brokers') == []
+    async_result.get.assert_called_once_with(timeout=FETCH_TIMEOUT)
+    assert '/brokers' not in cache
+
+
+def test_cache_shared_between_completers(zkcli):
+    cache = PathCache(zkcli)
+    complete(ZkCompleter(zkcli, cache=cache), 'ls /brokers/')
+    zkcli.reset_counters()
+    assert complete(ZkCompleter(zkcli, cache=cache), 'get /brokers/t') == ['/topics']
+    assert zkcli.requests == 0
+
+
+def test_cache_invalidated_by_watch(zkcli):
+    cache = PathCache(zkcli)
+    assert cache.get('/brokers') == ['ids', 'topics']
+    zkcli.create('/brokers/seqid')
+    assert '/brokers' not in cache
+    assert cache.get('/brokers') == ['ids', 'seqid', 'topics']
+
+
+def test_cache_missing_node_invalidated_on_creation(zkcli):
+    cache = PathCache(zkcli)
+    assert cache.get('/new') == []
+    zkcli.create('/new')
+    assert '/new' not in cache
+
+
+def test_cache_cleared_on_connection_loss(zkcli):
+    cache = PathCache(zkcli)
+    cache.get('/brokers')
+    cache.get('/config')
+    zkcli.lose_connection()
+    assert len(cache) == 0
+    assert cache.size == 0
+
+
+def test_cache_stored_before_watch_fires(zkcli):
+    """A change notified before the caller gets the response isn't missed"""
+    cache = PathCache(zkcli)
+    get_children_async = zkcli.get_children_async
+
+    def get_children_then_change(path, watch=None, include_data=False):
+        async_result = get_children_async(path, watch=watch)
+        get = async_result.get
+
+        def get_after_change(*args, **kwargs):
+            watch(WatchedEvent(EventType.CHILD, KeeperState.CONNECTED, path))
+            return get(*args, **kwargs)
+
+        async_result.get = get_after_change
+        return async_result
+
+    zkcli.get_children_async = get_children_then_change
+    assert cache.get('/brokers') == ['ids', 'topics']
+    assert '/brokers' not in cache
+
+
+def test_cache_response_after_watch_is_dropped(zkcli):
+    """A response whose callback runs after its watch fired isn't stored"""
+    cache = PathCache(zkcli)
+    get_children_async = zkcli.get_children_async
+    callbacks = []
+
+    def get_children_deferred(path, watch=None, include_data=False):
+        async_result = get_children_async(path, watch=watch)
+        async_result.rawlink = callbacks.append
+        return async_result
+
+    with mock.patch.object(zkcli, 'get_children_async', get_children_deferred):
+        assert cache.get('/brokers') == ['ids', 'topics']
+    zkcli.create('/brokers/seqid')  # fires the watch, before the response callback
+    for callback in callbacks:
+        callback(mock.Mock(**{'get.return_value': ['ids', 'topics']}))
+    assert '/brokers' not in cache
+    assert cache.get('/brokers') == ['ids', 'seqid', 'topics']
+    assert '/brokers' in cache
+
+
+def test_cache_lru_bounds(zkcli):
+    cache = PathCache(zkcli, max_entries=2)
+    for path in ('/brokers', '/config', '/brokers/ids'):
+        cache.get(path)
+    assert len(cache) == 2
+    assert '/brokers' not in cache
+
+    cache = PathCache(zkcli, max_bytes=100)
+    cache.get('/brokers')
+    cache.get('/brokers/ids')
+    assert len(cache) == 1
+    assert cache.size <= 100
+
+
+def test_prefetch_node_under_cursor(zkcli):
+    cache = PathCache(zkcli)
+    complete(ZkCompleter(zkcli, cache=cache), 'ls /brokers')
+    assert '/brokers' in cache
@@ -0,0 +1,116 @@
+import io
+import socket
+import threading
+import unittest.mock as mock
+
+import pytest
+
+from izk.daemon import DaemonServer, send_commands
+from tests.fakezk import FakeZkClient
+
+
+@pytest.fixture
+def zkcli():
+    zkcli = FakeZkClient()
+    zkcli.seed('/config', b'{"enabled": true}')
+    zkcli.seed('/config/db')
+    return zkcli
+
+
+@pytest.fixture
+def daemon(tmp_path, zkcli, request):
+    """Start a daemon on a temporary socket, in a thread, and return a function sending it
+    commands"""
+    writable = getattr(request, 'param', False)
+    server = DaemonServer(str(tmp_path / 'izk.sock'), zkcli, writable=writable)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    def run(*commands, **options):
+        stdout, stderr = io.StringIO(), io.StringIO()
+        nb_failures = send_commands(
+            server.socket_path, commands, stdout=stdout, stderr=stderr, **options)
+        return nb_failures, stdout.getvalue(), stderr.getvalue()
+
+    yield run
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def test_daemon_run_command(daemon):
+    nb_failures, stdout, stderr = daemon('ls /config', 'get /config')
+    assert nb_failures == 0
+    assert [line.strip() for line in stdout.splitlines()] == ['db', '{"enabled": true}']
+    assert stderr == ''
+
+
+def test_daemon_run_failing_command(daemon):
+    nb_failures, stdout, stderr = daemon('get /nope', 'ls /config')
+    assert nb_failures == 1
+    assert stdout == ''
+    assert stderr == '/nope does not exist\n'
+
+
+def test_daemon_run_failing_command_continue(daemon):
+    nb_failures, stdout, _ = daemon('get /nope', 'ls /config', on_error='continue')
+    assert nb_failures == 1
+    assert stdout.strip() == 'db'
+
+
+def test_daemon_refuses_writes_when_not_writable(daemon, zkcli):
+    nb_failures, _, stderr = daemon('create /new', write=True)
+    assert nb_failures == 1
+    assert 'read-only' in stderr
+    assert not zkcli.exists('/new')
+    nb_failures, _, stderr = daemon('toggle_write')
+    assert nb_failures == 1
+    assert 'not authorized' in stderr
+
+
+@pytest.mark.parametrize('daemon', [True], indirect=True)
+def test_daemon_refuses_writes_of_read_only_connection(daemon, zkcli):
+    nb_failures, _, stderr = daemon('create /new')
+    assert nb_failures == 1
+    assert 'read-only' in stderr
+    assert not zkcli.exists('/new')
+
+
+@pytest.mark.parametrize('daemon', [True], indirect=True)
+def test_daemon_authorizes_writes(daemon, zkcli):
+    assert daemon('create /new', write=True)[0] == 0
+    assert zkcli.exists('/new')
+    # The mode of a connection doesn't change the mode of the others
+    assert daemon('toggle_write', 'create /other')[0] == 0
+    assert daemon('create /another')[0] == 1
+
+
+@pytest.mark.parametrize('command', [
+    'edit /config', 'set /config', 'watch /config', 'top --interval 1'])
+def test_daemon_refuses_blocking_commands(daemon, command):
+    nb_failures, _, stderr = daemon(command)
+    assert nb_failures == 1
+    assert 'not supported by the izk daemon' in stderr
+
+
+def test_daemon_runs_bounded_watch(daemon, zkcli):
+    with mock.patch('izk.runner.render_events', return_value=iter([])):
+        assert daemon('watch /config --count 1')[0] == 0
+
+
+def test_daemon_exit(daemon):
+    with pytest.raises(ConnectionError):
+        daemon('exit', 'ls /config')
+
+
+def test_daemon_remove_stale_socket(tmp_path, zkcli):
+    socket_path = str(tmp_path / 'izk.sock')
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(socket_path)
+    stale.close()
+    server = DaemonServer(socket_path, zkcli)
+    try:
+        with pytest.raises(OSError, match='already listening'):
+            DaemonServer(socket_path, zkcli)
+    finally:
+        server.server_close()
@@ -0,0 +1,105 @@
+import pytest
+
+from izk.diff import (
+    diff_trees, merge_walks, parse_location, sync_operations, sync_trees, TreeDifference)
+from tests.fakezk import FakeZkClient
+
+
+@pytest.fixture
+def staging():
+    zkcli = FakeZkClient(latency=0.001)
+    zkcli.seed('/config/db', b'host: db-staging\nport: 5432')
+    zkcli.seed('/config/cache', b'ttl: 60')
+    zkcli.seed('/config/legacy/a/b', b'old')
+    zkcli.seed('/config/empty')
+    return zkcli
+
+
+@pytest.fixture
+def prod():
+    zkcli = FakeZkClient(latency=0.001)
+    zkcli.seed('/conf/db', b'host: db-prod\nport: 5432')
+    zkcli.seed('/conf/cache', b'ttl: 60')
+    zkcli.seed('/conf/new', b'new')
+    zkcli.seed('/conf/empty')
+    return zkcli
+
+
+@pytest.mark.parametrize('location, expected', [
+    ('/config', (None, '/config')),
+    ('zk://zk1:2181,zk2:2181/config', ('zk1:2181,zk2:2181', '/config')),
+    ('zk://zk1/', ('zk1', '/')),
+])
+def test_parse_location(location, expected):
+    assert parse_location(location) == expected
+
+
+def test_merge_walks(staging, prod):
+    merged = [
+        (key, node_a is not None, node_b is not None)
+        for key, node_a, node_b in merge_walks(staging, '/config', prod, '/conf')]
+    assert merged == [
+        ((), True, True),
+        (('cache',), True, True),
+        (('db',), True, True),
+        (('empty',), True, True),
+        (('legacy',), True, False),
+        (('legacy', 'a'), True, False),
+        (('legacy', 'a', 'b'), True, False),
+        (('new',), False, True),
+    ]
+
+
+def test_diff_trees(staging, prod):
+    assert list(diff_trees(staging, '/config', prod, '/conf')) == [
+        TreeDifference(
+            '/db', 'changed',
+            b'host: db-staging\nport: 5432', b'host: db-prod\nport: 5432'),
+        TreeDifference('/legacy', 'removed', None, None),
+        TreeDifference('/new', 'added', None, None),
+    ]
+    # 7 nodes walked, and only the data of the non-empty nodes of both trees fetched
+    assert staging.requests == 7 + 2
+
+
+def test_diff_identical_trees_is_pipelined():
+    zkcli = FakeZkClient(latency=0.001)
+    zkcli.seed_deep('/a', depth=3, width=10, data=b'data')
+    zkcli.seed_deep('/b', depth=3, width=10, data=b'data')
+    assert list(diff_trees(zkcli, '/a', zkcli, '/b')) == []
+    assert zkcli.round_trips < 50
+
+
+def test_sync_operations(staging, prod):
+    assert list(sync_operations(staging, '/config', prod, '/conf', delete=True)) == [
+        ('set_data', '/conf/db', b'host: db-staging\nport: 5432', -1),
+        ('create', '/conf/legacy', b''),
+        ('create', '/conf/legacy/a', b''),
+        ('create', '/conf/legacy/a/b', b'old'),
+        ('delete', '/conf/new'),
+    ]
+
+
+def test_sync_operations_compare_data_of_same_size_only(staging, prod):
+    prod.set('/conf/db', b'host: db-stagimg\nport: 5432')
+    prod.set('/conf/cache', b'ttl: 600')
+    prod.reset_counters()
+    operations = list(sync_operations(staging, '/config', prod, '/conf'))
+    assert [operation[:2] for operation in operations] == [
+        ('set_data', '/conf/cache'), ('set_data', '/conf/db'), ('create', '/conf/legacy'),
+        ('create', '/conf/legacy/a'), ('create', '/conf/legacy/a/b')]
+    # Only the data of /conf/db has the same size as in the source
+    assert prod.requests == 1 + 5 + 1
+
+
+def test_sync_trees(staging):
+    dst = FakeZkClient(latency=0.001)
+    dst.seed('/backup/config/extra')
+    staging.seed('/zookeeper/quota')
+    staging.seed('/config/lock', ephemeral_owner=1)
+    counts = sync_trees(staging, '/', dst, '/backup', delete=True, batch_size=3)
+    assert counts == {'created': 6, 'deleted': 1}
+    assert list(diff_trees(staging, '/config', dst, '/backup/config')) == [
+        TreeDifference('/lock', 'removed', None, None)]
+    assert '/backup/zookeeper' not in dst.nodes
+    assert sync_trees(staging, '/config', dst, '/backup/config') == {}
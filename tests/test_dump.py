@@ -0,0 +1,242 @@
+import io
+import os
+import unittest.mock as mock
+
+import pytest
+
+from kazoo.exceptions import BadVersionError, NoNodeError, NodeExistsError
+
+from izk.dump import (
+    DumpClient, DumpReader, DumpWriter, InvalidDump, export_tree, import_tree)
+from tests.fakezk import FakeZkClient
+
+
+@pytest.fixture
+def zkcli():
+    zkcli = FakeZkClient()
+    zkcli.seed('/config/a', b'{"k": "v"}')
+    zkcli.seed('/config/a-b', b'\x00\xff')
+    zkcli.seed_deep('/config/a/deep', depth=3, width=8, data=b'x' * 100)
+    zkcli.seed('/other', b'not exported')
+    return zkcli
+
+
+@pytest.mark.parametrize('codec', ['none', 'gzip', 'lzma'])
+def test_export_round_trip(zkcli, codec):
+    f = io.BytesIO()
+    with mock.patch('izk.dump.BLOCK_SIZE', 4096):
+        assert export_tree(zkcli, '/config', f, codec=codec) == 588
+    reader = DumpReader(f)
+    assert reader.codec == codec
+    assert len(reader.block_offsets) > 1
+    records = list(reader)
+    assert len(records) == len(reader) == 588
+    assert [record.path for record in records[:3]] == [
+        '/config', '/config/a', '/config/a/deep']
+    assert records[0].children == ['a', 'a-b']
+    assert records[-1].path == '/config/a-b'
+    assert records[-1].data == b'\x00\xff'
+
+
+def test_lookup(zkcli):
+    f = io.BytesIO()
+    with mock.patch('izk.dump.BLOCK_SIZE', 1024):
+        export_tree(zkcli, '/config', f, codec='gzip')
+    reader = DumpReader(f)
+    for path, node in zkcli.nodes.items():
+        if path.startswith('/config'):
+            record = reader.lookup(path)
+            assert record.data == node.data
+            assert record.stat.mzxid == node.mzxid
+            assert record.children == sorted(node.children)
+    assert reader.lookup('/other') is None
+    assert reader.lookup('/config/a/deep/node-9') is None
+    assert reader.lookup('/') is None
+
+
+def test_write_node_without_data():
+    f = io.BytesIO()
+    with DumpWriter(f) as writer:
+        writer.write('/a', None, (0,) * 11, [])
+    assert DumpReader(f).lookup('/a').data is None
+
+
+def test_invalid_dump():
+    with pytest.raises(InvalidDump):
+        DumpReader(io.BytesIO(b'{"not": "a dump"}'))
+
+
+def test_export_command(zkcli, tmp_path):
+    from izk.runner import ZkCommandRunner
+    filename = str(tmp_path / 'config.izk.xz')
+    out = ZkCommandRunner(zkcli).run('export /config %s --compression lzma' % (filename))
+    assert out == 'Exported 588 nodes to %s' % (filename)
+    with open(filename, 'rb') as f:
+        assert DumpReader(f).lookup('/config/a').data == b'{"k": "v"}'
+
+
+def test_export_command_failure_keeps_target(zkcli, tmp_path):
+    from izk.runner import ZkCommandRunner
+    target = tmp_path / 'config.izk'
+    target.write_bytes(b'previous backup')
+    with pytest.raises(NoNodeError):
+        ZkCommandRunner(zkcli).run('export /nope %s' % (target))
+    assert target.read_bytes() == b'previous backup'
+    assert os.listdir(str(tmp_path)) == ['config.izk']
+
+
+def test_export_command_to_directory(zkcli, tmp_path, capsys):
+    from izk.prompt import run_cmd
+    from izk.runner import ZkCommandRunner
+    assert run_cmd(ZkCommandRunner(zkcli), 'export /config %s' % (tmp_path)) is False
+    assert capsys.readouterr().out == '%s is a directory\n' % (tmp_path)
+    assert os.listdir(str(tmp_path)) == []
+
+
+@pytest.fixture
+def dump(zkcli):
+    f = io.BytesIO()
+    with mock.patch('izk.dump.BLOCK_SIZE', 4096):
+        export_tree(zkcli, '/config', f)
+    return f
+
+
+def test_import_round_trip(zkcli, dump):
+    dst = FakeZkClient(latency=0.001)
+    counts = import_tree(dst, dump, '/restored/config', batch_size=50)
+    assert counts == {'created': 588}
+    assert dst.get('/restored/config/a')[0] == b'{"k": "v"}'
+    assert dst.get('/restored/config/a-b')[0] == b'\x00\xff'
+    assert sorted(dst.get_children('/restored/config/a/deep/node-7')) == sorted(
+        zkcli.get_children('/config/a/deep/node-7'))
+    # 588 existence checks and 12 transactions, sent in a pipeline
+    assert dst.requests < 588 + 20
+    assert dst.round_trips < 50
+
+
+@pytest.mark.parametrize('on_conflict, data, counts', [
+    ('skip', b'local', {'created': 586, 'skipped': 2}),
+    ('overwrite', b'{"k": "v"}', {'created': 586, 'updated': 2}),
+])
+def test_import_conflicts(dump, on_conflict, data, counts):
+    dst = FakeZkClient()
+    dst.seed('/config/a', b'local')
+    assert import_tree(dst, dump, '/config', on_conflict=on_conflict) == counts
+    assert dst.get('/config/a')[0] == data
+    assert '/config/a/deep/node-0/node-0' in dst.nodes
+
+
+def test_import_fails_on_version_mismatch(dump):
+    dst = FakeZkClient()
+    dst.seed('/config/a', b'local')
+    dst.set('/config/a', b'changed')
+    with pytest.raises(BadVersionError):
+        import_tree(dst, dump, '/config', on_conflict='fail')
+
+
+def test_import_fail_policy_can_run_again(dump):
+    dst = FakeZkClient()
+    assert import_tree(dst, dump, '/config', on_conflict='fail') == {'created': 588}
+    dump.seek(0)
+    assert import_tree(dst, dump, '/config', on_conflict='fail') == {'skipped': 588}
+    assert dst.get('/config/a')[1].version == 0
+
+
+def test_import_fail_policy_ignores_retried_creations(dump):
+    def missing(async_func, items):
+        # The existence checks miss the nodes created before a connection loss
+        return ((item, None) for item in items)
+
+    dst = FakeZkClient()
+    with mock.patch('izk.dump.pipelined', missing):
+        dst.seed('/config/a', b'{"k": "v"}')
+        counts = import_tree(dst, dump, '/config', on_conflict='fail')
+    assert counts['created'] == 588
+    dst.set('/config/a', b'local')
+    dump.seek(0)
+    with mock.patch('izk.dump.pipelined', missing):
+        with pytest.raises(NodeExistsError):
+            import_tree(dst, dump, '/config', on_conflict='fail')
+
+
+def test_import_skips_reserved_nodes():
+    src = FakeZkClient()
+    src.seed('/zookeeper/quota')
+    src.seed('/app', b'data')
+    f = io.BytesIO()
+    export_tree(src, '/', f)
+    dst = FakeZkClient()
+    assert import_tree(dst, f, '/')['created'] == 1
+    assert dst.get('/app')[0] == b'data'
+
+
+def test_import_command(zkcli, tmp_path, capsys):
+    from izk.runner import ZkCommandRunner
+    filename = str(tmp_path / 'config.izk')
+    ZkCommandRunner(zkcli).run('export /config %s' % (filename))
+    dst = FakeZkClient(read_only=False)
+    out = ZkCommandRunner(dst).run('import %s /copy --batch-size 100' % (filename))
+    assert out == 'Imported /copy: 588 created, 0 updated, 0 skipped'
+    assert capsys.readouterr().err.endswith('Imported 588/588 (100%)\n')
+
+
+def test_import_command_from_directory(tmp_path, capsys):
+    from izk.prompt import run_cmd
+    from izk.runner import ZkCommandRunner
+    dst = FakeZkClient(read_only=False)
+    assert run_cmd(ZkCommandRunner(dst), 'import %s /copy' % (tmp_path)) is False
+    assert 'Is a directory' in capsys.readouterr().out
+
+
+@pytest.fixture
+def dump_client(zkcli, tmp_path):
+    filename = str(tmp_path / 'config.izk')
+    with open(filename, 'wb') as f, mock.patch('izk.dump.BLOCK_SIZE', 4096):
+        export_tree(zkcli, '/config', f, codec='gzip')
+    with DumpClient(open(filename, 'rb')) as client:
+        yield client
+
+
+def test_dump_client_is_memory_mapped(dump_client):
+    assert dump_client.reader._buffer is not None
+    assert dump_client.root == '/config'
+    assert 'Dump of /config: 588 nodes, gzip compression' in dump_client.command(b'srvr')
+
+
+def test_dump_client_reads(zkcli, dump_client):
+    assert dump_client.get('/config/a') == zkcli.get('/config/a')
+    assert dump_client.get_children('/config/a/deep', include_data=True) == (
+        zkcli.get_children('/config/a/deep', include_data=True))
+    assert dump_client.exists('/config/nope') is None
+    assert dump_client.stat('/config') == zkcli.stat('/config')
+    with pytest.raises(NoNodeError):
+        dump_client.get('/other')
+
+
+def test_dump_client_caches_blocks(dump_client):
+    reader = dump_client.reader
+    with mock.patch.object(reader, 'read_block', wraps=reader.read_block) as read_block:
+        for _ in range(3):
+            dump_client.get('/config/a/deep/node-0/node-0/node-0')
+        assert read_block.call_count == 1
+
+
+def test_dump_client_is_read_only(dump_client):
+    dump_client.read_only = False
+    assert dump_client.read_only is True
+
+
+def test_browse_dump(dump_client, capsys):
+    from izk.runner import ZkCommandRunner, UnauthorizedWrite
+    runner = ZkCommandRunner(dump_client)
+    runner.run('ftree /config/a/deep/node-7 --depth 1')
+    assert capsys.readouterr().out.splitlines()[:3] == [
+        '/config/a/deep/node-7',
+        '├── /config/a/deep/node-7/node-0',
+        '├── /config/a/deep/node-7/node-1',
+    ]
+    runner.run('find /config --name node-7 --depth 3')
+    assert capsys.readouterr().out.splitlines() == ['/config/a/deep/node-7']
+    assert 'numChildren = 8' in runner.run('stat /config/a/deep')
+    with pytest.raises(UnauthorizedWrite):
+        runner.run('rmr /config')
@@ -0,0 +1,62 @@
+import json
+
+import pytest
+from pygments import styles
+
+from izk.formatting import (
+    colorize, columnize, format_size, get_formatter, HIGHLIGHT_MAX_SIZE, STYLE_NAMES)
+from izk.prompt import g
+
+
+@colorize
+def echo(out):
+    return out
+
+
+@pytest.fixture
+def style():
+    g.style = styles.get_style_by_name('monokai')
+    yield g.style
+    g.style = None
+
+
+def test_colorize_without_style():
+    g.style = None
+    assert echo('{"a": 1}') == '{"a": 1}'
+
+
+def test_colorize_json(style):
+    out = echo('{"a": 1}')
+    assert out != '{"a": 1}'
+    assert '\x1b[' in out
+    assert len(out.splitlines()) == 3  # the JSON was indented
+
+
+def test_colorize_reuses_formatter(style):
+    echo('plop')
+    echo('plop')
+    assert get_formatter.cache_info().hits >= 1
+
+
+def test_colorize_large_payload_is_not_highlighted(style):
+    payload = json.dumps({'partitions': ['x' * 100] * (HIGHLIGHT_MAX_SIZE // 100)})
+    assert echo(payload) == payload
+
+
+def test_columnize():
+    assert columnize(['a', 'b', 'c'], 2).split() == ['a', 'b', 'c']
+
+
+@pytest.mark.parametrize('size, expected', [
+    (0, '0B'), (1023, '1023B'), (1536, '1.5K'), (10 * 2 ** 20, '10.0M'),
+    (5 * 2 ** 40, '5.0T'),
+])
+def test_format_size(size, expected):
+    assert format_size(size) == expected
+
+
+def test_style_names():
+    assert 'monokai' in STYLE_NAMES
+    assert 'none' in STYLE_NAMES
+    assert 'not-a-style' not in STYLE_NAMES
+    assert set(STYLE_NAMES) == set(styles.get_all_styles()) | {'none'}
@@ -0,0 +1,51 @@
+import pytest
+
+from izk.latency import LatencyHistogram, BUCKET_GROWTH, probe, format_histogram
+
+from tests.fakezk import FakeZkClient
+
+
+def test_histogram_percentiles():
+    histogram = LatencyHistogram()
+    for i in range(1, 1001):
+        histogram.record(i / 1000)
+    assert len(histogram) == 1000
+    assert histogram.min == 0.001 and histogram.max == 1
+    assert histogram.mean == pytest.approx(0.5005)
+    for percent in (50, 90, 99):
+        expected = percent / 100
+        assert expected <= histogram.percentile(percent) <= expected * BUCKET_GROWTH
+    assert histogram.percentile(100) == 1
+    # Only the buckets are stored, not the values
+    assert len(histogram.buckets) < 400
+
+
+def test_histogram_empty():
+    histogram = LatencyHistogram()
+    assert histogram.percentile(50) is None
+    assert format_histogram(histogram) == 'n=0 min=- p50=- p90=- p99=- max=-'
+
+
+def test_histogram_merge():
+    a, b = LatencyHistogram(), LatencyHistogram()
+    a.record(0.001)
+    b.record(0.1)
+    b.record(0.2)
+    a.merge(b)
+    assert (a.count, a.min, a.max) == (3, 0.001, 0.2)
+    assert a.percentile(50) == pytest.approx(0.1, rel=BUCKET_GROWTH - 1)
+
+
+@pytest.mark.parametrize('concurrency, max_round_trips', [(1, 20), (10, 2)])
+def test_probe(concurrency, max_round_trips):
+    zkcli = FakeZkClient(latency=0.002)
+    histogram = probe(zkcli, '/missing', count=20, concurrency=concurrency)
+    assert histogram.count == zkcli.requests == 20
+    assert zkcli.round_trips <= max_round_trips
+    assert histogram.max >= 0.002
+
+
+def test_probe_get():
+    zkcli = FakeZkClient()
+    zkcli.seed('/a', b'data')
+    assert probe(zkcli, '/a', count=5, operation='get').count == 5
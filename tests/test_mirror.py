@@ -0,0 +1,136 @@
+import unittest.mock as mock
+
+import pytest
+from kazoo.exceptions import NoNodeError
+from kazoo.protocol.states import WatchedEvent, EventType, KeeperState
+
+from izk.mirror import MirroredTree, MirrorClient, MirrorTooLarge
+from tests.fakezk import FakeAsyncResult, FakeZkClient
+
+
+@pytest.fixture
+def zkcli():
+    zkcli = FakeZkClient()
+    zkcli.seed_deep('/config', depth=3, width=5, data=b'data')
+    zkcli.seed('/other', b'other')
+    return zkcli
+
+
+@pytest.fixture
+def mirror(zkcli):
+    mirror = MirroredTree(zkcli, '/config', window=20)
+    mirror.load()
+    zkcli.reset_counters()
+    return mirror
+
+
+def test_load(zkcli):
+    mirror = MirroredTree(zkcli, '/config')
+    mirror.load()
+    assert len(mirror) == 1 + 5 + 25 + 125
+    data, stat, children = mirror.lookup('/config/node-1')
+    assert data == b'data'
+    assert stat == zkcli.nodes['/config/node-1'].stat()
+    assert children == ['node-%d' % (i) for i in range(5)]
+    assert mirror.lookup('/config/nope') is None
+
+
+def test_load_nonexisting_path(zkcli):
+    with pytest.raises(NoNodeError):
+        MirroredTree(zkcli, '/nope').load()
+
+
+def test_load_too_large(zkcli):
+    mirror = MirroredTree(zkcli, '/config', max_bytes=10000)
+    with pytest.raises(MirrorTooLarge):
+        mirror.load()
+    assert not mirror.enabled
+    assert len(mirror) == mirror.size == 0
+
+
+def test_reads_are_answered_locally(zkcli, mirror):
+    client = MirrorClient(zkcli, mirror)
+    assert client.get('/config/node-0/node-1')[0] == b'data'
+    assert len(client.get_children('/config/node-0')) == 5
+    children, stat = client.get_children('/config', include_data=True)
+    assert stat.numChildren == len(children) == 5
+    assert client.exists('/config/nope') is None
+    assert client.stat('/config').numChildren == 5
+    with pytest.raises(NoNodeError):
+        client.get('/config/nope')
+    assert zkcli.requests == 0
+    # Reads outside of the mirrored subtree are sent to the server
+    assert client.get('/other')[0] == b'other'
+    assert zkcli.requests == 1
+
+
+def test_mirror_follows_changes(zkcli, mirror):
+    zkcli.set('/config/node-0', b'updated')
+    data, stat, _ = mirror.lookup('/config/node-0')
+    assert (data, stat) == (b'updated', zkcli.nodes['/config/node-0'].stat())
+
+    zkcli.create('/config/node-0/new', b'new')
+    zkcli.create('/config/node-0/new/child', b'child')
+    assert 'new' in mirror.lookup('/config/node-0')[2]
+    assert mirror.lookup('/config/node-0/new/child')[0] == b'child'
+
+    zkcli.delete('/config/node-1', recursive=True)
+    assert mirror.lookup('/config/node-1') is None
+    assert mirror.lookup('/config/node-1/node-1/node-1') is None
+    assert 'node-1' not in mirror.lookup('/config')[2]
+    assert len(mirror) == 1 + 4 + 20 + 100 + 2
+
+
+def test_watch_delivered_before_response(zkcli):
+    mirror = MirroredTree(zkcli, '/config')
+    responses = []
+    with mock.patch.object(FakeAsyncResult, 'rawlink', autospec=True,
+                           side_effect=lambda result, callback: responses.append(
+                               (callback, result))):
+        mirror._schedule('/config')
+    # The watches fire before the responses to the requests that set them
+    zkcli.set('/config', b'updated')
+    zkcli.create('/config/new', b'new')
+    for callback, result in responses:
+        callback(result)
+    assert mirror.covers('/config')
+    data, _, children = mirror.lookup('/config')
+    assert data == b'updated'
+    assert 'new' in children
+    assert mirror.lookup('/config/new')[0] == b'new'
+    assert len(mirror) == 1 + 6 + 25 + 125
+
+
+def test_connection_loss(zkcli, mirror):
+    client = MirrorClient(zkcli, mirror)
+    mirror._on_data_event(WatchedEvent(EventType.NONE, KeeperState.CONNECTING, None))
+    assert zkcli.requests == 0
+
+    zkcli.lose_connection()
+    assert not mirror.covers('/config')
+    # The watches are lost, so the reads are sent to the server
+    zkcli.set('/config/node-0', b'updated')
+    assert client.get('/config/node-0')[0] == b'updated'
+    assert zkcli.requests == 2
+
+    zkcli.restore_connection()
+    assert mirror.covers('/config')
+    assert mirror.lookup('/config/node-0')[0] == b'updated'
+    assert len(mirror) == 1 + 5 + 25 + 125
+    # The watches are registered again
+    zkcli.set('/config/node-1', b'updated')
+    assert mirror.lookup('/config/node-1')[0] == b'updated'
+
+
+def test_mirror_size_is_bounded(zkcli, mirror):
+    mirror.max_bytes = mirror.size + 100
+    zkcli.set('/config/node-0', b'x' * 1000)
+    assert not mirror.enabled
+    assert not mirror.covers('/config')
+    assert MirrorClient(zkcli, mirror).get('/config/node-0')[0] == b'x' * 1000
+
+
+def test_read_only_is_proxied(zkcli, mirror):
+    client = MirrorClient(zkcli, mirror)
+    client.read_only = True
+    assert zkcli.read_only is True
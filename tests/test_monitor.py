@@ -0,0 +1,95 @@
+import io
+import json
+
+from izk.monitor import (
+    Sample, parse_mntr, parse_cons, rates, format_table, sample_ensemble, MetricsRecorder)
+
+MNTR = """zk_version\t3.8.4-9316c2a7a97e1666d8f4593f34dd6fc36ecc436c
+zk_avg_latency\t0.5
+zk_max_latency\t12
+zk_packets_received\t1000
+zk_packets_sent\t2000
+zk_num_alive_connections\t2
+zk_outstanding_requests\t0
+zk_server_state\tfollower
+zk_znode_count\t42
+zk_watch_count\t3
+"""
+
+CONS = """ /10.0.0.1:52236[1](queued=2,recved=10,sent=10,sid=0x100,lop=PING)
+ /10.0.0.2:41022[0](queued=1,recved=1,sent=0)
+
+"""
+
+
+class FakeEnsemble:
+
+    def command_all(self, cmd):
+        if cmd == b'mntr':
+            return {'zk1:2181': MNTR, 'zk2:2181': 'Error: connection refused'}
+        return {'zk1:2181': CONS}
+
+
+def test_parse_mntr():
+    metrics = parse_mntr(MNTR)
+    assert metrics['zk_server_state'] == 'follower'
+    assert metrics['zk_avg_latency'] == 0.5
+    assert metrics['zk_znode_count'] == 42
+    assert metrics['zk_version'].startswith('3.8.4')
+
+
+def test_parse_cons():
+    connections = parse_cons(CONS)
+    assert [c['address'] for c in connections] == ['10.0.0.1:52236', '10.0.0.2:41022']
+    assert connections[0]['queued'] == 2
+    assert connections[0]['lop'] == 'PING'
+
+
+def test_sample_ensemble():
+    sample, failed = sample_ensemble(FakeEnsemble())
+    assert sample.host == 'zk1:2181' and sample.error is None
+    assert sample.metrics['zk_client_queued'] == 3
+    assert failed.error == 'connection refused' and failed.metrics == {}
+
+
+def test_rates():
+    previous = Sample('zk1:2181', 10.0, {'zk_packets_received': 100}, None)
+    current = Sample('zk1:2181', 12.0, {'zk_packets_received': 300}, None)
+    assert rates(previous, current) == {'zk_packets_received': 100.0}
+    assert rates(current, current) == {}
+
+
+def test_format_table():
+    previous = Sample('zk1:2181', 0.0, parse_mntr(MNTR), None)
+    metrics = dict(parse_mntr(MNTR), zk_packets_received=1500)
+    current = [
+        Sample('zk1:2181', 5.0, metrics, None),
+        Sample('zk2:2181', 5.0, {}, 'connection refused'),
+    ]
+    header, first, second = format_table(current, {'zk1:2181': previous})
+    assert header.split()[:4] == ['HOST', 'STATE', 'RECV/S', 'SENT/S']
+    assert first.split()[:4] == ['zk1:2181', 'follower', '100', '0']
+    assert second.split() == ['zk2:2181', 'connection', 'refused']
+    # Without previous samples, rates are not displayed
+    assert format_table(current[:1])[1].split()[2] == '-'
+
+
+def test_recorder_jsonl():
+    fileobj = io.StringIO()
+    MetricsRecorder(fileobj).write([
+        Sample('zk1:2181', 1.5, {'zk_znode_count': 42}, None),
+        Sample('zk2:2181', 1.5, {}, 'connection refused'),
+    ])
+    records = [json.loads(line) for line in fileobj.getvalue().splitlines()]
+    assert records == [{'host': 'zk1:2181', 'time': 1.5, 'zk_znode_count': 42}]
+
+
+def test_recorder_csv_header_written_once():
+    fileobj = io.StringIO()
+    sample = Sample('zk1:2181', 1.5, parse_mntr(MNTR), None)
+    MetricsRecorder(fileobj, fmt='csv').write([sample])
+    MetricsRecorder(fileobj, fmt='csv').write([sample])
+    rows = fileobj.getvalue().splitlines()
+    assert len(rows) == 3
+    assert rows[0].startswith('time,host,zk_server_state')
+    assert rows[1].startswith('1.500,zk1:2181,follower,1000,2000')
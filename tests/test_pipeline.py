@@ -0,0 +1,72 @@
+import time
+import unittest.mock as mock
+
+import pytest
+
+from kazoo.exceptions import NoNodeError, ConnectionLoss
+
+from izk.pipeline import pipelined, walk, delete_recursive, RateLimiter
+from tests.fakezk import FakeZkClient
+
+
+@pytest.fixture
+def zkcli():
+    zkcli = FakeZkClient()
+    for path in ('/a/b/c', '/a/b/d', '/a/e', '/f'):
+        zkcli.seed(path)
+    return zkcli
+
+
+def test_pipelined_keeps_order(zkcli):
+    paths = ['/f', '/nope', '/a']
+    results = list(pipelined(zkcli.exists_async, paths, window=2))
+    assert [path for path, _ in results] == paths
+    assert results[1][1] is None
+    assert results[2][1].numChildren == 2
+
+
+def test_walk_depth_first(zkcli):
+    nodes = list(walk(zkcli, '/', window=2))
+    assert [node.path for node in nodes] == [
+        '/', '/a', '/a/b', '/a/b/c', '/a/b/d', '/a/e', '/f']
+    assert [node.depth for node in nodes] == [0, 1, 2, 3, 3, 2, 1]
+    assert nodes[1].children == ['b', 'e']
+
+
+def test_walk_max_depth(zkcli):
+    nodes = list(walk(zkcli, '/a', max_depth=1))
+    assert [node.path for node in nodes] == ['/a', '/a/b', '/a/e']
+    assert nodes[1].children == []
+    assert nodes[1].stat.numChildren == 2
+
+
+def test_walk_nonexisting_path(zkcli):
+    with pytest.raises(NoNodeError):
+        list(walk(zkcli, '/nope'))
+
+
+def test_rate_limiter():
+    limiter = RateLimiter(rate=1000)
+    start = time.monotonic()
+    for _ in range(10):
+        limiter.acquire(20)
+    assert time.monotonic() - start >= 0.18
+
+
+def test_delete_recursive_resumes_after_connection_loss(zkcli):
+    zkcli.seed_wide('/a/b/c', 50)
+    real_transaction = zkcli.transaction
+    transactions = []
+
+    def flaky_transaction():
+        transaction = real_transaction()
+        transactions.append(transaction)
+        if len(transactions) == 2:
+            transaction.commit_async = mock.Mock(side_effect=ConnectionLoss)
+        return transaction
+
+    progress = mock.Mock()
+    with mock.patch.object(zkcli, 'transaction', side_effect=flaky_transaction):
+        assert delete_recursive(zkcli, '/a', batch_size=10, progress=progress) == 55
+    assert sorted(zkcli.nodes) == ['/', '/f']
+    progress.assert_called_with(55, 55)
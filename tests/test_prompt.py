@@ -1,4 +1,7 @@
 import os
+import subprocess
+import sys
+
 import pytest
 
 from izk.prompt import EnvDefault, render_prompt
@@ -55,3 +58,12 @@ def test_env_default_int_type(monkeypatch):
 ])
 def test_render_prompt(step, read_only, expected):
     assert render_prompt(step, read_only) == expected
+
+
+def test_startup_does_not_import_the_interactive_dependencies():
+    """prompt_toolkit and the pygments styles are only needed by the interactive shell"""
+    code = (
+        'import sys, izk.prompt; '
+        'print([m for m in sys.modules if m.startswith(("prompt_toolkit", "pygments."))])')
+    out = subprocess.check_output([sys.executable, '-c', code])
+    assert out.strip() == b'[]'
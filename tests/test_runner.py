@@ -2,8 +2,10 @@ import pytest
 import unittest.mock as mock
 
 from kazoo.exceptions import NoNodeError, NotEmptyError
+from kazoo.handlers.threading import KazooTimeoutError
 
 from izk.validation import CommandValidationError
+from tests.fakezk import FakeZkClient
 import izk.runner
 
 
@@ -21,6 +23,12 @@ def rw_zk_runner():
     return izk.runner.ZkCommandRunner(zkcli)
 
 
+@pytest.fixture
+def fake_zk_runner():
+    """A runner of shell commands with an in-memory zk client"""
+    return izk.runner.ZkCommandRunner(FakeZkClient(latency=0.001, read_only=True))
+
+
 def test_command_usage():
     expected = """Usage: help [command]
 Examples:
@@ -52,13 +60,22 @@ def test_quit(zk_runner):
 def test_help_general(zk_runner):
     out = zk_runner.run('help')
     expected = """Commands:
+- bench: Measure the throughput and latency of a mix of reads and writes
 - create: Recursively create a path if it doesn't exist
 - delete: Delete a leaf ZNode
+- diff: Display the differences between two subtrees, possibly on another ensemble
+- du: Display the data size and number of nodes of a ZNode subtree
 - edit: Edit the content of a ZNode
 - exit: Close the shell
+- export: Export a ZNode and its descendants to a local file
+- find: Find the ZNodes of a subtree matching all the given criteria
 - get: Display the content of a ZNode
+- grep: Search a pattern in the data of the ZNodes of a subtree
 - help: Print the help of a command
+- import: Import the ZNodes of an exported file under a path
 - ls: Display the children of a ZNode
+- mirror: Display the status of the local mirror of a subtree
+- ping: Measure the latency of requests sent to zookeeper
 - tree: Display a tree of a ZNode recursively
 - ftree: Display a tree of a ZNode recursively with full path
 - quit: Close the shell
@@ -66,7 +83,11 @@ def test_help_general(zk_runner):
 - rmr: Recursively delete all children ZNodes, along with argument node.
 - set: Set or update the content of a ZNode
 - stat: Display a ZNode's metadata
-- toggle_write: Activate/deactivate read-only mode"""
+- sync: Copy the missing and different ZNodes of a subtree to another path or ensemble
+- timing: Report the requests sent to zookeeper and the time spent by each command
+- toggle_write: Activate/deactivate read-only mode
+- top: Display live metrics of all the ensemble nodes
+- watch: Display the changes of a ZNode, or of its whole subtree, as they happen"""
     assert out == expected
 
 
@@ -86,14 +107,24 @@ def test_ls_nonexisting_path(zk_runner):
 
 
 def test_ls(zk_runner):
-    with mock.patch.object(
-        zk_runner.zkcli, 'get_children', side_effect=[
-            ['a', 'b', 'c'],  # 3 nodes found in path
-            [], [], [],  # none of these 3 nodes have children nodes
-        ]
-    ):
+    with mock.patch.object(zk_runner.zkcli, 'get_children', return_value=['a', 'b', 'c']):
+        # none of these 3 nodes have children nodes
+        zk_runner.zkcli.exists_async.return_value.get.return_value.numChildren = 0
         nodes = zk_runner.run('ls /')
         assert nodes.split() == ['a', 'b', 'c']
+        assert zk_runner.zkcli.get_children.call_count == 1
+
+
+def test_ls_pipelines_children_stats(fake_zk_runner):
+    zkcli = fake_zk_runner.zkcli
+    zkcli.seed_wide('/wide', 1000)
+    zkcli.seed('/wide/node-000000/child')
+    with mock.patch('colored.stylize', side_effect=lambda node, style: '*' + node):
+        nodes = fake_zk_runner.run('ls /wide').split()
+    assert len(nodes) == 1000
+    assert nodes[:2] == ['*node-000000', 'node-000001']
+    assert zkcli.requests == 1001
+    assert zkcli.round_trips < 50  # instead of 1001 round-trips
 
 
 def test_get_nonexisting_node(zk_runner):
@@ -163,10 +194,71 @@ def test_rmr_no_confirmation(confirm_mock, rw_zk_runner):
     assert rw_zk_runner.zkcli.delete.call_count == 0
 
 
+@pytest.fixture
+def rw_fake_zk_runner():
+    """A runner of shell commands with an in-memory zk client, in read-write mode"""
+    return izk.runner.ZkCommandRunner(FakeZkClient(latency=0.001, read_only=False))
+
+
 @mock.patch('izk.runner.ask_for_confirmation', return_value=True)
-def test_rmr_with_confirmation(confirm_mock, rw_zk_runner):
-    rw_zk_runner.run('rmr /test')
-    rw_zk_runner.zkcli.delete.assert_called_once_with('/test', recursive=True)
+def test_rmr_with_confirmation(confirm_mock, rw_fake_zk_runner, capsys):
+    zkcli = rw_fake_zk_runner.zkcli
+    zkcli.seed_deep('/test', depth=3, width=10)
+    zkcli.seed('/other')
+    rw_fake_zk_runner.run('rmr /test --batch-size 100')
+    assert sorted(zkcli.nodes) == ['/', '/other']
+    assert zkcli.requests < 1111 + 20  # 1111 nodes, deleted in 12 transactions
+    assert capsys.readouterr().err.endswith('Deleted 1111/1111 (100%)\n')
+
+
+@mock.patch('izk.runner.ask_for_confirmation', return_value=True)
+def test_rmr_root_keeps_reserved_nodes(confirm_mock, rw_fake_zk_runner):
+    zkcli = rw_fake_zk_runner.zkcli
+    zkcli.seed('/zookeeper/quota')
+    zkcli.seed_wide('/test', 10)
+    rw_fake_zk_runner.run('rmr /')
+    assert sorted(zkcli.nodes) == ['/', '/zookeeper', '/zookeeper/quota']
+
+
+@mock.patch('izk.runner.ask_for_confirmation', return_value=True)
+def test_rmr_concurrent_creation(confirm_mock, rw_fake_zk_runner):
+    zkcli = rw_fake_zk_runner.zkcli
+    zkcli.seed_wide('/test', 10)
+    # A node created during the deletion makes its parent deletion fail
+    real_delete = zkcli._delete
+
+    def concurrent_create(path):
+        if path == '/test/node-000000':
+            zkcli.seed('/test/new')
+        return real_delete(path)
+
+    with mock.patch.object(zkcli, '_delete', side_effect=concurrent_create):
+        with pytest.raises(NotEmptyError, match='run rmr again'):
+            rw_fake_zk_runner.run('rmr /test')
+    assert sorted(zkcli.nodes) == ['/', '/test', '/test/new']
+
+
+@mock.patch('izk.runner.ask_for_confirmation', return_value=True)
+def test_rmr_falls_back_to_single_deletes(confirm_mock, rw_fake_zk_runner):
+    zkcli = rw_fake_zk_runner.zkcli
+    zkcli.seed_wide('/test', 10)
+    # A node disappearing during the walk makes its transaction fail
+    real_delete = zkcli._delete
+
+    def concurrent_delete(path):
+        if path == '/test/node-000009' and path in zkcli.nodes:
+            real_delete(path)
+        return real_delete(path)
+
+    with mock.patch.object(zkcli, '_delete', side_effect=concurrent_delete):
+        rw_fake_zk_runner.run('rmr /test')
+    assert sorted(zkcli.nodes) == ['/']
+
+
+@mock.patch('izk.runner.ask_for_confirmation', return_value=True)
+def test_rmr_nonexisting_path(confirm_mock, rw_fake_zk_runner):
+    with pytest.raises(NoNodeError):
+        rw_fake_zk_runner.run('rmr /nope')
 
 
 def test_toggle_write(zk_runner):
@@ -178,3 +270,249 @@ def test_toggle_write(zk_runner):
 def test_raw(zk_runner):
     zk_runner.run('raw srvr')
     zk_runner.zkcli.command.assert_called_once_with(b'srvr')
+
+
+@pytest.fixture
+def tree_zk_runner(fake_zk_runner):
+    for path in ('/a/b/c', '/a/b/d', '/a/e', '/f'):
+        fake_zk_runner.zkcli.seed(path)
+    return fake_zk_runner
+
+
+def test_tree(tree_zk_runner, capsys):
+    tree_zk_runner.run('tree /')
+    assert capsys.readouterr().out.splitlines() == [
+        '/',
+        '├── a',
+        '│   ├── b',
+        '│   │   ├── c',
+        '│   │   ├── d',
+        '│   ├── e',
+        '├── f',
+    ]
+
+
+def test_ftree_depth(tree_zk_runner, capsys):
+    tree_zk_runner.run('ftree /a --depth 1')
+    assert capsys.readouterr().out.splitlines() == ['/a', '├── /a/b', '├── /a/e']
+
+
+def test_tree_max_nodes(tree_zk_runner, capsys):
+    tree_zk_runner.run('tree / --max-nodes 3')
+    assert capsys.readouterr().out.splitlines() == [
+        '/', '├── a', '│   ├── b', '[truncated after 3 nodes]']
+
+
+def test_tree_nonexisting_path(tree_zk_runner):
+    with pytest.raises(NoNodeError):
+        tree_zk_runner.run('tree /nope')
+
+
+def test_tree_pipelines_requests(fake_zk_runner, capsys):
+    fake_zk_runner.zkcli.seed_deep('/deep', depth=4, width=6)
+    fake_zk_runner.run('tree /deep')
+    assert len(capsys.readouterr().out.splitlines()) == 1 + 6 + 36 + 216 + 1296
+    assert fake_zk_runner.zkcli.round_trips < 50  # instead of 1555 round-trips
+
+
+def test_du(fake_zk_runner, capsys):
+    zkcli = fake_zk_runner.zkcli
+    zkcli.seed('/app/small', b'x')
+    zkcli.seed('/app/big/child', b'x' * 2048)
+    fake_zk_runner.run('du /app')
+    assert capsys.readouterr().out.splitlines() == [
+        '2.0K     2        /app/big',
+        '1B       1        /app/small',
+        '2.0K     4        /app',
+        '',
+        'Largest children:',
+        '2.0K     2        /app/big',
+        '1B       1        /app/small',
+    ]
+
+
+def test_find(tree_zk_runner, capsys):
+    tree_zk_runner.zkcli.seed('/a/b/lock', ephemeral_owner=1)
+    tree_zk_runner.run("find / --name '[cl]*'")
+    assert capsys.readouterr().out.splitlines() == ['/a/b/c', '/a/b/lock']
+    tree_zk_runner.run('find /a --ephemeral --owner 1')
+    assert capsys.readouterr().out.splitlines() == ['/a/b/lock']
+
+
+def test_find_invalid_regex(tree_zk_runner):
+    with pytest.raises(CommandValidationError, match='Invalid regex'):
+        tree_zk_runner.run("find / --regex '('")
+
+
+def test_grep(fake_zk_runner, capsys):
+    fake_zk_runner.zkcli.seed('/a', b'host: db-01\nport: 5432')
+    fake_zk_runner.zkcli.seed('/a/b', b'host: db-02')
+    with mock.patch('izk.runner.colored.stylize', side_effect=lambda text, style: text):
+        fake_zk_runner.run("grep 'host: db' /a --max-bytes 30")
+    assert capsys.readouterr().out.splitlines() == [
+        '/a: host: db-01', '[stopped after fetching 22B]']
+
+
+def test_grep_invalid_pattern(fake_zk_runner):
+    with pytest.raises(CommandValidationError, match='Invalid pattern'):
+        fake_zk_runner.run("grep '(' /")
+
+
+def test_diff_with_unreachable_ensemble(fake_zk_runner, capsys):
+    from izk.prompt import run_cmd
+    other = mock.MagicMock()
+    other.__enter__.side_effect = KazooTimeoutError('Connection time-out')
+    fake_zk_runner.client_factory = mock.Mock(return_value=other)
+    assert run_cmd(fake_zk_runner, 'diff zk://127.0.0.1:1/x /y') is False
+    assert capsys.readouterr().out == (
+        'Error: Could not connect to 127.0.0.1:1: Connection time-out\n')
+
+
+def test_diff_with_another_ensemble(fake_zk_runner, capsys):
+    fake_zk_runner.zkcli.seed('/config/a', b'x: 1\ny: 2')
+    other = FakeZkClient()
+    other.seed('/config/a', b'x: 1\ny: 3')
+    other.seed('/config/b')
+    fake_zk_runner.client_factory = mock.Mock(return_value=other)
+    fake_zk_runner.run('diff /config zk://prod:2181/config')
+    fake_zk_runner.client_factory.assert_called_once_with(
+        hosts='prod:2181', timeout=2, read_only=True)
+    assert capsys.readouterr().out.splitlines() == [
+        '~ /a',
+        '--- /config/a',
+        '+++ zk://prod:2181/config/a',
+        '@@ -1,2 +1,2 @@',
+        ' x: 1',
+        '-y: 2',
+        '+y: 3',
+        '+ /b',
+        '1 added, 0 removed, 1 changed',
+    ]
+
+
+def test_sync_dry_run(fake_zk_runner, capsys):
+    zkcli = fake_zk_runner.zkcli
+    zkcli.seed('/src/a', b'1')
+    zkcli.seed('/dst/a', b'2')
+    zkcli.seed('/dst/b')
+    fake_zk_runner.run('sync /src /dst --dry-run --delete')
+    assert capsys.readouterr().out.splitlines() == ['~ /dst/a', '- /dst/b']
+    assert zkcli.get('/dst/a')[0] == b'2'
+
+
+def test_sync_read_only(fake_zk_runner):
+    with pytest.raises(izk.runner.UnauthorizedWrite):
+        fake_zk_runner.run('sync /src /dst')
+
+
+@mock.patch('izk.runner.ask_for_confirmation', return_value=True)
+def test_sync_to_another_ensemble(confirm_mock, rw_fake_zk_runner):
+    rw_fake_zk_runner.zkcli.seed('/src/a', b'1')
+    other = FakeZkClient()
+    other.seed('/dst/b')
+    rw_fake_zk_runner.client_factory = mock.Mock(return_value=other)
+    out = rw_fake_zk_runner.run('sync /src zk://prod:2181/dst --delete')
+    assert out == 'Synchronized zk://prod:2181/dst: 1 created, 0 updated, 1 deleted'
+    rw_fake_zk_runner.client_factory.assert_called_once_with(
+        hosts='prod:2181', timeout=2, read_only=False)
+    assert sorted(other.get_children('/dst')) == ['a']
+
+
+def test_mirror(fake_zk_runner):
+    from izk.mirror import MirroredTree, MirrorClient
+    assert fake_zk_runner.run('mirror').startswith('No mirror')
+    fake_zk_runner.zkcli.seed('/config/a', b'data')
+    mirror = MirroredTree(fake_zk_runner.zkcli, '/config')
+    mirror.load()
+    fake_zk_runner.zkcli = MirrorClient(fake_zk_runner.zkcli, mirror)
+    assert fake_zk_runner.run('mirror') == (
+        'Mirroring /config: 2 nodes, using %dB out of 256.0M' % (mirror.size))
+
+
+def test_raw_all(zk_runner):
+    zk_runner.zkcli.command_all.return_value = {
+        'zk1:2181': 'imok', 'zk2:2181': 'Error: timed out'}
+    out = zk_runner.run('raw ruok --all')
+    zk_runner.zkcli.command_all.assert_called_once_with(b'ruok')
+    assert out.splitlines() == ['zk1:2181', 'imok', 'zk2:2181', 'Error: timed out']
+
+
+def test_top(zk_runner, tmpdir, capsys):
+    zk_runner.zkcli.command_all.side_effect = lambda cmd: {
+        b'mntr': {
+            'zk1:2181': 'zk_server_state\tleader\nzk_packets_received\t10\n',
+            'zk2:2181': 'Error: timed out'},
+        b'cons': {'zk1:2181': ' /10.0.0.1:52236[1](queued=3,recved=1,sent=1)\n'},
+    }[cmd]
+    output = tmpdir.join('metrics.csv')
+    zk_runner.run('top --count 1 --output %s --format csv' % (output))
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].split()[:3] == ['HOST', 'STATE', 'RECV/S']
+    assert lines[1].split()[:2] == ['zk1:2181', 'leader']
+    assert lines[2].split() == ['zk2:2181', 'timed', 'out']
+    rows = output.read().splitlines()
+    assert len(rows) == 2 and rows[1].endswith(',3')
+
+
+def test_ping(fake_zk_runner):
+    out = fake_zk_runner.run('ping / --count 10 --concurrency 2')
+    assert out.startswith('exists /: n=10 min=')
+    assert fake_zk_runner.zkcli.requests == 10
+
+
+def test_ping_per_host(fake_zk_runner, capsys):
+    fake_zk_runner.zkcli.hosts = [('zk1', 2181), ('zk2', 2181)]
+    fake_zk_runner.client_factory = mock.Mock(return_value=FakeZkClient())
+    fake_zk_runner.run('ping --per-host --get --count 5')
+    lines = capsys.readouterr().out.splitlines()
+    assert [line.split()[:2] for line in lines] == [
+        ['zk1:2181', 'n=5'], ['zk2:2181', 'n=5']]
+    fake_zk_runner.client_factory.assert_any_call(
+        hosts='zk1:2181', timeout=2, read_only=True)
+
+
+def test_ping_per_host_keeps_chroot(fake_zk_runner, capsys):
+    fake_zk_runner.zkcli.hosts = [('zk1', 2181)]
+    fake_zk_runner.zkcli.chroot = '/app'
+    fake_zk_runner.client_factory = mock.Mock(return_value=FakeZkClient())
+    fake_zk_runner.run('ping --per-host --count 5')
+    fake_zk_runner.client_factory.assert_called_once_with(
+        hosts='zk1:2181/app', timeout=2, read_only=True)
+
+
+def test_ping_per_host_unreachable(fake_zk_runner, capsys):
+    fake_zk_runner.zkcli.hosts = [('zk1', 2181)]
+    other = mock.MagicMock()
+    other.__enter__.side_effect = KazooTimeoutError()
+    fake_zk_runner.client_factory = mock.Mock(return_value=other)
+    fake_zk_runner.run('ping --per-host --count 5')
+    assert capsys.readouterr().out == (
+        'zk1:2181 Error: Could not connect to zk1:2181: KazooTimeoutError\n')
+
+
+def test_ping_per_host_without_hosts(fake_zk_runner):
+    assert fake_zk_runner.run('ping --per-host').startswith('No ensemble node to ping')
+
+
+def test_bench(rw_fake_zk_runner):
+    out = rw_fake_zk_runner.run('bench /bench --requests 100 --mix read=3,write=1')
+    assert out.splitlines()[0].startswith('100 requests in')
+    assert '/bench' not in rw_fake_zk_runner.zkcli.nodes
+
+
+@pytest.mark.parametrize('options', ['--nodes 0', '--mix read=0,write=0'])
+def test_bench_invalid_options(rw_fake_zk_runner, options):
+    with pytest.raises(CommandValidationError):
+        rw_fake_zk_runner.run('bench /bench %s' % (options))
+    assert '/bench' not in rw_fake_zk_runner.zkcli.nodes
+
+
+def test_bench_creates_and_deletes_without_nodes(rw_fake_zk_runner):
+    out = rw_fake_zk_runner.run(
+        'bench /bench --nodes 0 --mix create=1,delete=1 --requests 10')
+    assert out.startswith('10 requests in')
+
+
+def test_bench_read_only(fake_zk_runner):
+    with pytest.raises(izk.runner.UnauthorizedWrite):
+        fake_zk_runner.run('bench')
@@ -0,0 +1,64 @@
+import io
+import unittest.mock as mock
+
+import pytest
+from kazoo.exceptions import ConnectionLoss
+
+from izk.prompt import run_cmd
+from izk.runner import ZkCommandRunner
+from izk.script import run_script, read_commands
+from tests.fakezk import FakeZkClient
+
+
+@pytest.fixture
+def runner():
+    zkcli = FakeZkClient(latency=0.001)
+    for i in range(200):
+        zkcli.seed('/config/service-%03d' % (i), b'host-%03d' % (i))
+    return ZkCommandRunner(zkcli)
+
+
+def test_read_commands():
+    script = io.StringIO('# backup\nget /a\n\n  stat /b  \n')
+    assert list(read_commands(script)) == ['get /a', 'stat /b']
+
+
+def test_run_script_pipelines_reads(runner, capsys):
+    commands = ['get /config/service-%03d' % (i) for i in range(200)]
+    assert run_script(runner, commands, run_cmd) == 0
+    assert capsys.readouterr().out.splitlines() == ['host-%03d' % (i) for i in range(200)]
+    assert runner.zkcli.requests == 200
+    assert runner.zkcli.round_trips < 5
+
+
+def test_run_script_keeps_order_around_writes(runner, capsys):
+    runner.zkcli.read_only = False
+    commands = [
+        'get /config/service-000',
+        "set /config/service-000 'updated'",
+        'get /config/service-000',
+        'stat /config/service-000',
+        'ls /config',
+    ]
+    assert run_script(runner, commands, run_cmd) == 0
+    out = capsys.readouterr().out.splitlines()
+    assert out[:2] == ['host-000', 'updated']
+    assert 'dataVersion = 1' in out
+
+
+def test_run_script_stop_on_error(runner, capsys):
+    commands = ['get /config/service-000', 'get /nope', 'get /config/service-001']
+    assert run_script(runner, commands, run_cmd, on_error='stop') == 1
+    assert capsys.readouterr().out.splitlines() == ['host-000', '/nope does not exist']
+
+
+def test_run_script_continue_on_error(runner, capsys):
+    commands = ['get /nope', 'nope', 'get /config/service-001']
+    assert run_script(runner, commands, run_cmd, on_error='continue') == 2
+    assert capsys.readouterr().out.splitlines()[-1] == 'host-001'
+
+
+def test_run_cmd_reports_zookeeper_errors(runner, capsys):
+    with mock.patch.object(runner, 'run', side_effect=ConnectionLoss()):
+        assert run_cmd(runner, 'ls /') is False
+    assert capsys.readouterr().out == 'Error: ConnectionLoss\n'
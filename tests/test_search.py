@@ -0,0 +1,108 @@
+import re
+import time
+
+import pytest
+
+from izk.search import compare, find, grep, matching_lines, parse_size, ByteBudget
+from tests.fakezk import FakeZkClient
+
+
+@pytest.fixture
+def zkcli():
+    zkcli = FakeZkClient()
+    zkcli.seed('/app/config.json', b'x' * 2048)
+    zkcli.seed('/app/config.yaml', b'x')
+    zkcli.seed('/app/locks/lock-0001', ephemeral_owner=0x1234)
+    zkcli.seed('/app/locks/lock-0002', ephemeral_owner=0x5678)
+    zkcli.nodes['/app/config.yaml'].mtime -= 40 * 24 * 3600 * 1000
+    return zkcli
+
+
+def paths(nodes):
+    return [node.path for node in nodes]
+
+
+@pytest.mark.parametrize('value, criteria, expected', [
+    (5, '5', True), (5, '+4', True), (5, '+5', False), (5, '-6', True), (5, '-5', False),
+])
+def test_compare(value, criteria, expected):
+    assert compare(value, criteria) is expected
+
+
+@pytest.mark.parametrize('criteria, expected', [
+    ({}, ['/app', '/app/config.json', '/app/config.yaml', '/app/locks',
+          '/app/locks/lock-0001', '/app/locks/lock-0002']),
+    ({'name': 'config.*'}, ['/app/config.json', '/app/config.yaml']),
+    ({'regex': r'locks/.*2$'}, ['/app/locks/lock-0002']),
+    ({'ephemeral': True}, ['/app/locks/lock-0001', '/app/locks/lock-0002']),
+    ({'owner': '0x1234'}, ['/app/locks/lock-0001']),
+    ({'owner': str(0x5678)}, ['/app/locks/lock-0002']),
+    ({'owner': '0%d' % (0x5678)}, ['/app/locks/lock-0002']),
+    ({'mtime': '+30'}, ['/app/config.yaml']),
+    ({'mtime': '-1', 'name': 'config.*'}, ['/app/config.json']),
+    ({'size': '+1K'}, ['/app/config.json']),
+    ({'size': '1'}, ['/app/config.yaml']),
+    ({'children': '+1'}, ['/app', '/app/locks']),
+    ({'max_depth': 1, 'children': '-1'}, ['/app/config.json', '/app/config.yaml']),
+])
+def test_find(zkcli, criteria, expected):
+    assert paths(find(zkcli, '/app', **criteria)) == expected
+
+
+def test_find_streams_matches():
+    zkcli = FakeZkClient(latency=0.01)
+    zkcli.seed_deep('/test', depth=3, width=10)
+    start = time.perf_counter()
+    matches = find(zkcli, '/test', name='node-0')
+    assert next(matches).path == '/test/node-0'
+    first_match = time.perf_counter() - start
+    assert len(list(matches)) == 1 + 10 + 100 - 1
+    # the first match is yielded before the walk completes, in a few round-trips
+    assert first_match < 0.1
+    assert zkcli.round_trips < 50
+
+
+def test_matching_lines():
+    data = b'host: db-01\nport: 5432\nreplica: db-02\n\xff'
+    assert list(matching_lines(data, re.compile(b'db-0'))) == [
+        'host: db-01', 'replica: db-02']
+    assert list(matching_lines(data, re.compile(b'\xff'))) == ['\ufffd']
+    assert list(matching_lines(data, re.compile(b'nope'))) == []
+
+
+@pytest.mark.parametrize('pattern, lines', [
+    (b'', ['host: db-01', 'port: 5432']),
+    (b'a*', ['host: db-01', 'port: 5432']),
+    (b'c?$', ['port: 5432']),
+])
+def test_matching_lines_empty_match(pattern, lines):
+    for data in (b'host: db-01\nport: 5432', b'host: db-01\nport: 5432\n'):
+        assert list(matching_lines(data, re.compile(pattern))) == lines
+
+
+@pytest.fixture
+def services():
+    zkcli = FakeZkClient(latency=0.001)
+    for i in range(200):
+        zkcli.seed('/services/svc-%03d' % (i), b'name: svc\nhost: db-%02d\n' % (i % 50))
+    return zkcli
+
+
+def test_grep(services):
+    matches = list(grep(services, 'DB-07$', '/services', ignore_case=True))
+    assert matches == [
+        ('/services/svc-%03d' % (i), 'host: db-07') for i in (7, 57, 107, 157)]
+    assert services.round_trips < 50  # instead of 1 round-trip per node
+
+
+def test_grep_byte_budget(services):
+    budget = ByteBudget(max_bytes=10 * 22 + 5)
+    matches = list(grep(services, 'svc', '/services', budget=budget))
+    assert len(matches) == 10
+    assert budget.exhausted
+    assert budget.fetched == 220
+
+
+def test_parse_size():
+    assert parse_size('512') == 512
+    assert parse_size('2M') == 2 * 1024 * 1024
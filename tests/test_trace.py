@@ -0,0 +1,79 @@
+import io
+import json
+
+from izk.prompt import run_cmd
+from izk.runner import ZkCommandRunner
+from izk.trace import TracingClient, format_profile
+
+from tests.fakezk import FakeZkClient
+
+
+def traced_client():
+    zkcli = FakeZkClient()
+    zkcli.seed('/a/b', b'hello')
+    zkcli.seed('/a/c')
+    return TracingClient(zkcli)
+
+
+def test_tracing_client_counts_requests_and_bytes():
+    tracer = traced_client()
+    profile = tracer.start('ls /a')
+    assert tracer.get_children('/a') == ['b', 'c']
+    assert tracer.get('/a/b')[0] == b'hello'
+    assert tracer.exists('/missing') is None
+    tracer.stop()
+    assert len(profile) == 3
+    assert dict(profile.requests) == {'get_children': 1, 'get': 1, 'exists': 1}
+    assert profile.bytes_out == len('/a') + len('/a/b') + len('/missing')
+    assert profile.bytes_in == len('bc') + len('hello')
+    assert profile.slowest is not None
+    assert profile.elapsed >= profile.wait_time
+
+
+def test_tracing_client_transactions_and_writes():
+    tracer = traced_client()
+    profile = tracer.start()
+    tracer.create('/d', b'12')
+    tracer.set('/d', b'1234')
+    transaction = tracer.transaction()
+    transaction.delete('/d')
+    transaction.commit()
+    assert dict(profile.requests) == {'create': 1, 'set': 1, 'multi': 1}
+    assert profile.bytes_out == 2 * len('/d') + 6
+    assert '/d' not in tracer.client.nodes
+
+
+def test_tracing_client_writes_jsonl_profiles():
+    tracer = traced_client()
+    tracer.output = io.StringIO()
+    tracer.start('get /a/b')
+    tracer.get('/a/b')
+    tracer.stop()
+    record = json.loads(tracer.output.getvalue())
+    assert record['command'] == 'get /a/b'
+    assert record['requests'] == 1 and record['operations'] == {'get': 1}
+    assert record['slowest']['path'] == '/a/b'
+
+
+def test_format_profile():
+    tracer = traced_client()
+    profile = tracer.start()
+    tracer.get('/a/b')
+    tracer.stop()
+    line = format_profile(profile)
+    assert line.startswith('1 requests (get 1), 4B out, 5B in | ')
+    assert 'slowest: get /a/b' in line
+
+
+def test_timing_reports_each_command(capsys):
+    runner = ZkCommandRunner(FakeZkClient())
+    runner.zkcli.seed('/a/b')
+    assert run_cmd(runner, 'timing on')
+    assert capsys.readouterr().err == ''
+    assert run_cmd(runner, 'ls /a')
+    out, err = capsys.readouterr()
+    assert 'b' in out
+    assert err.startswith('2 requests (get_children 1, exists 1)')
+    assert run_cmd(runner, 'timing off')
+    assert run_cmd(runner, 'ls /a')
+    assert capsys.readouterr().err == ''
@@ -0,0 +1,36 @@
+from izk.usage import subtree_usage, SubtreeUsage
+from tests.fakezk import FakeZkClient
+
+
+def zkcli():
+    zkcli = FakeZkClient()
+    zkcli.seed('/app', b'12')
+    zkcli.seed('/app/big', b'x' * 100)
+    zkcli.seed('/app/big/child', b'x' * 1000)
+    zkcli.seed('/app/small', b'x')
+    zkcli.seed('/other', b'x' * 10000)
+    return zkcli
+
+
+def test_subtree_usage():
+    assert list(subtree_usage(zkcli(), '/app')) == [
+        SubtreeUsage('/app/big/child', 2, 1000, 1),
+        SubtreeUsage('/app/big', 1, 1100, 2),
+        SubtreeUsage('/app/small', 1, 1, 1),
+        SubtreeUsage('/app', 0, 1103, 4),
+    ]
+
+
+def test_subtree_usage_max_depth():
+    assert list(subtree_usage(zkcli(), '/app', max_depth=0)) == [
+        SubtreeUsage('/app', 0, 1103, 4),
+    ]
+
+
+def test_subtree_usage_is_pipelined():
+    zk = FakeZkClient(latency=0.001)
+    zk.seed_deep('/test', depth=3, width=10, data=b'xx')
+    usages = list(subtree_usage(zk, '/test', max_depth=1))
+    assert len(usages) == 11
+    assert usages[-1] == SubtreeUsage('/test', 0, 2220, 1111)
+    assert zk.round_trips < 50
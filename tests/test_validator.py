@@ -1,6 +1,7 @@
 import pytest
 
-from izk.validation import CommandValidator, UnknownCommand
+from izk.validation import (
+    CommandValidator, UnknownCommand, CommandValidationError, parse_command)
 
 
 @pytest.mark.parametrize('input_str, expected', [
@@ -25,6 +26,8 @@ from izk.validation import CommandValidator, UnknownCommand
     ('quit', True),
     ('raw', False),
     ('raw srvr', True),
+    ('raw srvr --all', True),
+    ('raw srvr --all 2', False),
     ('rmr  bad/', False),
     ('rmr /test', True),
     ('rmr /test/test2', True),
@@ -33,6 +36,15 @@ from izk.validation import CommandValidator, UnknownCommand
     ('set', False),
     ('stat  bad', False),
     ('stat /test', True),
+    ('tree /test', True),
+    ('tree /test --depth 2', True),
+    ('tree /test --max-nodes 10 --depth 2', True),
+    ('tree /test --depth', False),
+    ('tree /test --nope 2', False),
+    ('ftree /test --max-nodes 10', True),
+    ("find / --name '*.json' --size +10K --mtime -3 --ephemeral", True),
+    ('find / --owner 0x1a2b --children +100 --depth 2', True),
+    ('find / --size 10T', False),
 ])
 def test_validate_pattern(input_str, expected):
     validator = CommandValidator(input_str)
@@ -43,3 +55,26 @@ def test_validate_pattern(input_str, expected):
 def test_validate_unknown_command():
     with pytest.raises(UnknownCommand):
         CommandValidator('nope')
+
+
+def test_parse_command_typed_arguments():
+    command = parse_command('tree /test --max-nodes 10 --depth 2')
+    assert command.name == 'tree'
+    assert command.args == ['/test']
+    assert command.kwargs == {'max_nodes': 10, 'depth': 2}
+
+
+def test_parse_command_flag_and_quoted_string():
+    assert parse_command('raw mntr --all').kwargs == {'all': True}
+    assert parse_command("set /test '{\"k\": \"v v\"}'").args == [
+        '/test', "'{\"k\": \"v v\"}'"]
+
+
+@pytest.mark.parametrize('input_str', [
+    'ls/test',
+    'tree --depth 2 /test',
+    'tree /test --depth 2 --depth',
+])
+def test_parse_command_invalid(input_str):
+    with pytest.raises(CommandValidationError):
+        parse_command(input_str)
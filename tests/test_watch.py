@@ -0,0 +1,135 @@
+import threading
+
+import pytest
+
+from izk.watch import TreeWatcher, ChangeEvent, coalesce, format_event, render_events
+from tests.fakezk import FakeZkClient
+
+
+@pytest.fixture
+def zkcli():
+    zkcli = FakeZkClient()
+    zkcli.seed('/app/a/b', b'b')
+    zkcli.seed('/app/c', b'c')
+    return zkcli
+
+
+def events(watcher):
+    return [(event.type, event.path, event.detail) for event in watcher.drain()]
+
+
+def test_watch_node(zkcli):
+    watcher = TreeWatcher(zkcli, '/app')
+    watcher.start()
+    zkcli.set('/app', b'1')
+    zkcli.set('/app', b'2')
+    zkcli.create('/app/d')
+    zkcli.delete('/app/c')
+    zkcli.set('/app/a/b', b'not watched')
+    assert events(watcher) == [
+        ('changed', '/app', ''),
+        ('changed', '/app', ''),
+        ('children', '/app', '+d'),
+        ('children', '/app', '-c'),
+    ]
+
+
+def test_watch_node_deletion_and_creation(zkcli):
+    watcher = TreeWatcher(zkcli, '/app/c')
+    watcher.start()
+    zkcli.delete('/app/c')
+    zkcli.create('/app/c', b'again')
+    zkcli.set('/app/c', b'changed')
+    assert events(watcher) == [
+        ('deleted', '/app/c', ''), ('created', '/app/c', ''), ('changed', '/app/c', '')]
+
+
+def test_watch_subtree(zkcli):
+    watcher = TreeWatcher(zkcli, '/app', recursive=True)
+    watcher.start()
+    zkcli.set('/app/a/b', b'1')
+    zkcli.create('/app/a/b/new')
+    zkcli.set('/app/a/b/new', b'2')
+    zkcli.delete('/app/a/b/new')
+    zkcli.delete('/app/c')
+    assert events(watcher) == [
+        ('changed', '/app/a/b', ''),
+        ('created', '/app/a/b/new', ''),
+        ('changed', '/app/a/b/new', ''),
+        ('deleted', '/app/a/b/new', ''),
+        ('deleted', '/app/c', ''),
+    ]
+    watcher.stop()
+    zkcli.set('/app/a/b', b'3')
+    assert events(watcher) == []
+
+
+def test_watch_subtree_resynced_after_connection_loss(zkcli):
+    watcher = TreeWatcher(zkcli, '/app', recursive=True)
+    watcher.start()
+    zkcli.lose_connection()
+    zkcli.set('/app/a/b', b'1')
+    zkcli.create('/app/a/new')
+    zkcli.delete('/app/c')
+    assert events(watcher) == [('lost', '/app', 'connection lost')]
+
+    zkcli.restore_connection()
+    assert sorted(events(watcher)) == [
+        ('changed', '/app/a/b', ''),
+        ('created', '/app/a/new', ''),
+        ('deleted', '/app/c', ''),
+        ('resynced', '/app', 'connection restored, watches re-synced'),
+    ]
+    # The watches are registered again
+    zkcli.set('/app/a/new', b'2')
+    zkcli.set('/app', b'3')
+    assert events(watcher) == [('changed', '/app/a/new', ''), ('changed', '/app', '')]
+
+
+def test_watch_node_resynced_after_connection_loss(zkcli):
+    watcher = TreeWatcher(zkcli, '/app')
+    watcher.start()
+    zkcli.lose_connection()
+    zkcli.create('/app/d')
+    zkcli.restore_connection()
+    zkcli.set('/app', b'1')
+    assert events(watcher)[1:] == [
+        ('resynced', '/app', 'connection restored, watches re-synced'),
+        ('children', '/app', '+d'),
+        ('changed', '/app', ''),
+    ]
+
+
+def test_events_carry_zxid(zkcli):
+    watcher = TreeWatcher(zkcli, '/app')
+    watcher.start()
+    zkcli.set('/app', b'1')
+    event, = watcher.drain()
+    assert event.zxid == zkcli.nodes['/app'].mzxid
+
+
+def test_coalesce_and_format():
+    change = ChangeEvent(0, 'changed', '/a', 0x10, '')
+    events = [change, ChangeEvent(0, 'deleted', '/b', None, ''), change._replace(zxid=0x12)]
+    coalesced = coalesce(events)
+    assert coalesced == [(change._replace(zxid=0x12), 2), (events[1], 1)]
+    assert format_event(*coalesced[0]).endswith('changed  /a zxid=0x12 (x2)')
+
+
+def test_render_events_in_batches(zkcli):
+    watcher = TreeWatcher(zkcli, '/app')
+    watcher.start()
+    for i in range(1000):
+        zkcli.set('/app', b'%d' % (i))
+    batches = list(render_events(watcher, interval=0, max_events=1000))
+    assert len(batches) == 1
+    assert batches[0][0].endswith('(x1000)')
+
+
+def test_watch_command(zkcli, capsys):
+    from izk.runner import ZkCommandRunner
+    timer = threading.Timer(0.05, zkcli.set, args=('/app/a', b'1'))
+    timer.start()
+    ZkCommandRunner(zkcli).run('watch /app --recursive --count 1')
+    timer.join()
+    assert 'changed  /app/a zxid=' in capsys.readouterr().out
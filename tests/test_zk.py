@@ -0,0 +1,84 @@
+import socket
+import threading
+import time
+
+import pytest
+
+from izk.zk import ExtendedKazooClient, send_4lw
+
+
+class FourLetterWordServer(threading.Thread):
+    """A TCP server answering 4 letter words like a zookeeper node, after a delay"""
+
+    def __init__(self, delay=0):
+        super().__init__(daemon=True)
+        self.delay = delay
+        self.sock = socket.socket()
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(8)
+        self.port = self.sock.getsockname()[1]
+
+    def run(self):
+        while True:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.answer, args=(conn,), daemon=True).start()
+
+    def stop(self):
+        if self.sock.fileno() != -1:
+            self.sock.shutdown(socket.SHUT_RDWR)
+            self.sock.close()
+
+    def answer(self, conn):
+        with conn:
+            cmd = conn.recv(4)
+            time.sleep(self.delay)
+            conn.sendall(b'%s from %d\n' % (cmd, self.port))
+
+
+@pytest.fixture
+def servers():
+    servers = [FourLetterWordServer(delay=0.2) for _ in range(5)]
+    for server in servers:
+        server.start()
+    yield servers
+    for server in servers:
+        server.stop()
+
+
+def test_send_4lw(servers):
+    assert send_4lw('127.0.0.1', servers[0].port, b'ruok') == 'ruok from %d\n' % (
+        servers[0].port)
+
+
+def test_command_all_is_concurrent(servers):
+    hosts = ','.join('127.0.0.1:%d' % (server.port) for server in servers)
+    zkcli = ExtendedKazooClient(hosts=hosts, randomize_hosts=False)
+    start = time.monotonic()
+    results = zkcli.command_all(b'mntr')
+    assert time.monotonic() - start < 0.2 * len(servers)
+    assert list(results) == ['127.0.0.1:%d' % (server.port) for server in servers]
+    assert results['127.0.0.1:%d' % (servers[0].port)] == 'mntr from %d\n' % (
+        servers[0].port)
+
+
+def test_command_all_unreachable_host(servers):
+    servers[1].stop()
+    hosts = ','.join('127.0.0.1:%d' % (server.port) for server in servers[:2])
+    zkcli = ExtendedKazooClient(hosts=hosts, randomize_hosts=False)
+    results = zkcli.command_all(b'ruok', timeout=1)
+    assert results['127.0.0.1:%d' % (servers[1].port)].startswith('Error: ')
+
+
+@pytest.mark.parametrize('background, method', [(False, 'start'), (True, 'start_async')])
+def test_connect_in_background(monkeypatch, background, method):
+    zkcli = ExtendedKazooClient(hosts='127.0.0.1:2181')
+    zkcli.connect_in_background = background
+    calls = []
+    for name in ('start', 'start_async', 'stop'):
+        monkeypatch.setattr(zkcli, name, lambda name=name: calls.append(name))
+    with zkcli:
+        pass
+    assert calls == [method, 'stop']